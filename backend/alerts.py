@@ -1,35 +1,170 @@
 from typing import List
+from collections import deque
 from schemas import AlertRule
+from barcache import timeframe_ns
+import numpy as np
 import threading
 import time
 
+RECENT_TRIGGERS = 200
+METRICS = ("zscore", "spread")
+OPS = (">", "<")
+
+
+def validate_rule(rule: AlertRule):
+    # raises ValueError; a rule the broadcaster cannot evaluate must never be stored
+    if rule.metric not in METRICS:
+        raise ValueError(f"metric must be one of {METRICS}")
+    if rule.op not in OPS:
+        raise ValueError(f"op must be one of {OPS}")
+    if timeframe_ns(rule.timeframe) is None:
+        raise ValueError(f"bad timeframe {rule.timeframe!r} (expected e.g. 1s, 1min, 1h)")
+    if rule.roll_window < 2:
+        raise ValueError("roll_window must be >= 2")
+    if not rule.symbol_x.strip() or not rule.symbol_y.strip():
+        raise ValueError("symbol_x and symbol_y are required")
+
+
+class _ThresholdIndex:
+    """Rules sharing (pair, timeframe, roll_window, metric, op), thresholds kept in a sorted array for bisection."""
+
+    def __init__(self):
+        self.rules = {}  # id -> AlertRule
+        self._th = np.empty(0)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._dirty = False
+
+    def add(self, rule: AlertRule):
+        self.rules[rule.id] = rule
+        self._dirty = True
+
+    def remove(self, rid: int):
+        self.rules.pop(rid, None)
+        self._dirty = True
+
+    def arrays(self):
+        if self._dirty:
+            ids = np.fromiter(self.rules.keys(), dtype=np.int64, count=len(self.rules))
+            th = np.fromiter((r.threshold for r in self.rules.values()), dtype=float, count=len(self.rules))
+            order = np.argsort(th, kind="stable")
+            self._th, self._ids = th[order], ids[order]
+            self._dirty = False
+        return self._th, self._ids
+
+
 class AlertEngine:
     def __init__(self):
         self.rules = {}  # id -> AlertRule
         self._next_id = 1
+        # (x, y, timeframe, roll_window, metric) -> {">": _ThresholdIndex, "<": _ThresholdIndex}
+        self._index = {}
+        self._by_pair_metric = {}  # (x, y, metric) -> set of index keys (on-demand evaluate ignores timeframe)
+        self._prev = {}            # index key -> previous metric value (edge detection)
+        self._last_fired = {}      # rule id -> monotonic time of last trigger (cooldown)
+        self.recent = deque(maxlen=RECENT_TRIGGERS)
+        self.evaluations = 0
+        self.fired = 0
+        self.version = 0  # bumped on rule changes (cached responses that list triggered rules key on it)
+        # the live broadcaster and request handlers evaluate from different worker threads
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(rule: AlertRule):
+        return (rule.symbol_x.lower(), rule.symbol_y.lower(), rule.timeframe, rule.roll_window, rule.metric)
+
+    @staticmethod
+    def _op(rule: AlertRule):
+        return ">" if rule.op == ">" else "<"
 
     def add_rule(self, rule: AlertRule):
-        rule.id = self._next_id
-        self.rules[self._next_id] = rule
-        self._next_id += 1
-        return rule
+        validate_rule(rule)
+        with self._lock:
+            rule.id = self._next_id
+            self.rules[self._next_id] = rule
+            self._next_id += 1
+            key = self._key(rule)
+            self._index.setdefault(key, {">": _ThresholdIndex(), "<": _ThresholdIndex()})[self._op(rule)].add(rule)
+            self._by_pair_metric.setdefault((key[0], key[1], key[4]), set()).add(key)
+            self.version += 1
+            return rule
 
     def remove_rule(self, rid:int):
-        return self.rules.pop(rid, None)
+        with self._lock:
+            rule = self.rules.pop(rid, None)
+            if rule is not None:
+                key = self._key(rule)
+                self._index[key][self._op(rule)].remove(rid)
+                self._last_fired.pop(rid, None)
+                if not any(ix.rules for ix in self._index[key].values()):
+                    del self._index[key]
+                    self._prev.pop(key, None)
+                    self._by_pair_metric[(key[0], key[1], key[4])].discard(key)
+                self.version += 1
+            return rule
 
     def list_rules(self):
         return list(self.rules.values())
 
+    def watched_pairs(self):
+        """Distinct (x, y, timeframe, roll_window) that have at least one rule."""
+        with self._lock:
+            return {k[:4] for k in self._index}
+
+    @staticmethod
+    def _message(r: AlertRule, value: float):
+        return f"Rule {r.id}: {r.symbol_x}/{r.symbol_y} {r.metric} {r.op} {r.threshold} -> value={value:.4f}"
+
     # check a metric value (metric is a string) - return list of (rule, message)
     def evaluate(self, metric_name: str, value: float, context: dict):
-        triggered = []
-        for r in self.rules.values():
-            if r.metric != metric_name:
-                continue
-            op = r.op
-            th = r.threshold
-            ok = (value > th) if op == ">" else (value < th)
-            if ok:
-                msg = f"Rule {r.id}: {r.symbol_x}/{r.symbol_y} {r.metric} {op} {th} -> value={value:.4f}"
-                triggered.append((r, msg, context))
-        return triggered
+        # level check for the rules on context's pair: thresholds below value (">") / above value ("<")
+        with self._lock:
+            triggered = []
+            x, y = str(context.get("x", "")).lower(), str(context.get("y", "")).lower()
+            for key in self._by_pair_metric.get((x, y, metric_name), ()):
+                for op, ix in self._index[key].items():
+                    th, ids = ix.arrays()
+                    sl = slice(0, np.searchsorted(th, value, side="left")) if op == ">" else slice(np.searchsorted(th, value, side="right"), None)
+                    for rid in ids[sl]:
+                        r = ix.rules[int(rid)]
+                        triggered.append((r, self._message(r, value), context))
+            return triggered
+
+    def on_metrics(self, pair_key, metrics: dict, context: dict = None, now: float = None):
+        """
+        Continuous, edge-triggered evaluation for one (x, y, timeframe, roll_window) as a bar closes.
+        A ">" rule fires when the metric crosses from <= threshold to > threshold ("<" mirrored), i.e. only
+        thresholds between the previous and the new value are visited: O(log n + k). The first value seen
+        for a metric fires every rule it already satisfies. Rules inside their cooldown are skipped.
+        Returns list of (rule, message, context).
+        """
+        with self._lock:
+            now = time.monotonic() if now is None else now
+            context = context or {}
+            triggered = []
+            for metric, value in metrics.items():
+                key = tuple(pair_key) + (metric,)
+                groups = self._index.get(key)
+                if groups is None or value is None:
+                    continue
+                self.evaluations += 1
+                prev = self._prev.get(key)
+                self._prev[key] = value
+                for op, ix in groups.items():
+                    th, ids = ix.arrays()
+                    if op == ">":
+                        lo = 0 if prev is None else np.searchsorted(th, prev, side="left")
+                        hi = np.searchsorted(th, value, side="left")
+                    else:
+                        lo = np.searchsorted(th, value, side="right")
+                        hi = th.size if prev is None else np.searchsorted(th, prev, side="right")
+                    for rid in ids[lo:hi]:
+                        r = ix.rules[int(rid)]
+                        last = self._last_fired.get(r.id)
+                        if last is not None and now - last < r.cooldown:
+                            continue
+                        self._last_fired[r.id] = now
+                        msg = self._message(r, value)
+                        triggered.append((r, msg, context))
+                        self.recent.append({"id": r.id, "message": msg, "ts": context.get("ts"), "value": value})
+            self.fired += len(triggered)
+            return triggered
@@ -0,0 +1,117 @@
+# align.py - align several symbols' series onto one shared index in a single sorted-merge pass, with an explicit join policy
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+
+JOINS = ("inner", "ffill", "asof")
+
+
+def staleness_ns(value) -> Optional[int]:
+    """max_staleness as ns: None (unlimited), int ns, Timedelta or a string such as "5s" / "2min"."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, np.integer)):
+        ns = int(value)
+    else:
+        try:
+            ns = int(pd.Timedelta(value).value)
+        except ValueError:
+            raise ValueError(f"bad max_staleness {value!r} (expected e.g. 5s, 2min)") from None
+    if ns < 0:
+        raise ValueError("max_staleness must be >= 0")
+    return ns
+
+
+def _keys(index: pd.Index) -> np.ndarray:
+    # int64 sort keys (ns for datetimes, whatever their unit)
+    if isinstance(index, pd.DatetimeIndex):
+        return index.as_unit("ns").asi8
+    return np.asarray(index, dtype=np.int64)
+
+
+def _index_like(template: pd.Index, keys: np.ndarray) -> pd.Index:
+    if isinstance(template, pd.DatetimeIndex):
+        out = pd.DatetimeIndex(keys.view("M8[ns]"), name=template.name)
+        return out if template.tz is None else out.tz_localize("UTC").tz_convert(template.tz)
+    return pd.Index(keys, name=template.name)
+
+
+class Aligned:
+    """Symbols on one sorted, unique index: values[:, k] belongs to symbols[k] (NaN = no value)."""
+
+    __slots__ = ("index", "values", "symbols", "_col")
+
+    def __init__(self, index: pd.Index, values: np.ndarray, symbols):
+        self.index = index
+        self.values = values
+        self.symbols = list(symbols)
+        self._col = {s: k for k, s in enumerate(self.symbols)}
+
+    def __len__(self):
+        return len(self.index)
+
+    def column(self, symbol) -> np.ndarray:
+        return self.values[:, self._col[symbol]]
+
+    def series(self, symbol) -> pd.Series:
+        # every series shares the same index object, which the pair functions in analytics.py detect
+        return pd.Series(self.column(symbol), index=self.index, name=symbol, copy=False)
+
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.values, index=self.index, columns=self.symbols, copy=False)
+
+
+def align(series: Dict[str, pd.Series], how: str = "inner", max_staleness=None, anchor=None,
+          dropna: bool = True) -> Aligned:
+    """
+    Align sorted series into one float64 (rows x symbols) array, by binary search (searchsorted) of each
+    series' timestamps against the shared index rather than hash joins. NaN inputs count as no observation.
+    how:
+      inner - timestamps every series has
+      ffill - union of all timestamps; each series carries its last value forward for at most max_staleness
+      asof  - the timestamps of `anchor` (default: the first series); every other series contributes its last
+              value at or before each of them, at most max_staleness old
+    max_staleness: see staleness_ns (None = unlimited; 0 = exact timestamps only).
+    dropna: drop rows where any symbol still has no value (False keeps them as NaN, e.g. for pairwise use).
+    """
+    if how not in JOINS:
+        raise ValueError(f"join must be one of {JOINS}")
+    stale = staleness_ns(max_staleness)
+    symbols = list(series)
+    obs = []
+    for s in symbols:
+        sr = series[s]
+        if not sr.index.is_monotonic_increasing:
+            sr = sr.sort_index()
+        v = sr.to_numpy(dtype=np.float64, na_value=np.nan)
+        ok = ~np.isnan(v)
+        obs.append((_keys(sr.index)[ok], v[ok], sr.index))
+    if not symbols:
+        return Aligned(pd.DatetimeIndex([]), np.empty((0, 0)), symbols)
+    first = anchor if anchor is not None else symbols[0]
+    template = obs[symbols.index(first)][2]
+    if how == "inner":
+        keys = obs[0][0]
+        for ts, _, _ in obs[1:]:
+            pos = np.minimum(np.searchsorted(ts, keys), max(ts.size - 1, 0))
+            keys = keys[ts[pos] == keys] if ts.size else keys[:0]
+        stale = 0
+    elif how == "asof":
+        keys = obs[symbols.index(first)][0]
+    else:
+        keys = np.unique(np.concatenate([ts for ts, _, _ in obs]))
+    values = np.full((keys.size, len(symbols)), np.nan)
+    for k, (ts, v, _) in enumerate(obs):
+        if ts.size == 0:
+            continue
+        # last observation at or before each row
+        pos = np.searchsorted(ts, keys, side="right") - 1
+        ok = pos >= 0
+        if stale is not None:
+            ok &= keys - ts[np.maximum(pos, 0)] <= stale
+        values[ok, k] = v[pos[ok]]
+    if dropna and values.size:
+        keep = ~np.isnan(values).any(axis=1)
+        if not keep.all():
+            keys, values = keys[keep], values[keep]
+    return Aligned(_index_like(template, keys), values, symbols)
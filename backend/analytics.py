@@ -2,73 +2,207 @@ import pandas as pd
 import numpy as np
 import statsmodels.api as sm
 from statsmodels.tsa.stattools import adfuller
+from collections import deque
 from typing import Optional, Dict
+import metrics
 
+@metrics.timed("analytics_seconds")
 def resample_ticks_to_ohlcv(df_ticks: pd.DataFrame, timeframe: str):
     if df_ticks.empty:
         return pd.DataFrame()
     df_ticks = df_ticks.sort_index()
-    ohlc = df_ticks["price"].resample(timeframe).ohlc()
-    vol = df_ticks["size"].resample(timeframe).sum().rename("volume")
+    # epoch-aligned bins, like the bar cache (pandas' default start_day origin shifts bars that don't divide a day)
+    ohlc = df_ticks["price"].resample(timeframe, origin="epoch").ohlc()
+    vol = df_ticks["size"].resample(timeframe, origin="epoch").sum().rename("volume")
     res = pd.concat([ohlc, vol], axis=1).dropna()
     return res
 
+def _paired(series_a: pd.Series, series_b: pd.Series):
+    # both series on their common non-NaN rows. Series already on one index (align.py) only need the NaN
+    # mask; anything else gets the inner join
+    if series_a.index.equals(series_b.index):
+        ok = series_a.notna().to_numpy() & series_b.notna().to_numpy()
+        return (series_a, series_b) if ok.all() else (series_a[ok], series_b[ok])
+    df = pd.concat([series_a, series_b], axis=1).dropna()
+    return df.iloc[:,0], df.iloc[:,1]
+
+@metrics.timed("analytics_seconds")
 def hedge_ratio_ols(series_y: pd.Series, series_x: pd.Series):
     # regress y = beta * x + c
-    df = pd.concat([series_y, series_x], axis=1).dropna()
-    if df.shape[0] < 2:
+    y, x = _paired(series_y, series_x)
+    if y.shape[0] < 2:
         return None
-    y = df.iloc[:,0]
-    X = sm.add_constant(df.iloc[:,1])
+    X = sm.add_constant(x)
     model = sm.OLS(y, X).fit()
     beta = float(model.params.iloc[1])
     intercept = float(model.params.iloc[0])
     return {"beta": beta, "intercept": intercept, "rsq": float(model.rsquared)}
 
-def hedge_ratio_kalman(series_y: pd.Series, series_x: pd.Series, process_var: float = 1e-5, obs_var: float = 1e-3) -> Optional[Dict[str, float]]:
+def _kalman_init(shape=()):
+    # state [intercept c, beta] = [0, 1], P = I; running stats for the R^2 approximation
+    z = np.zeros(shape)
+    return {"c": z.copy(), "beta": z + 1.0, "p00": z + 1.0, "p01": z.copy(), "p10": z.copy(), "p11": z + 1.0,
+            "n": z.copy(), "ss_res": z.copy(), "mean_y": z.copy(), "m2_y": z.copy()}
+
+
+def _kalman_run(y, x, q, r, st, beta_out, c_out):
+    # closed-form 2x2 Kalman recursion for one pair; st is the 10-slot state (see _KALMAN_KEYS), updated in place.
+    # NaN observations leave the state untouched.
+    c = st[0]; b = st[1]
+    p00 = st[2]; p01 = st[3]; p10 = st[4]; p11 = st[5]
+    n = st[6]; ss_res = st[7]; mean_y = st[8]; m2_y = st[9]
+    for t in range(len(y)):
+        yt = y[t]; xt = x[t]
+        if yt == yt and xt == xt:
+            p00 += q; p11 += q
+            e = yt - (c + b * xt)
+            # P H' (gain numerators) and H P (rows of the covariance update)
+            ph0 = p00 + xt * p01; ph1 = p10 + xt * p11
+            hp0 = p00 + xt * p10; hp1 = p01 + xt * p11
+            s = hp0 + xt * hp1 + r
+            k0 = ph0 / s; k1 = ph1 / s
+            c += k0 * e; b += k1 * e
+            p00, p01, p10, p11 = p00 - k0 * hp0, p01 - k0 * hp1, p10 - k1 * hp0, p11 - k1 * hp1
+            n += 1.0
+            ss_res += e * e
+            d = yt - mean_y
+            mean_y += d / n
+            m2_y += d * (yt - mean_y)
+        beta_out[t] = b
+        c_out[t] = c
+    st[0] = c; st[1] = b
+    st[2] = p00; st[3] = p01; st[4] = p10; st[5] = p11
+    st[6] = n; st[7] = ss_res; st[8] = mean_y; st[9] = m2_y
+
+
+def _kalman_loop_numpy(y, x, q, r, st, beta_out, c_out):
+    # same recursion vectorized across pairs (used for many pairs when numba is unavailable)
+    c, b, p00, p01, p10, p11, n, ss_res, mean_y, m2_y = [row.copy() for row in st]
+    masked = bool(np.isnan(y).any() or np.isnan(x).any())
+    for t in range(y.shape[0]):
+        yt = y[t]; xt = x[t]
+        if masked:
+            ok = ~(np.isnan(yt) | np.isnan(xt))
+            yt = np.where(ok, yt, 0.0); xt = np.where(ok, xt, 0.0)
+            a00 = p00 + q * ok; a11 = p11 + q * ok
+        else:
+            a00 = p00 + q; a11 = p11 + q
+        e = yt - (c + b * xt)
+        ph0 = a00 + xt * p01; ph1 = p10 + xt * a11
+        hp0 = a00 + xt * p10; hp1 = p01 + xt * a11
+        s = hp0 + xt * hp1 + r
+        k0 = ph0 / s; k1 = ph1 / s
+        if masked:
+            k0 *= ok; k1 *= ok
+        c = c + k0 * e; b = b + k1 * e
+        p00, p01, p10, p11 = a00 - k0 * hp0, p01 - k0 * hp1, p10 - k1 * hp0, a11 - k1 * hp1
+        if masked:
+            n = n + ok
+            e = e * ok
+            d = (yt - mean_y) * ok
+            mean_y = mean_y + d / np.maximum(n, 1.0)
+        else:
+            n = n + 1.0
+            d = yt - mean_y
+            mean_y = mean_y + d / n
+        ss_res = ss_res + e * e
+        m2_y = m2_y + d * (yt - mean_y)
+        beta_out[t] = b
+        c_out[t] = c
+    st[:] = np.vstack([c, b, p00, p01, p10, p11, n, ss_res, mean_y, m2_y])
+
+
+try:  # optional: compile the recursion when numba is installed
+    from numba import njit
+
+    _kalman_run_jit = njit(cache=True)(_kalman_run)
+
+    @njit(cache=True)
+    def _kalman_run_2d_jit(y, x, q, r, st, beta_out, c_out):
+        for m in range(y.shape[1]):
+            col = st[:, m].copy()
+            _kalman_run_jit(y[:, m], x[:, m], q, r, col, beta_out[:, m], c_out[:, m])
+            st[:, m] = col
+except ImportError:
+    _kalman_run_2d_jit = None
+
+_KALMAN_NUMPY_MIN_PAIRS = 16
+_KALMAN_KEYS = ["c", "beta", "p00", "p01", "p10", "p11", "n", "ss_res", "mean_y", "m2_y"]
+
+
+@metrics.timed("analytics_seconds")
+def kalman_hedge_path(y, x, process_var: float = 1e-5, obs_var: float = 1e-3, state: Optional[dict] = None) -> dict:
+    """
+    Kalman filter for y_t = beta_t * x_t + c_t + noise over aligned arrays.
+    y, x: 1-D arrays (one pair) or 2-D (T, M) arrays with one pair per column.
+    state: value of a previous result's "state" to resume from (incremental updates); None starts fresh.
+    Returns {"beta", "intercept"} paths shaped like y, "rsq" per pair and the resumable "state".
+    """
+    y = np.asarray(y, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    one = y.ndim == 1
+    Y = y.reshape(-1, 1) if one else y
+    X = x.reshape(-1, 1) if one else x
+    M = Y.shape[1]
+    st = state if state is not None else _kalman_init(() if one else (M,))
+    st_arr = np.vstack([np.broadcast_to(np.asarray(st[k], dtype=np.float64), (M,)) for k in _KALMAN_KEYS])
+    Y = np.ascontiguousarray(Y)
+    X = np.ascontiguousarray(X)
+    beta_out = np.empty_like(Y)
+    c_out = np.empty_like(Y)
+    if _kalman_run_2d_jit is not None:
+        # column-major so each pair's series is contiguous for the compiled loop
+        beta_f = np.empty_like(Y, order="F")
+        c_f = np.empty_like(Y, order="F")
+        _kalman_run_2d_jit(np.asfortranarray(Y), np.asfortranarray(X), float(process_var), float(obs_var), st_arr, beta_f, c_f)
+        beta_out[:] = beta_f
+        c_out[:] = c_f
+    elif M < _KALMAN_NUMPY_MIN_PAIRS:
+        # plain-float loop per pair beats per-step numpy calls on few pairs
+        for m in range(M):
+            st1 = st_arr[:, m].tolist()
+            b_list = [0.0] * Y.shape[0]
+            c_list = [0.0] * Y.shape[0]
+            _kalman_run(Y[:, m].tolist(), X[:, m].tolist(), float(process_var), float(obs_var), st1, b_list, c_list)
+            st_arr[:, m] = st1
+            beta_out[:, m] = b_list
+            c_out[:, m] = c_list
+    else:
+        _kalman_loop_numpy(Y, X, float(process_var), float(obs_var), st_arr, beta_out, c_out)
+    new_state = {k: (float(st_arr[i, 0]) if one else st_arr[i].copy()) for i, k in enumerate(_KALMAN_KEYS)}
+    ss_tot = st_arr[9]
+    rsq = np.where(ss_tot > 0, 1.0 - st_arr[7] / np.where(ss_tot > 0, ss_tot, 1.0), 0.0)
+    if one:
+        return {"beta": beta_out[:, 0], "intercept": c_out[:, 0], "rsq": float(rsq[0]), "state": new_state}
+    return {"beta": beta_out, "intercept": c_out, "rsq": rsq, "state": new_state}
+
+
+@metrics.timed("analytics_seconds")
+def hedge_ratio_kalman(series_y: pd.Series, series_x: pd.Series, process_var: float = 1e-5, obs_var: float = 1e-3, path: bool = False) -> Optional[Dict[str, float]]:
     """
     Simple Kalman Filter to estimate time-varying beta and intercept in model: y_t = beta_t * x_t + c_t + noise
-    Returns the last (beta, intercept) and rolling R^2 approximation.
+    Returns the last (beta, intercept) and rolling R^2 approximation; with path=True also "path", a DataFrame
+    of beta/intercept per aligned bar.
     """
-    df = pd.concat([series_y, series_x], axis=1).dropna()
-    if df.shape[0] < 2:
+    y, x = _paired(series_y, series_x)
+    if y.shape[0] < 2:
         return None
-    y = df.iloc[:,0].values.astype(float)
-    x = df.iloc[:,1].values.astype(float)
-    # State: [intercept, beta]
-    state = np.array([0.0, 1.0])
-    P = np.eye(2)
-    Q = np.eye(2) * process_var
-    R = obs_var
-    y_hat_all = []
-    for t in range(len(y)):
-        # Predict
-        state = state  # no state transition dynamics beyond identity
-        P = P + Q
-        # Observation
-        H = np.array([1.0, x[t]])  # maps [c, beta] to y
-        y_pred = H @ state
-        S = H @ P @ H.T + R
-        K = (P @ H.T) / S
-        residual = y[t] - y_pred
-        state = state + K * residual
-        P = (np.eye(2) - np.outer(K, H)) @ P
-        y_hat_all.append(y_pred)
-    # Approximate R^2 using last predictions
-    y_hat_all = np.array(y_hat_all)
-    ss_res = float(np.sum((y - y_hat_all) ** 2))
-    ss_tot = float(np.sum((y - np.mean(y)) ** 2))
-    rsq = 1.0 - ss_res / ss_tot if ss_tot > 0 else 0.0
-    return {"beta": float(state[1]), "intercept": float(state[0]), "rsq": float(rsq)}
+    res = kalman_hedge_path(y.values, x.values, process_var, obs_var)
+    out = {"beta": float(res["beta"][-1]), "intercept": float(res["intercept"][-1]), "rsq": res["rsq"]}
+    if path:
+        out["path"] = pd.DataFrame({"beta": res["beta"], "intercept": res["intercept"]}, index=y.index)
+    return out
 
+@metrics.timed("analytics_seconds")
 def compute_spread(series_y: pd.Series, series_x: pd.Series, beta: float, intercept: float=0.0):
-    df = pd.concat([series_y, series_x], axis=1).dropna()
-    if df.empty:
+    y, x = _paired(series_y, series_x)
+    if y.empty:
         return pd.Series(dtype=float)
-    spread = df.iloc[:,0] - (beta * df.iloc[:,1] + intercept)
+    spread = y - (beta * x + intercept)
     spread.name = "spread"
     return spread
 
+@metrics.timed("analytics_seconds")
 def rolling_zscore(series: pd.Series, window: int=60):
     if series.empty:
         return pd.Series(dtype=float)
@@ -78,6 +212,7 @@ def rolling_zscore(series: pd.Series, window: int=60):
     z.name = "zscore"
     return z
 
+@metrics.timed("analytics_seconds")
 def adf_test(series: pd.Series):
     series = series.dropna()
     if series.shape[0] < 10:
@@ -85,12 +220,126 @@ def adf_test(series: pd.Series):
     res = adfuller(series)
     return {"stat": float(res[0]), "pvalue": float(res[1]), "nobs": int(res[3])}
 
+@metrics.timed("analytics_seconds")
+def half_life(spread: pd.Series) -> Optional[float]:
+    """Mean-reversion half-life in bars from the AR(1) fit ds_t = lam * s_(t-1) + c; None unless lam < 0."""
+    s = spread.dropna().to_numpy(dtype=np.float64)
+    if s.size < 3:
+        return None
+    lag = s[:-1] - s[:-1].mean()
+    d = np.diff(s)
+    var = float(lag @ lag)
+    if var == 0.0:
+        return None
+    lam = float(lag @ (d - d.mean())) / var
+    return float(-np.log(2.0) / lam) if lam < 0 else None
+
+@metrics.timed("analytics_seconds")
 def rolling_correlation(series_a: pd.Series, series_b: pd.Series, window: int=60):
-    df = pd.concat([series_a, series_b], axis=1).dropna()
-    if df.empty:
+    a, b = _paired(series_a, series_b)
+    if a.empty:
         return pd.Series(dtype=float)
-    return df.iloc[:,0].rolling(window).corr(df.iloc[:,1])
+    return a.rolling(window).corr(b)
+
+def _next_true(mask: np.ndarray) -> np.ndarray:
+    # out[i] = first j >= i with mask[j] (len(mask) if none); one extra slot so out[len(mask)] is valid
+    n = mask.size
+    idx = np.where(mask, np.arange(n), n)
+    return np.append(np.minimum.accumulate(idx[::-1])[::-1], n)
+
+
+def _scan_set(z, entry, exit, opens, closes, sides):
+    # the state machine bar by bar for one (entry, exit) set; fills the output buffers, returns the trade count
+    n = z.shape[0]
+    k = 0
+    pos = 0
+    for t in range(n):
+        if pos == 0:
+            if z[t] > entry:
+                pos = -1
+            elif z[t] < -entry:
+                pos = 1
+            else:
+                continue
+            opens[k] = t
+            sides[k] = pos
+        elif (pos < 0 and z[t] < exit) or (pos > 0 and z[t] > -exit):
+            closes[k] = t
+            k += 1
+            pos = 0
+    if pos != 0:
+        closes[k] = n
+        k += 1
+    return k
+
+
+try:  # optional: with numba the per-set bar loop beats the vectorized scan below
+    from numba import njit
+
+    _scan_set_jit = njit(cache=True)(_scan_set)
+except ImportError:
+    _scan_set_jit = None
+
+
+def _scan_trades_loop(z: np.ndarray, entries, exits, kernel=_scan_set_jit):
+    # same result as _scan_trades, one kernel call per set
+    n = z.size
+    bufs = [np.empty(n // 2 + 1, dtype=np.int64) for _ in range(3)]
+    parts = []
+    for a, e in enumerate(entries):
+        for b, x in enumerate(exits):
+            k = kernel(z, float(e), float(x), *bufs)
+            parts.append((np.full(k, a * len(exits) + b), *(buf[:k].copy() for buf in bufs)))
+    if not parts:
+        return (np.empty(0, dtype=np.int64),) * 4
+    return tuple(np.concatenate(c) for c in zip(*parts))
+
+
+def _scan_trades(z: np.ndarray, entries, exits):
+    """
+    Mean-reversion state machine for every (entry, exit) threshold pair at once: from flat, enter at the next
+    bar signalling an entry (short when z > entry wins a tie), exit at the first exit signal after the entry
+    bar, stay flat on the exit bar. Each step advances all parameter sets by one trade through next-signal
+    index lookups, so the loop runs max(trades) times rather than once per bar (with numba installed the
+    compiled per-set loop, _scan_trades_loop, is used instead).
+    Returns (set, open idx, close idx (len(z) = still open), side) in time order per set;
+    set = entry position * len(exits) + exit position.
+    """
+    if _scan_set_jit is not None:
+        return _scan_trades_loop(z, entries, exits)
+    n = z.size
+    # flat lookup tables, one row per threshold; exits are searched from the bar after entry (<= n), so
+    # their rows get one more sentinel slot. Finished sets sit at i = n, which maps to n everywhere
+    short_in = np.concatenate([_next_true(z > e) for e in entries])
+    long_in = np.concatenate([_next_true(z < -e) for e in entries])
+    short_out = np.concatenate([np.append(_next_true(z < x), n) for x in exits])
+    long_out = np.concatenate([np.append(_next_true(z > -x), n) for x in exits])
+    sets = np.arange(len(entries) * len(exits))
+    in_row = sets // len(exits) * (n + 1)
+    out_row = sets % len(exits) * (n + 2) + 1
+    i = np.zeros(sets.size, dtype=np.int64)
+    opens, closes, shorts = [], [], []
+    while True:
+        s, l = short_in[in_row + i], long_in[in_row + i]
+        e = np.minimum(s, l)
+        if e.min() >= n:
+            break
+        short = s <= l
+        x = np.where(short, short_out[out_row + e], long_out[out_row + e])
+        opens.append(e)
+        closes.append(x)
+        shorts.append(short)
+        i = np.minimum(x + 1, n)
+    if not opens:
+        return (np.empty(0, dtype=np.int64),) * 4
+    opens = np.stack(opens, axis=1)  # (sets, steps); n where a set had already finished
+    live = opens < n
+    set_id = np.broadcast_to(sets[:, None], opens.shape)[live]
+    sides = np.where(np.stack(shorts, axis=1)[live], -1, 1)
+    return set_id, opens[live], np.stack(closes, axis=1)[live], sides
 
+
+@metrics.timed("analytics_seconds")
 def backtest_mean_reversion(z: pd.Series, entry: float = 2.0, exit: float = 0.0):
     """
     Mini mean-reversion backtest: enter short spread when z > entry, exit when z < exit; 
@@ -99,38 +348,361 @@ def backtest_mean_reversion(z: pd.Series, entry: float = 2.0, exit: float = 0.0)
     z = z.dropna()
     if z.empty:
         return {"trades": [], "equity": {}}
-    position = 0  # -1 short spread, +1 long spread
-    equity = 0.0
-    equity_curve = []
-    last_price = 0.0
-    entry_z = None
-    trades = []
+    v = z.to_numpy(dtype=np.float64)
+    _, opens, closes, sides = _scan_trades(v, [entry], [exit])
     # Use spread proxy as z; PnL by z normalization is illustrative only
-    for ts, zval in z.items():
-        if position == 0:
-            if zval > entry:
-                position = -1
-                entry_z = zval
-                trades.append({"ts": str(ts), "side": "SHORT", "z": float(zval)})
-            elif zval < -entry:
-                position = 1
-                entry_z = zval
-                trades.append({"ts": str(ts), "side": "LONG", "z": float(zval)})
-        else:
-            # exit rules
-            if (position == -1 and zval < exit) or (position == 1 and zval > -exit):
-                pnl = (entry_z - zval) if position == -1 else (zval - entry_z)
-                equity += pnl
-                trades.append({"ts": str(ts), "side": "FLAT", "z": float(zval), "pnl": float(pnl), "equity": float(equity)})
-                position = 0
-                entry_z = None
-        equity_curve.append((str(ts), float(equity)))
-    equity_dict = {ts: val for ts, val in equity_curve}
-    return {"trades": trades, "equity": equity_dict}
+    done = closes < v.size
+    pnl = sides[done] * (v[closes[done]] - v[opens[done]])
+    equity = np.cumsum(pnl)
+    labels = z.index.astype(str)
+    trades = []
+    for k in range(opens.size):
+        o = opens[k]
+        trades.append({"ts": labels[o], "side": "SHORT" if sides[k] < 0 else "LONG", "z": float(v[o])})
+        if done[k]:
+            c = closes[k]
+            trades.append({"ts": labels[c], "side": "FLAT", "z": float(v[c]), "pnl": float(pnl[k]), "equity": float(equity[k])})
+    # realized equity after every bar
+    curve = np.concatenate(([0.0], equity))[np.searchsorted(closes[done], np.arange(v.size), side="right")]
+    return {"trades": trades, "equity": dict(zip(labels, curve.tolist()))}
+
+
+def _sweep_stats(v: np.ndarray, n_sets: int, trades, periods_per_year=None, equity: bool = False,
+                 block: int = 4_000_000) -> dict:
+    # per-set summary. The position is marked to market bar by bar on v: Sharpe and exposure come from
+    # per-trade sums, drawdown from (sets x bars) equity matrices built in chunks of ~`block` cells
+    sets, opens, closes, sides = trades
+    n = v.size
+    done = closes < n
+    last = np.minimum(closes, n - 1)
+    move = sides * (v[last] - v[opens])  # mark-to-market PnL of each trade (to the last bar if still open)
+    dv2 = np.concatenate(([0.0], np.cumsum(np.diff(v) ** 2)))
+    held = last - opens
+    step_sum = np.bincount(sets, weights=move, minlength=n_sets)
+    step_sq = np.bincount(sets, weights=dv2[last] - dv2[opens], minlength=n_sets)
+    out = {
+        "pnl": np.bincount(sets[done], weights=move[done], minlength=n_sets),
+        "trades": np.bincount(sets[done], minlength=n_sets),
+        "wins": np.bincount(sets[done], weights=move[done] > 0, minlength=n_sets),
+        "exposure": np.bincount(sets, weights=held, minlength=n_sets) / n,
+        "max_drawdown": np.zeros(n_sets),
+    }
+    # per-bar increments (0 on the first bar and while flat): mean/std over all n bars
+    mean = step_sum / n
+    var = (step_sq - n * mean ** 2) / (n - 1) if n > 1 else np.zeros(n_sets)
+    sd = np.sqrt(np.maximum(var, 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["sharpe"] = np.where(sd > 1e-12, mean / sd, np.nan)
+    if periods_per_year:
+        out["sharpe"] *= np.sqrt(periods_per_year)
+    if equity:
+        out["equity"] = np.empty((n_sets, n))
+    dv = np.diff(v)
+    chunk = max(1, block // max(n, 1))
+    for lo in range(0, n_sets, chunk):
+        hi = min(lo + chunk, n_sets)
+        sel = (sets >= lo) & (sets < hi)
+        # opens and closes of one set never share a bar, so plain assignment builds the position changes
+        delta = np.zeros((hi - lo, n + 1), dtype=np.int8)
+        delta[sets[sel] - lo, opens[sel]] = sides[sel]
+        delta[sets[sel] - lo, closes[sel]] = -sides[sel]
+        pos = np.cumsum(delta[:, :n - 1], axis=1, dtype=np.int8)
+        mtm = np.zeros((hi - lo, n))
+        np.cumsum(pos * dv, axis=1, out=mtm[:, 1:])
+        out["max_drawdown"][lo:hi] = (np.maximum.accumulate(mtm, axis=1) - mtm).max(axis=1)
+        if equity:
+            out["equity"][lo:hi] = mtm
+    return out
+
+
+@metrics.timed("analytics_seconds")
+def backtest_sweep(spread: pd.Series, windows=(60,), entries=(2.0,), exits=(0.0,), pnl_on: str = "z",
+                   periods_per_year: Optional[float] = None, equity: bool = False) -> dict:
+    """
+    Mean-reversion backtest (same rules as backtest_mean_reversion) for every (window, entry, exit) in one
+    call: one rolling z-score per window, one vectorized trade scan per window for all thresholds.
+    pnl_on = "z" (z-score units, like backtest_mean_reversion) or "spread". Returns {"results": [per set:
+    window, entry, exit, pnl, trades, win_rate, sharpe, max_drawdown, exposure]} plus, with equity=True,
+    "ts" (epoch ms) and each set's mark-to-market "equity" array aligned to ts (NaN until the window fills).
+    """
+    spread = spread.dropna()
+    entries, exits = [float(e) for e in entries], [float(x) for x in exits]
+    out = {"results": []}
+    if equity:
+        out["ts"] = spread.index.asi8 // 1_000_000
+    for w in windows:
+        z = rolling_zscore(spread, window=int(w))
+        ok = z.notna().to_numpy()
+        zv = z.to_numpy(dtype=np.float64)[ok]
+        if zv.size == 0:
+            continue
+        v = zv if pnl_on == "z" else spread.to_numpy(dtype=np.float64)[ok]
+        n_sets = len(entries) * len(exits)
+        st = _sweep_stats(v, n_sets, _scan_trades(zv, entries, exits), periods_per_year, equity)
+        for k in range(n_sets):
+            trades = int(st["trades"][k])
+            row = {"window": int(w), "entry": entries[k // len(exits)], "exit": exits[k % len(exits)],
+                   "pnl": float(st["pnl"][k]), "trades": trades,
+                   "win_rate": float(st["wins"][k] / trades) if trades else None,
+                   "sharpe": None if np.isnan(st["sharpe"][k]) else float(st["sharpe"][k]),
+                   "max_drawdown": float(st["max_drawdown"][k]), "exposure": float(st["exposure"][k])}
+            if equity:
+                curve = np.full(ok.size, np.nan)
+                curve[ok] = st["equity"][k]
+                row["equity"] = curve
+            out["results"].append(row)
+    return out
 
+
+@metrics.timed("analytics_seconds")
+def backtest_sweep_pairs(spreads: Dict[str, pd.Series], executor=None, **kwargs) -> Dict[str, dict]:
+    """backtest_sweep for many spreads; with a (process pool) executor the pairs run in parallel."""
+    names = list(spreads)
+    if executor is None or len(names) < 2:
+        return {k: backtest_sweep(spreads[k], **kwargs) for k in names}
+    futures = [executor.submit(backtest_sweep, spreads[k], **kwargs) for k in names]
+    return {k: f.result() for k, f in zip(names, futures)}
+
+@metrics.timed("analytics_seconds")
 def correlation_matrix(symbol_to_close: Dict[str, pd.Series]):
     df = pd.DataFrame(symbol_to_close)
     df = df.dropna(how="any")
     if df.empty:
         return pd.DataFrame()
     return df.corr()
+
+
+class PairState:
+    """
+    Streaming pair metrics updated in O(1) per aligned bar (x, y closes).
+    - Hedge ratio: recursive least squares of y on x (+ intercept) kept as weighted running means and
+      co-moments; with forgetting=1.0 this is exactly the full-sample OLS of hedge_ratio_ols.
+    - Rolling window: Welford add/remove of the last `window` (x, y) pairs. Spread mean/std for the current
+      beta follow in closed form from those moments, so zscore()/corr() match the last value of
+      rolling_zscore(compute_spread(...)) and rolling_correlation(...).
+    """
+
+    RESYNC_EVERY = 100_000  # recompute window moments from scratch this often to shed float drift
+
+    def __init__(self, window: int = 60, forgetting: float = 1.0):
+        self.window = int(window)
+        self.forgetting = float(forgetting)
+        self.last_ts = None
+        self.n = 0
+        # RLS / full-sample (exponentially weighted if forgetting < 1) moments
+        self._w = 0.0
+        self._mx = self._my = 0.0
+        self._sxx = self._syy = self._sxy = 0.0
+        # window moments
+        self._win = deque()
+        self._wmx = self._wmy = 0.0
+        self._wxx = self._wyy = self._wxy = 0.0
+        self._since_resync = 0
+        self._last_x = self._last_y = None
+
+    def update(self, x: float, y: float, ts=None):
+        x = float(x); y = float(y)
+        if not (np.isfinite(x) and np.isfinite(y)):
+            return
+        self.n += 1
+        self._last_x, self._last_y = x, y
+        if ts is not None:
+            self.last_ts = ts
+        # weighted Welford step (forgetting decays the previous weight)
+        lam = self.forgetting
+        if lam != 1.0:
+            self._w *= lam
+            self._sxx *= lam; self._syy *= lam; self._sxy *= lam
+        self._w += 1.0
+        dx = x - self._mx
+        dy = y - self._my
+        self._mx += dx / self._w
+        self._my += dy / self._w
+        self._sxx += dx * (x - self._mx)
+        self._syy += dy * (y - self._my)
+        self._sxy += dx * (y - self._my)
+        # window: add newest, drop oldest
+        self._win.append((x, y))
+        self._win_add(x, y)
+        if len(self._win) > self.window:
+            ox, oy = self._win.popleft()
+            self._win_remove(ox, oy)
+        self._since_resync += 1
+        if self._since_resync >= self.RESYNC_EVERY:
+            self._resync()
+
+    @metrics.timed("analytics_seconds")
+    def update_many(self, xs, ys, index=None):
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        for i in range(xs.shape[0]):
+            self.update(xs[i], ys[i], index[i] if index is not None else None)
+
+    def _win_add(self, x, y):
+        k = len(self._win)
+        dx = x - self._wmx
+        dy = y - self._wmy
+        self._wmx += dx / k
+        self._wmy += dy / k
+        self._wxx += dx * (x - self._wmx)
+        self._wyy += dy * (y - self._wmy)
+        self._wxy += dx * (y - self._wmy)
+
+    def _win_remove(self, x, y):
+        k = len(self._win)  # count after removal
+        if k == 0:
+            self._wmx = self._wmy = self._wxx = self._wyy = self._wxy = 0.0
+            return
+        dx = x - self._wmx
+        dy = y - self._wmy
+        self._wmx -= dx / k
+        self._wmy -= dy / k
+        self._wxx -= dx * (x - self._wmx)
+        self._wyy -= dy * (y - self._wmy)
+        self._wxy -= dx * (y - self._wmy)
+
+    def _resync(self):
+        self._since_resync = 0
+        if not self._win:
+            return
+        a = np.asarray(self._win, dtype=float)
+        self._wmx, self._wmy = float(a[:, 0].mean()), float(a[:, 1].mean())
+        cx, cy = a[:, 0] - self._wmx, a[:, 1] - self._wmy
+        self._wxx, self._wyy, self._wxy = float(cx @ cx), float(cy @ cy), float(cx @ cy)
+
+    def hedge(self) -> Optional[Dict[str, float]]:
+        if self.n < 2 or self._sxx <= 0:
+            return None
+        beta = self._sxy / self._sxx
+        intercept = self._my - beta * self._mx
+        rsq = (self._sxy * self._sxy) / (self._sxx * self._syy) if self._syy > 0 else 0.0
+        return {"beta": float(beta), "intercept": float(intercept), "rsq": float(rsq)}
+
+    def spread(self, hedge: Optional[Dict[str, float]] = None) -> Optional[float]:
+        hedge = hedge or self.hedge()
+        if hedge is None:
+            return None
+        return self._last_y - (hedge["beta"] * self._last_x + hedge["intercept"])
+
+    def zscore(self, hedge: Optional[Dict[str, float]] = None) -> Optional[float]:
+        """Z-score of the latest spread against the spread's rolling window mean/std (ddof=1)."""
+        hedge = hedge or self.hedge()
+        k = len(self._win)
+        if hedge is None or k < self.window or k < 2:
+            return None
+        b = hedge["beta"]
+        # spread s = y - b*x - c  ->  window mean/var from x,y moments
+        mean = self._wmy - b * self._wmx - hedge["intercept"]
+        m2 = self._wyy + b * b * self._wxx - 2.0 * b * self._wxy
+        if m2 <= 0:
+            return None
+        std = np.sqrt(m2 / (k - 1))
+        return float((self.spread(hedge) - mean) / std)
+
+    def corr(self) -> Optional[float]:
+        if len(self._win) < self.window or self._wxx <= 0 or self._wyy <= 0:
+            return None
+        return float(self._wxy / np.sqrt(self._wxx * self._wyy))
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        hedge = self.hedge()
+        return {
+            "hedge": hedge,
+            "spread": self.spread(hedge),
+            "zscore": self.zscore(hedge),
+            "corr": self.corr(),
+            "n": self.n,
+        }
+
+
+class CorrelationEngine:
+    """
+    Incremental N x N correlation over aligned bars (one value per symbol per bar, NaN = missing).
+    Keeps pairwise-complete sufficient statistics - for every (i, j): count of bars where both are present,
+    sum of x_i, sum of x_i^2 and sum of x_i * x_j over those bars - updated with one BLAS product per block of
+    new bars and downdated as bars leave the rolling window (window=None keeps the full history).
+    With returns=True the inputs are closes and each symbol's log-return since its previous observed close is
+    used. matrix() is O(N^2) and matches pandas DataFrame.corr() (pairwise-complete) over the same rows.
+    """
+
+    def __init__(self, symbols, window: Optional[int] = None, returns: bool = True):
+        self.symbols = list(symbols)
+        self.window = window
+        self.returns = returns
+        self.last_ts = None
+        n = len(self.symbols)
+        self._shift = np.full(n, np.nan)       # per-symbol offset (first value) to keep level sums well conditioned
+        self._last_close = np.full(n, np.nan)  # returns mode: previous observed close
+        self._hist = np.empty((0, n))          # rolling mode: transformed rows still inside the window
+        self._removed = 0
+        self._reset_sums()
+
+    def _reset_sums(self):
+        n = len(self.symbols)
+        self._cnt = np.zeros((n, n))
+        self._sx = np.zeros((n, n))    # sum of x_i over rows where j is present
+        self._sxx = np.zeros((n, n))   # sum of x_i^2 over rows where j is present
+        self._sxy = np.zeros((n, n))   # sum of x_i * x_j
+
+    def _transform(self, block: np.ndarray) -> np.ndarray:
+        if self.returns:
+            # previous observed close per symbol (carried across gaps and across update calls)
+            filled = pd.DataFrame(np.vstack([self._last_close, block])).ffill().to_numpy()
+            self._last_close = filled[-1].copy()
+            return np.log(block) - np.log(filled[:-1])
+        fresh = np.isnan(self._shift)
+        if fresh.any():
+            first = pd.DataFrame(block).bfill().iloc[0].to_numpy() if block.shape[0] else self._shift
+            self._shift[fresh] = first[fresh]
+        return block - self._shift
+
+    def _accumulate(self, rows: np.ndarray, sign: float):
+        mask = ~np.isnan(rows)
+        x0 = np.where(mask, rows, 0.0)
+        m = mask.astype(float)
+        self._cnt += sign * (m.T @ m)
+        self._sx += sign * (x0.T @ m)
+        self._sxx += sign * ((x0 * x0).T @ m)
+        self._sxy += sign * (x0.T @ x0)
+
+    @metrics.timed("analytics_seconds")
+    def update(self, block, ts=None):
+        """Add aligned bars (rows x symbols, NaN where a symbol has no bar); ts = timestamp of the last row."""
+        block = np.atleast_2d(np.asarray(block, dtype=np.float64))
+        if block.shape[0] == 0:
+            return
+        rows = self._transform(block)
+        if ts is not None:
+            self.last_ts = ts
+        self._accumulate(rows, 1.0)
+        if self.window is None:
+            return
+        hist = np.concatenate([self._hist, rows])
+        excess = hist.shape[0] - self.window
+        if excess > 0:
+            self._accumulate(hist[:excess], -1.0)
+            hist = hist[excess:]
+            self._removed += excess
+        self._hist = hist
+        if self._removed >= self.window:
+            # rebuild from the window to shed add/subtract rounding drift (amortized O(N^2) per bar)
+            self._reset_sums()
+            self._accumulate(self._hist, 1.0)
+            self._removed = 0
+
+    def observations(self) -> np.ndarray:
+        """Number of bars observed per symbol (inside the window)."""
+        return np.diag(self._cnt).copy()
+
+    @metrics.timed("analytics_seconds")
+    def matrix(self) -> np.ndarray:
+        n = self._cnt
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = self._sxy - self._sx * self._sx.T / n
+            var = self._sxx - self._sx * self._sx / n
+            corr = cov / np.sqrt(var * var.T)
+        corr[(n < 2) | ~(var > 0) | ~(var.T > 0)] = np.nan
+        corr = np.clip(corr, -1.0, 1.0)
+        d = np.arange(corr.shape[0])
+        corr[d, d] = np.where(np.isnan(corr[d, d]), np.nan, 1.0)
+        return corr
@@ -1,31 +1,233 @@
-from fastapi import FastAPI, WebSocket, UploadFile, File, BackgroundTasks, Form
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, BackgroundTasks, Form, Header, Query
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-import io, csv
 import pandas as pd
+import numpy as np
 import json
-from storage import TickStorage
+from storage import TickStorage, EXPORT_BLOCK_ROWS
+from align import Aligned, align, staleness_ns, JOINS
+from barcache import BAR_COLUMNS, timeframe_ns
+from tickbuffer import to_ns
+import encoding
+import export
+import metrics
+from downsample import downsample_series, downsample_bars, METHODS as DOWNSAMPLE_METHODS
 from ingestion import Ingestor
-from analytics import resample_ticks_to_ohlcv, hedge_ratio_ols, hedge_ratio_kalman, compute_spread, rolling_zscore, adf_test, rolling_correlation, backtest_mean_reversion, correlation_matrix
+from analytics import resample_ticks_to_ohlcv, hedge_ratio_ols, hedge_ratio_kalman, compute_spread, rolling_zscore, adf_test, rolling_correlation, backtest_mean_reversion, backtest_sweep, PairState, CorrelationEngine
 from alerts import AlertEngine
-from schemas import Tick, IngestMode, AlertRule
-from typing import List
+from live import LiveBroadcaster, LiveClient
+from workers import WorkerPool, ProcessPool
+from scanner import Scanner
+from memo import ResultCache
+from schemas import Tick, IngestMode, AlertRule, ScanRequest
+from typing import List, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 import asyncio
+import functools
+import logging
+import os
+import threading
 import time
 
-app = FastAPI()
+log = logging.getLogger(__name__)
+
+storage = TickStorage(db_file="backend_ticks.db")
+ingestor = Ingestor(storage)
+alerts = AlertEngine()
+# CPU-heavy request work (bars, OLS/Kalman, ADF, backtests, encoding) runs here, never on the event loop
+analytics_pool = WorkerPool()
+# multi-pair batch work (backtest sweeps, cointegration scans) fans out over processes
+process_pool = ProcessPool()
+scanner = Scanner()
+# memoized analytics keyed by request inputs + each symbol's data version (storage.data_version, or
+# storage.closed_version for results over closed bars only)
+results = ResultCache()
+
+# streaming pair metrics keyed by (x, y, timeframe, roll_window, min_volume, join, stale), fed with closed aligned
+# bars, LRU-bounded (keys come from request parameters); each kept with what it was built from (see
+# _advance_pair_state). Request handlers and the live broadcaster advance them from pool threads, one at a time
+pair_states = OrderedDict()
+MAX_PAIR_STATES = 256
+state_lock = threading.RLock()
+
+def history_versions(syms, timeframe: str) -> tuple:
+    # storage.history_version per symbol; read before the bars so a concurrent rewrite can only cause a spare rebuild
+    return tuple(storage.history_version(s, timeframe) for s in syms)
+
+def advance_pair_state(x: str, y: str, timeframe: str, roll_window: int, min_volume: float, series_x: pd.Series, series_y: pd.Series,
+                       join: str = "inner", stale: Optional[int] = None, open_from: Optional[pd.Timestamp] = None,
+                       versions: Optional[tuple] = None) -> PairState:
+    # open_from: start of the oldest bar that may still be open (default: the older of the two series' last bars);
+    # only aligned rows strictly before it are consumed. versions: history_versions((x, y), timeframe) taken
+    # before the series were read
+    with state_lock:
+        if versions is None:
+            versions = history_versions((x, y), timeframe)
+        return _advance_pair_state(x, y, timeframe, roll_window, min_volume, series_x, series_y, join, stale,
+                                   open_from, versions)
+
+def open_bar_start(*frames) -> Optional[pd.Timestamp]:
+    # each symbol's newest bar may still be open: everything from the oldest of them on can still change
+    # (join=ffill/asof carries a lagging symbol's open bar into later rows)
+    lasts = [f.index[-1] for f in frames if f is not None and len(f)]
+    return min(lasts) if lasts else None
+
+def open_bars_from(x: str, y: str, timeframe: str) -> Optional[pd.Timestamp]:
+    # start of the older of the pair's open bars (storage.open_bar_ts): the first row ticks may still change;
+    # None when every bar is closed (e.g. uploaded bars)
+    opens = [t for t in (storage.open_bar_ts(x, timeframe), storage.open_bar_ts(y, timeframe)) if t is not None]
+    return pd.Timestamp(min(opens)) if opens else None
+
+def _advance_pair_state(x, y, timeframe, roll_window, min_volume, series_x, series_y, join, stale, open_from, versions):
+    if open_from is None:
+        open_from = open_bar_start(series_x, series_y)
+    key = (x, y, timeframe, roll_window, min_volume, join, stale)
+    # a state only moves forward, so it is rebuilt from the given bars when the history it consumed may have
+    # changed: rewritten (uploads, late ticks, compaction), trimmed by retention (the series no longer reach back
+    # to its first bar) or now ending before its last bar
+    ps, built_from, first = pair_states.pop(key, (None, None, None))
+    if ps is not None and (built_from != versions or not len(series_x) or not len(series_y)
+                           or max(series_x.index[0], series_y.index[0]) > first
+                           or min(series_x.index[-1], series_y.index[-1]) < ps.last_ts):
+        ps = None
+    if ps is None:
+        ps, first = PairState(window=roll_window), None
+    if ps.last_ts is not None:
+        # only bars after the last one consumed, plus the bar before (ffill/asof may carry it forward)
+        series_x = series_x.iloc[max(series_x.index.searchsorted(ps.last_ts, side="right") - 1, 0):]
+        series_y = series_y.iloc[max(series_y.index.searchsorted(ps.last_ts, side="right") - 1, 0):]
+    aligned = align({"x": series_x, "y": series_y}, join, stale)
+    lo = 0 if ps.last_ts is None else int(aligned.index.searchsorted(ps.last_ts, side="right"))
+    hi = int(aligned.index.searchsorted(open_from, side="left")) if open_from is not None else 0
+    if hi > lo:
+        ps.update_many(aligned.values[lo:hi, 0], aligned.values[lo:hi, 1], aligned.index[lo:hi])
+        if first is None:
+            first = aligned.index[lo]
+    if ps.last_ts is not None:
+        pair_states[key] = (ps, versions, first)
+        while len(pair_states) > MAX_PAIR_STATES:
+            pair_states.popitem(last=False)
+    return ps
+
+# incremental correlation engines keyed by (symbols, timeframe, min_volume, returns, window), LRU-bounded; each kept
+# with the history versions and first bars it was built from (see _advance_corr_engine)
+corr_engines = OrderedDict()
+MAX_CORR_ENGINES = 16
+
+def advance_corr_engine(syms: List[str], timeframe: str, min_volume: float, returns: bool, window: Optional[int]) -> CorrelationEngine:
+    with state_lock:
+        return _advance_corr_engine(syms, timeframe, min_volume, returns, window)
+
+def _advance_corr_engine(syms, timeframe, min_volume, returns, window):
+    key = (tuple(syms), timeframe, min_volume, returns, window)
+    versions = history_versions(syms, timeframe)
+    frames = [storage.export_resampled(s, timeframe) for s in syms]
+    frames = [df if df is not None and not df.empty else None for df in frames]
+    firsts = tuple(df.index[0] if df is not None else None for df in frames)
+    engine, built_from, built_firsts = corr_engines.pop(key, (None, None, None))
+    # like pair states, an engine only moves forward: rebuild it when history was rewritten, a symbol's bars
+    # were trimmed past the first one it consumed, or every symbol now ends before the last bar it consumed
+    if engine is not None and (built_from != versions
+                               or any(b is not None and (f is None or f > b) for f, b in zip(firsts, built_firsts))
+                               or (engine.last_ts is not None
+                                   and max(df.index[-1] for df in frames if df is not None) < engine.last_ts)):
+        engine = None
+    if engine is None:
+        engine = CorrelationEngine(syms, window=window, returns=returns)
+    corr_engines[key] = (engine, versions, firsts)
+    while len(corr_engines) > MAX_CORR_ENGINES:
+        corr_engines.popitem(last=False)
+    closes = {}
+    lasts = []
+    for s, df in zip(syms, frames):
+        if df is None:
+            continue
+        lasts.append(df.index[-1])
+        if engine.last_ts is not None:
+            df = df.iloc[df.index.searchsorted(engine.last_ts, side="right"):]
+        if min_volume > 0:
+            df = df[df["volume"] >= min_volume]
+        closes[s] = df["close"]
+    if not closes:
+        return engine
+    # outer-join the new bars (NaN where a symbol has no bar); each symbol's newest bar may still be open, so
+    # stop before the oldest of them (the same cutoff as open_bar_start)
+    block = pd.DataFrame(closes).reindex(columns=syms).sort_index()
+    block = block[block.index < min(lasts)]
+    if not block.empty:
+        engine.update(block.to_numpy(dtype=float), ts=block.index[-1])
+    return engine
+
+def live_pair_metrics(x: str, y: str, timeframe: str, roll_window: int):
+    # latest closed-bar pair metrics for the live broadcaster (O(new bars) via PairState)
+    versions = history_versions((x, y), timeframe)
+    open_from = open_bars_from(x, y, timeframe)
+    xdf = storage.export_resampled(x, timeframe)
+    ydf = storage.export_resampled(y, timeframe)
+    if xdf is None or ydf is None:
+        return None
+    with state_lock:
+        ps = advance_pair_state(x, y, timeframe, roll_window, 0.0, xdf["close"], ydf["close"],
+                                open_from=open_from if open_from is not None else pd.Timestamp.max, versions=versions)
+        snap = ps.snapshot()
+        last_ts = ps.last_ts
+    hedge = snap.pop("hedge")
+    if hedge is None:
+        return None
+    snap.update(hedge)
+    snap["ts"] = int(last_ts.value // 1_000_000)
+    return snap
+
+broadcaster = LiveBroadcaster(storage, live_pair_metrics, alerts, pool=analytics_pool)
+
+COMPACT_INTERVAL_S = 15 * 60
+
+async def run_compaction():
+    while True:
+        await asyncio.sleep(COMPACT_INTERVAL_S)
+        try:
+            await asyncio.to_thread(storage.compact)
+        except Exception:
+            continue
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # move ticks left in sqlite by the previous run into the archive before serving
+    await asyncio.to_thread(storage.compact)
+    live_task = asyncio.create_task(broadcaster.run())
+    compact_task = asyncio.create_task(run_compaction())
+    yield
+    live_task.cancel()
+    compact_task.cancel()
+    # durable shutdown: finish running analytics, stop ingestion, then flush queued ticks to sqlite
+    await scanner.cancel_all()
+    await asyncio.to_thread(analytics_pool.shutdown)
+    await asyncio.to_thread(process_pool.shutdown)
+    await asyncio.to_thread(metrics.PROFILER.stop)
+    ingestor.stop()
+    await asyncio.to_thread(storage.close)
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
-storage = TickStorage(db_file="backend_ticks.db")
-ingestor = Ingestor(storage)
-alerts = AlertEngine()
+# replay recordings are only read from this directory (APP_REPLAY_DIR, default ./replays)
+REPLAY_DIR = os.environ.get("APP_REPLAY_DIR", "replays")
 
-ws_clients = set()
+def replay_path(path: Optional[str]) -> Optional[str]:
+    # a client-supplied recording path resolved inside REPLAY_DIR; None if empty or it points outside
+    if not path:
+        return None
+    root = os.path.realpath(REPLAY_DIR)
+    full = os.path.realpath(os.path.join(root, path))
+    return full if os.path.commonpath([root, full]) == root and full != root else None
 
 @app.post("/api/ingest/start")
 async def start_ingest(m: IngestMode):
@@ -33,20 +235,64 @@ async def start_ingest(m: IngestMode):
         syms = [s.lower() for s in (m.symbols or [])]
         if not syms:
             return JSONResponse({"status":"error", "msg":"no symbols provided"}, status_code=400)
-        ingestor.start_ws_for_symbols(syms)
+        # calling again while running adds the symbols to the live combined streams
+        await asyncio.to_thread(ingestor.start_ws_for_symbols, syms)
         return {"status":"ok", "mode":"ws", "symbols":syms}
+    elif m.mode == "replay":
+        path = replay_path(m.path)
+        if path is None or not os.path.isfile(path):
+            return JSONResponse({"status":"error", "msg":f"path must be an NDJSON file in the replay directory ({REPLAY_DIR})"},
+                                status_code=400)
+        await asyncio.to_thread(ingestor.start_replay, path, m.speed, m.symbols, m.loop)
+        return {"status":"ok", "mode":"replay", "path": m.path, "speed": m.speed}
     else:
         return {"status":"error", "msg":"unsupported mode"}
 
+@app.post("/api/ingest/remove")
+async def remove_ingest_symbols(m: IngestMode):
+    # unsubscribe symbols from the live combined streams
+    await asyncio.to_thread(ingestor.remove_symbols, [s.lower() for s in (m.symbols or [])])
+    src = ingestor.sources.get("binance")
+    return {"status":"ok", "symbols": sorted(src.symbols) if src is not None else []}
+
+@app.post("/api/ingest/stop")
+async def stop_ingest(m: IngestMode):
+    name = {"ws": "binance", "replay": "replay"}.get(m.mode)
+    if name is None:
+        return JSONResponse({"status":"error", "msg":"unsupported mode"}, status_code=400)
+    if ingestor.loop is not None:
+        await asyncio.to_thread(ingestor.stop_source, name)
+    return {"status":"ok", "mode": m.mode}
+
+@app.get("/api/ingest/stats")
+async def ingest_stats():
+    # per-source connection/shard state, trade counts, duplicate and gap detection
+    return ingestor.stats()
+
+# progress of the most recent NDJSON upload (rows loaded, rows/sec), polled via /api/upload_ndjson/status
+upload_status = {"state": "idle"}
+
 @app.post("/api/upload_ndjson")
 async def upload_ndjson(file: UploadFile = File(...)):
-    content = await file.read()
+    # parse the spooled upload in chunks on a worker thread; never holds the whole file as text
+    upload_status.clear()
+    upload_status.update({"state": "running", "filename": file.filename, "loaded": 0})
+    def on_progress(stats):
+        upload_status.update(stats)
     try:
-        text = content.decode("utf-8")
-    except:
-        text = content.decode("latin1")
-    storage.load_from_ndjson_text(text)
-    return {"status":"ok", "loaded": len(text.splitlines())}
+        stats = await asyncio.to_thread(storage.load_ndjson_stream, file.file, progress=on_progress)
+    except Exception as e:
+        # rows before the failing chunk stay loaded; report how many
+        upload_status.update({"state": "error", "msg": str(e)})
+        return JSONResponse({"status": "error", "msg": str(e), "loaded": upload_status.get("loaded", 0)},
+                            status_code=400)
+    upload_status.update(stats)
+    upload_status["state"] = "done"
+    return {"status":"ok", **stats}
+
+@app.get("/api/upload_ndjson/status")
+async def upload_ndjson_status():
+    return upload_status
 
 @app.post("/api/upload_ohlcv")
 async def upload_ohlcv(symbol: str = Form(...), timeframe: str = Form("1s"), file: UploadFile = File(...)):
@@ -64,42 +310,238 @@ async def upload_ohlcv(symbol: str = Form(...), timeframe: str = Form("1s"), fil
 @app.get("/api/symbols")
 async def list_symbols():
     # return symbols known in storage
-    return {"symbols": list(storage.dfs.keys())}
+    return {"symbols": storage.symbols()}
+
+@app.get("/api/storage/stats")
+async def storage_stats():
+    # sqlite writer queue depth / flush latency counters, archive size, last compaction
+    return storage.stats()
+
+@app.post("/api/storage/compact")
+async def storage_compact():
+    # move ticks from the sqlite hot table into the columnar archive now
+    return await asyncio.to_thread(storage.compact)
+
+def time_range(start: Optional[str], end: Optional[str]):
+    # start/end query params (epoch ms or ISO timestamp) -> ns bounds; raises ValueError on bad input
+    def parse(v):
+        if v is None or v == "":
+            return None
+        return to_ns(int(v)) if v.lstrip("-").isdigit() else to_ns(v)
+    return parse(start), parse(end)
 
 @app.get("/api/resampled/{symbol}")
-async def get_resampled(symbol: str, timeframe: str = "1s"):
-    df = storage.export_resampled(symbol.lower(), timeframe)
-    if df is None or df.empty:
+async def get_resampled(symbol: str, timeframe: str = "1s", start: Optional[str] = None, end: Optional[str] = None,
+                        limit: Optional[int] = None, max_points: Optional[int] = None,
+                        fmt: Optional[str] = Query(None, alias="format"), accept: Optional[str] = Header(None)):
+    # start/end select bars by start time (pushed down to storage), limit keeps the newest N,
+    # max_points merges consecutive bars so a chart gets at most that many candles.
+    # format=columnar|arrow|msgpack (or Accept) returns arrays per field with epoch-ms ts
+    out_fmt = encoding.negotiate(accept, fmt)
+    err = encoding.unavailable(out_fmt)
+    if err is not None:
+        return err
+    try:
+        start_ns, end_ns = time_range(start, end)
+    except ValueError as e:
+        return JSONResponse({"error": f"bad time range: {e}"}, status_code=400)
+    if max_points is not None and max_points < 1:
+        return JSONResponse({"error": "max_points must be >= 1"}, status_code=400)
+    return await analytics_pool.run(resampled_response, symbol, timeframe, start_ns, end_ns, limit, max_points, out_fmt)
+
+def json_response(payload) -> JSONResponse:
+    # what FastAPI would do with a returned dict, but done on the pool thread rather than the event loop
+    with metrics.timer("serialize_seconds", format="json"):
+        return JSONResponse(jsonable_encoder(payload))
+
+def resampled_response(symbol, timeframe, start_ns, end_ns, limit, max_points, out_fmt):
+    df = storage.export_resampled(symbol.lower(), timeframe, start_ns, end_ns)
+    if out_fmt == "json" and (df is None or df.empty):
         return {"data": []}
+    if df is None:
+        df = pd.DataFrame(columns=BAR_COLUMNS, index=pd.DatetimeIndex([], name="ts"), dtype=float)
+    if limit:
+        df = df.tail(limit)
+    if max_points:
+        df = downsample_bars(df, max_points)
+    if out_fmt != "json":
+        return encoding.encode({"symbol": symbol.lower(), "timeframe": timeframe, **encoding.columns(df)}, out_fmt, df)
     df = df.reset_index()
     df["ts"] = df["ts"].astype(str)
-    return {"data": df.to_dict(orient="records")}
+    return json_response({"data": df.to_dict(orient="records")})
 
 @app.get("/api/analytics/pair")
-async def analytics_pair(x: str, y: str, timeframe: str = "1s", roll_window: int = 60, regression: str = "ols", min_volume: float = 0.0):
-    xdf = storage.export_resampled(x.lower(), timeframe)
-    ydf = storage.export_resampled(y.lower(), timeframe)
-    if xdf is None or ydf is None:
+async def analytics_pair(x: str, y: str, timeframe: str = "1s", roll_window: int = 60, regression: str = "ols", min_volume: float = 0.0,
+                         start: Optional[str] = None, end: Optional[str] = None, limit: int = 500,
+                         max_points: Optional[int] = None, downsample: str = "lttb", join: str = "inner",
+                         max_staleness: Optional[str] = None,
+                         fmt: Optional[str] = Query(None, alias="format"), accept: Optional[str] = Header(None)):
+    # start/end restrict the analysed bars (pushed down to storage); the returned series are the newest
+    # `limit` points, or the whole range downsampled to max_points (downsample = lttb | minmax).
+    # join = inner | ffill | asof (+ max_staleness, e.g. "5s") decides how x and y bars are paired.
+    # format=columnar|arrow|msgpack (or Accept) returns the series as one ts-aligned set of arrays
+    out_fmt = encoding.negotiate(accept, fmt)
+    err = encoding.unavailable(out_fmt)
+    if err is not None:
+        return err
+    try:
+        start_ns, end_ns = time_range(start, end)
+    except ValueError as e:
+        return JSONResponse({"error": f"bad time range: {e}"}, status_code=400)
+    if downsample not in DOWNSAMPLE_METHODS:
+        return JSONResponse({"error": f"downsample must be one of {DOWNSAMPLE_METHODS}"}, status_code=400)
+    if max_points is not None and max_points < 2:
+        # lttb keeps both end points, minmax a min and a max per bucket
+        return JSONResponse({"error": "max_points must be >= 2"}, status_code=400)
+    try:
+        join, stale = join_policy(join, max_staleness)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return await analytics_pool.run(pair_analytics, x, y, timeframe, roll_window, regression, min_volume,
+                                    start_ns, end_ns, join, stale, limit, max_points, downsample, out_fmt)
+
+def pair_versions(x: str, y: str, timeframe: str):
+    return storage.data_version(x, timeframe), storage.data_version(y, timeframe)
+
+def pair_closed_versions(x: str, y: str, timeframe: str):
+    return storage.closed_version(x, timeframe), storage.closed_version(y, timeframe)
+
+def hedge_key(x, y, timeframe, regression, min_volume, start_ns, end_ns, join, stale, versions):
+    # whole-range hedge shared by /analytics/pair and /analytics/pair_export. Only with a start bound do both
+    # read the same bars (unbounded, the pair endpoint covers the in-memory window and the export everything)
+    if start_ns is None:
+        return None
+    return ("hedge", x, y, timeframe, regression, min_volume, start_ns, end_ns, join, stale) + versions
+
+def join_policy(join: str, max_staleness: Optional[str]):
+    # validated (join, max staleness in ns) for the align.py policies; raises ValueError
+    if join not in JOINS:
+        raise ValueError(f"join must be one of {JOINS}")
+    return join, staleness_ns(max_staleness)
+
+def pair_core(x, y, timeframe, roll_window, regression, min_volume, start_ns, end_ns, join, stale, versions):
+    # the expensive part of /analytics/pair (fit, spread, rolling stats, ADF, backtest) over the closed bars of one
+    # closed version (storage.closed_version); pair_tail adds the rows of the bars still open per request
+    ranged = start_ns is not None or end_ns is not None
+    history = history_versions((x, y), timeframe)
+    open_from = open_bars_from(x, y, timeframe)
+    xdf = storage.export_resampled(x, timeframe, start_ns, end_ns)
+    ydf = storage.export_resampled(y, timeframe, start_ns, end_ns)
+    if xdf is None or ydf is None or xdf.empty or ydf.empty:
         return {"error":"no data"}
+    if open_from is not None and end_ns is not None and open_from.value >= end_ns:
+        open_from = None  # the range ends before any open bar
     # align by index (ts)
     if min_volume > 0:
         xdf = xdf[xdf["volume"] >= min_volume]
         ydf = ydf[ydf["volume"] >= min_volume]
-    series_x = xdf["close"]
-    series_y = ydf["close"]
+    # aligned once; every step below reuses the shared index
+    aligned = align({"x": xdf["close"], "y": ydf["close"]}, join, stale)
+    hi = int(aligned.index.searchsorted(open_from, side="left")) if open_from is not None else len(aligned)
+    closed = Aligned(aligned.index[:hi], aligned.values[:hi], aligned.symbols)
+    series_x, series_y = closed.series("x"), closed.series("y")
+    hkey = hedge_key(x, y, timeframe, regression, min_volume, start_ns, end_ns, join, stale, versions)
     # hedge via OLS
+    hedge_path = None
     if regression == "kalman":
-        hr = hedge_ratio_kalman(series_y, series_x)
+        hr = hedge_ratio_kalman(series_y, series_x, path=True)
+        if hr is not None:
+            hedge_path = hr.pop("path")
+            if hkey is not None:
+                results.put(hkey, hr)
+    elif ranged:
+        fit = lambda: hedge_ratio_ols(series_y, series_x)
+        hr = fit() if hkey is None else results.get_or_compute(hkey, fit)
     else:
-        hr = hedge_ratio_ols(series_y, series_x)
+        # running OLS over closed bars: O(new bars) instead of refitting the whole history
+        with state_lock:
+            hr = advance_pair_state(x, y, timeframe, roll_window, min_volume, series_x, series_y, join, stale,
+                                    open_from if open_from is not None else pd.Timestamp.max, history).hedge()
+        if hr is None:
+            hr = hedge_ratio_ols(series_y, series_x)
     if hr is None:
         return {"error":"insufficient data"}
     spread = compute_spread(series_y, series_x, hr["beta"], hr.get("intercept",0.0))
     z = rolling_zscore(spread, window=roll_window)
-    adf = adf_test(spread)
     corr = rolling_correlation(series_x, series_y, window=roll_window).dropna()
-    # backtest mini mean-reversion
-    bt = backtest_mean_reversion(z)
+    tail_from = None
+    if open_from is not None:
+        # where pair_tail starts reading: the last roll_window closed rows (the rolling stats of the open rows
+        # need them), each symbol from its last bar at or before the first of those (ffill/asof carry it forward)
+        start = closed.index[max(hi - roll_window, 0)]
+        tail_from = (start, tuple(int(df.index.as_unit("ns").asi8[df.index.searchsorted(start, side="right") - 1])
+                                  for df in (xdf, ydf)))
+    return {
+        "hedge": hr,
+        "hedge_path": hedge_path,
+        "spread": spread,
+        "zscore": z,
+        "corr": corr,
+        "adf": adf_test(spread),
+        # backtest mini mean-reversion
+        "backtest": backtest_mean_reversion(z),
+        "open_from": open_from,
+        "tail_from": tail_from,
+    }
+
+def pair_tail(x, y, timeframe, roll_window, min_volume, end_ns, join, stale, core):
+    # the cheap per-request part of /analytics/pair: the rows of the bars still open, which pair_core leaves out.
+    # Spread with the core's hedge; z-score and correlation over the last roll_window closed rows plus these
+    if "error" in core or core["tail_from"] is None:
+        return core
+    start, (from_x, from_y) = core["tail_from"]
+    xdf = storage.export_resampled(x, timeframe, from_x, end_ns)
+    ydf = storage.export_resampled(y, timeframe, from_y, end_ns)
+    if xdf is None or ydf is None or xdf.empty or ydf.empty:
+        return core
+    if min_volume > 0:
+        xdf = xdf[xdf["volume"] >= min_volume]
+        ydf = ydf[ydf["volume"] >= min_volume]
+    aligned = align({"x": xdf["close"], "y": ydf["close"]}, join, stale)
+    lo = int(aligned.index.searchsorted(start, side="left"))
+    k = int(aligned.index.searchsorted(core["open_from"], side="left")) - lo
+    rows = Aligned(aligned.index[lo:], aligned.values[lo:], aligned.symbols)
+    if k >= len(rows):
+        return core
+    series_x, series_y = rows.series("x"), rows.series("y")
+    hr = core["hedge"]
+    spread = compute_spread(series_y, series_x, hr["beta"], hr.get("intercept",0.0))
+    z = rolling_zscore(spread, window=roll_window)
+    corr = rolling_correlation(series_x, series_y, window=roll_window)
+    out = dict(core)
+    out["spread"] = pd.concat([core["spread"], spread.iloc[k:]])
+    out["zscore"] = pd.concat([core["zscore"], z.iloc[k:]])
+    out["corr"] = pd.concat([core["corr"], corr.iloc[k:].dropna()])
+    if core["hedge_path"] is not None:
+        # the Kalman path stops at the last closed bar; the open rows carry its final beta/intercept
+        path = core["hedge_path"]
+        carried = pd.DataFrame([path.iloc[-1].to_numpy()] * (len(rows) - k), index=rows.index[k:], columns=path.columns)
+        out["hedge_path"] = pd.concat([path, carried])
+    return out
+
+def pair_analytics(x, y, timeframe, roll_window, regression, min_volume, start_ns, end_ns, join, stale, limit, max_points, downsample, out_fmt):
+    # on a pool thread. The core (fit, ADF, backtest over closed bars) is memoized per closed version of both
+    # symbols, so it is recomputed only when a bar closes; ticks inside the open bars only redo pair_tail. The
+    # rendered response is memoized per data version, so polls between ticks are a dictionary lookup
+    xl, yl = x.lower(), y.lower()
+    versions = pair_versions(xl, yl, timeframe)
+    closed = pair_closed_versions(xl, yl, timeframe)
+    params = (xl, yl, timeframe, roll_window, regression, min_volume, start_ns, end_ns, join, stale)
+    core_key = ("pair",) + params + closed
+    key = ("pair_response",) + params + versions + (limit, max_points, downsample, out_fmt, alerts.version)
+    def render():
+        core = results.get_or_compute(core_key, lambda: pair_core(*params, closed))
+        core = pair_tail(xl, yl, timeframe, roll_window, min_volume, end_ns, join, stale, core)
+        resp = pair_response(x, y, timeframe, core, limit, max_points, downsample, out_fmt)
+        return resp.body, resp.media_type
+    body, media_type = results.get_or_compute(key, render)
+    return Response(body, media_type=media_type)
+
+def pair_response(x, y, timeframe, core, limit, max_points, downsample, out_fmt):
+    if "error" in core:
+        return json_response(core)
+    spread, z, corr, hedge_path = core["spread"], core["zscore"], core["corr"], core["hedge_path"]
+    bt = dict(core["backtest"])
     # alert evaluation for last values
     last_z = float(z.dropna().iloc[-1]) if not z.dropna().empty else None
     last_spread = float(spread.dropna().iloc[-1]) if not spread.dropna().empty else None
@@ -108,100 +550,433 @@ async def analytics_pair(x: str, y: str, timeframe: str = "1s", roll_window: int
         triggered += alerts.evaluate("zscore", last_z, {"x": x, "y": y, "timeframe": timeframe})
     if last_spread is not None:
         triggered += alerts.evaluate("spread", last_spread, {"x": x, "y": y, "timeframe": timeframe})
-    # return last N points for plotting
+    # return last N points (or a downsampled view of the whole range) for plotting
+    def plot(series):
+        if max_points:
+            return downsample_series(series, max_points, downsample)
+        return series.dropna().tail(limit)
+    if max_points:
+        bt["equity"] = plot(pd.Series(bt["equity"], dtype=float)).to_dict()
+    series = {"spread": plot(spread), "zscore": plot(z), "corr": plot(corr)}
+    if hedge_path is not None:
+        # time-varying beta/intercept for plotting
+        series.update({"beta": plot(hedge_path["beta"]), "intercept": plot(hedge_path["intercept"])})
     out = {
-        "hedge": hr,
-        "adf": adf,
-        "spread": spread.dropna().tail(500).to_dict(),
-        "zscore": z.dropna().tail(500).to_dict(),
-        "corr": corr.tail(500).to_dict(),
+        "hedge": core["hedge"],
+        "adf": core["adf"],
         "backtest": bt,
         "last": {"zscore": last_z, "spread": last_spread},
         "alerts": [{"id": r.id, "message": msg} for (r, msg, _ctx) in triggered]
     }
-    return out
+    if out_fmt != "json":
+        # one outer-joined frame: ts + a column per series (null where a series has no point)
+        frame = pd.DataFrame(series).sort_index()
+        return encoding.encode({**out, **encoding.columns(frame)}, out_fmt, frame)
+    for k in ("spread", "zscore", "corr"):
+        out[k] = series[k].to_dict()
+    if hedge_path is not None:
+        out["hedge_path"] = {"beta": series["beta"].to_dict(), "intercept": series["intercept"].to_dict()}
+    return json_response(out)
 
 @app.get("/api/analytics/corr_matrix")
-async def corr_matrix(symbols: str, timeframe: str = "1s", min_volume: float = 0.0):
-    # symbols is comma-separated list
+async def corr_matrix(symbols: str, timeframe: str = "1s", min_volume: float = 0.0, on: str = "close", window: Optional[int] = None):
+    # symbols is comma-separated list; on = "close" (price levels) or "logret" (log-returns);
+    # window = rolling number of bars (default: full history). Missing bars are handled pairwise.
     syms = [s.strip().lower() for s in symbols.split(",") if s.strip()]
-    series_map = {}
-    for s in syms:
-        df = storage.export_resampled(s, timeframe)
-        if df is None or df.empty:
+    if not syms:
+        return {"symbols": syms, "matrix": []}
+    return await analytics_pool.run(corr_matrix_payload, syms, timeframe, min_volume, on == "logret", window)
+
+def corr_matrix_payload(syms, timeframe, min_volume, returns, window):
+    with state_lock:
+        engine = advance_corr_engine(syms, timeframe, min_volume, returns, window)
+        cm = engine.matrix()
+        observations = engine.observations()
+    present = [i for i, n in enumerate(observations) if n >= 2]
+    if not present:
+        return {"symbols": syms, "matrix": []}
+    cm = cm[np.ix_(present, present)]
+    matrix = [[None if np.isnan(v) else float(v) for v in row] for row in cm]
+    return {"symbols": [syms[i] for i in present], "matrix": matrix}
+
+MAX_SWEEP_SETS = 20_000  # parameter sets per pair
+
+def parse_grid(text: str, cast=float):
+    # "1,1.5,2" or "lo:hi:step" (hi inclusive)
+    values = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
             continue
+        if ":" in part:
+            lo, hi, step = (float(v) for v in part.split(":"))
+            if not (step > 0 and np.isfinite([lo, hi, step]).all()):
+                raise ValueError(f"step must be > 0 and bounds finite in {part!r}")
+            # size the range before building it: one axis can never exceed the whole sweep cap
+            n = max(0, int(np.floor((hi - lo) / step + 0.5)) + 1)
+            if len(values) + n > MAX_SWEEP_SETS:
+                raise ValueError(f"{part!r} has {n} values (max {MAX_SWEEP_SETS})")
+            values += np.arange(lo, hi + step / 2, step).round(10).tolist()
+        else:
+            values.append(float(part))
+    return sorted({cast(v) for v in values})
+
+@app.get("/api/analytics/backtest_sweep")
+async def analytics_backtest_sweep(pairs: str, timeframe: str = "1s", regression: str = "ols", min_volume: float = 0.0,
+                                   start: Optional[str] = None, end: Optional[str] = None, windows: str = "60",
+                                   entry: str = "2", exit: str = "0", pnl: str = "z", sort: str = "sharpe",
+                                   equity: bool = False, join: str = "inner", max_staleness: Optional[str] = None):
+    # pairs = "x/y,x2/y2"; windows/entry/exit = comma lists or lo:hi:step ranges. Every combination is
+    # backtested with the /analytics/pair rules over the whole (start/end) range in one call
+    try:
+        start_ns, end_ns = time_range(start, end)
+        grid = {"windows": [w for w in parse_grid(windows, int) if w >= 2], "entries": parse_grid(entry),
+                "exits": parse_grid(exit)}
+        pair_list = [tuple(p.strip().lower().split("/")) for p in pairs.split(",") if p.strip()]
+        join, stale = join_policy(join, max_staleness)
+    except ValueError as e:
+        return JSONResponse({"error": f"bad parameter: {e}"}, status_code=400)
+    if not pair_list or any(len(p) != 2 for p in pair_list):
+        return JSONResponse({"error": "pairs must look like x/y,x2/y2"}, status_code=400)
+    if not all(grid.values()):
+        return JSONResponse({"error": "windows (>= 2), entry and exit need at least one value"}, status_code=400)
+    n_sets = len(grid["windows"]) * len(grid["entries"]) * len(grid["exits"])
+    if n_sets > MAX_SWEEP_SETS:
+        return JSONResponse({"error": f"{n_sets} parameter sets (max {MAX_SWEEP_SETS})"}, status_code=400)
+    if pnl not in ("z", "spread") or sort not in ("sharpe", "pnl"):
+        return JSONResponse({"error": "pnl must be z|spread and sort sharpe|pnl"}, status_code=400)
+    tf_ns = timeframe_ns(timeframe)
+    kwargs = dict(grid, pnl_on=pnl, equity=equity,
+                  periods_per_year=365 * 86400 * 1e9 / tf_ns if tf_ns else None)
+    spreads = await asyncio.gather(*(analytics_pool.run(pair_spread, x, y, timeframe, regression, min_volume, start_ns, end_ns,
+                                                        join, stale) for x, y in pair_list))
+    ready = [(p, s) for p, s in zip(pair_list, spreads) if "error" not in s]
+    if len(ready) > 1:
+        # one process per pair (the trade scan is Python-level and holds the GIL)
+        sweeps = await asyncio.gather(*(process_pool.run(backtest_sweep, s["spread"], **kwargs) for _, s in ready))
+    else:
+        sweeps = [await analytics_pool.run(backtest_sweep, s["spread"], **kwargs) for _, s in ready]
+    done = dict(zip((p for p, _ in ready), sweeps))
+    out = {"timeframe": timeframe, "sets": n_sets, "pairs": {}}
+    for p, s in zip(pair_list, spreads):
+        out["pairs"]["/".join(p)] = s if p not in done else sweep_payload(s["hedge"], done[p], sort)
+    return json_response(out)
+
+def pair_spread(x, y, timeframe, regression, min_volume, start_ns, end_ns, join, stale):
+    # whole-range hedge and spread, memoized per data version
+    versions = pair_versions(x, y, timeframe)
+    def compute():
+        xdf = storage.export_resampled(x, timeframe, start_ns, end_ns)
+        ydf = storage.export_resampled(y, timeframe, start_ns, end_ns)
+        if xdf is None or ydf is None or xdf.empty or ydf.empty:
+            return {"error": "no data"}
+        if min_volume > 0:
+            xdf = xdf[xdf["volume"] >= min_volume]
+            ydf = ydf[ydf["volume"] >= min_volume]
+        aligned = align({"x": xdf["close"], "y": ydf["close"]}, join, stale)
+        series_x, series_y = aligned.series("x"), aligned.series("y")
+        fit = hedge_ratio_kalman if regression == "kalman" else hedge_ratio_ols
+        hr = fit(series_y, series_x)
+        if hr is None:
+            return {"error": "insufficient data"}
+        return {"hedge": hr, "spread": compute_spread(series_y, series_x, hr["beta"], hr.get("intercept", 0.0))}
+    key = ("spread", x, y, timeframe, regression, min_volume, start_ns, end_ns, join, stale) + versions
+    return results.get_or_compute(key, compute)
+
+def sweep_payload(hedge, sweep, sort):
+    rows = sweep["results"]
+    for r in rows:
+        if "equity" in r:
+            r["equity"] = [None if np.isnan(v) else round(float(v), 10) for v in r["equity"]]
+    ranked = [r for r in rows if r[sort] is not None and r["trades"] > 0]
+    best = max(ranked, key=lambda r: r[sort], default=None)
+    out = {"hedge": hedge, "results": rows,
+           "best": None if best is None else {k: v for k, v in best.items() if k != "equity"}}
+    if "ts" in sweep:
+        out["ts"] = sweep["ts"].tolist()
+    return out
+
+@app.post("/api/analytics/scan")
+async def start_scan(req: ScanRequest):
+    # cointegration scan over every pair of `symbols`: returns the job (id, progress) at once; follow it with
+    # GET /api/analytics/scan/{id}[/stream], stop it with DELETE
+    syms = list(dict.fromkeys(s.strip().lower() for s in req.symbols if s.strip()))
+    if len(syms) < 2:
+        return JSONResponse({"error": "need at least two symbols"}, status_code=400)
+    if req.on not in ("close", "logret"):
+        return JSONResponse({"error": "on must be close|logret"}, status_code=400)
+    try:
+        join, stale = join_policy(req.join, req.max_staleness)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    params = dict(req.model_dump(), symbols=syms)
+    job = scanner.start(params, analytics_pool.run(scan_candidates, syms, req.timeframe, req.min_volume,
+                                                   req.on == "logret", req.min_corr, req.max_pairs, req.bars),
+                        process_pool, join=join, stale=stale)
+    return job.status()
+
+def scan_candidates(syms, timeframe, min_volume, returns, min_corr, max_pairs, bars):
+    # prefilter: one correlation matrix (the incremental engine behind /analytics/corr_matrix), keep pairs
+    # with |corr| >= min_corr, strongest first. Returns the candidates' closes as one outer-joined matrix
+    with state_lock:
+        cm = advance_corr_engine(syms, timeframe, min_volume, returns, None).matrix()
+    iu, ju = np.triu_indices(len(syms), 1)
+    corr = cm[iu, ju]
+    keep = np.flatnonzero(~np.isnan(corr) & (np.abs(corr) >= min_corr))
+    keep = keep[np.argsort(-np.abs(corr[keep]), kind="stable")][:max_pairs]
+    candidates = [(syms[iu[k]], syms[ju[k]], float(corr[k])) for k in keep]
+    used = sorted({s for x, y, _ in candidates for s in (x, y)}, key=syms.index)
+    frames = {s: storage.export_resampled(s, timeframe) for s in syms}
+    # closed bars only, with the correlation engine's cutoff: before the oldest of all symbols' newest bars
+    open_from = open_bar_start(*frames.values())
+    closes = {}
+    for s in used:
+        df = frames[s]
+        df = df[df.index < open_from]
         if min_volume > 0:
             df = df[df["volume"] >= min_volume]
-        series_map[s] = df["close"]
-    if not series_map:
-        return {"symbols": syms, "matrix": []}
-    cm = correlation_matrix(series_map)
-    return {"symbols": list(cm.columns), "matrix": cm.values.tolist()}
+        closes[s] = df["close"]
+    # union of all bar timestamps, NaN where a symbol has no bar: each pair is joined by policy in the worker
+    merged = align(closes, "ffill", 0, dropna=False)
+    keys = merged.index.asi8 if isinstance(merged.index, pd.DatetimeIndex) else np.asarray(merged.index, dtype=np.int64)
+    if bars:
+        keys, values = keys[-bars:], merged.values[-bars:]
+    else:
+        values = merged.values
+    return keys, values, merged.symbols, candidates
+
+@app.get("/api/analytics/scan/{jid}")
+async def scan_status(jid: str, limit: int = 50):
+    job = scanner.get(jid)
+    if job is None:
+        return JSONResponse({"error": "unknown scan"}, status_code=404)
+    return job.status(limit)
+
+@app.get("/api/analytics/scan/{jid}/stream")
+async def scan_stream(jid: str):
+    # NDJSON: started, a result line per finished batch (pairs + progress), then done|cancelled|error with
+    # the full ranking. Replays from the start, so it can be opened at any time
+    job = scanner.get(jid)
+    if job is None:
+        return JSONResponse({"error": "unknown scan"}, status_code=404)
+    async def lines():
+        async for event in job.follow():
+            yield json.dumps(event) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.delete("/api/analytics/scan/{jid}")
+async def cancel_scan(jid: str):
+    job = scanner.cancel(jid)
+    if job is None:
+        return JSONResponse({"error": "unknown scan"}, status_code=404)
+    await asyncio.wait([job.task])
+    return job.status()
+
+def export_response(frames, fmt: str, fname: str):
+    # chunked body produced block by block (sync generator -> iterated on the threadpool)
+    media_type, ext = export.FORMATS[fmt]
+    return StreamingResponse(export.encode(frames, fmt), media_type=media_type,
+                             headers={"Content-Disposition": f"attachment; filename={fname}.{ext}"})
+
+def has_data(sym: str, timeframe: str) -> bool:
+    return storage.latest(sym) is not None or timeframe in storage.bars.get(sym, {})
 
 @app.get("/api/analytics/pair_export")
-async def analytics_pair_export(x: str, y: str, timeframe: str = "1s", roll_window: int = 60, regression: str = "ols", min_volume: float = 0.0):
-    xdf = storage.export_resampled(x.lower(), timeframe)
-    ydf = storage.export_resampled(y.lower(), timeframe)
-    if xdf is None or ydf is None:
+async def analytics_pair_export(x: str, y: str, timeframe: str = "1s", roll_window: int = 60, regression: str = "ols", min_volume: float = 0.0,
+                                start: Optional[str] = None, end: Optional[str] = None, fmt: str = Query("csv", alias="format")):
+    # streamed in time-ordered blocks: pass 1 fits the hedge, pass 2 writes ts, spread, zscore, corr
+    # (format = csv | csv.gz | parquet)
+    if fmt not in export.FORMATS:
+        return JSONResponse({"error": f"format must be one of {list(export.FORMATS)}"}, status_code=400)
+    try:
+        start_ns, end_ns = time_range(start, end)
+    except ValueError as e:
+        return JSONResponse({"error": f"bad time range: {e}"}, status_code=400)
+    x, y = x.lower(), y.lower()
+    if not has_data(x, timeframe) or not has_data(y, timeframe):
         return JSONResponse({"error":"no data"}, status_code=404)
-    if min_volume > 0:
-        xdf = xdf[xdf["volume"] >= min_volume]
-        ydf = ydf[ydf["volume"] >= min_volume]
-    series_x = xdf["close"]
-    series_y = ydf["close"]
-    if regression == "kalman":
-        hr = hedge_ratio_kalman(series_y, series_x)
-    else:
-        hr = hedge_ratio_ols(series_y, series_x)
+    fname = f"pair_{x}_{y}_{timeframe}"
+    versions, open_from = await analytics_pool.run(
+        lambda: (pair_closed_versions(x, y, timeframe), open_bars_from(x, y, timeframe)))
+    if start_ns is not None:
+        # same bars as a cached /analytics/pair result: stream its spread/zscore/corr (plus the open bars' rows)
+        # instead of recomputing
+        core = results.peek(("pair", x, y, timeframe, roll_window, regression, min_volume, start_ns, end_ns, "inner", None) + versions)
+        if core is not None and "error" not in core:
+            core = await analytics_pool.run(pair_tail, x, y, timeframe, roll_window, min_volume, end_ns, "inner", None, core)
+            frame = pd.concat([core["spread"], core["zscore"], core["corr"].rename("corr")], axis=1).dropna()
+            frames = (frame.iloc[i:i + EXPORT_BLOCK_ROWS] for i in range(0, len(frame), EXPORT_BLOCK_ROWS))
+            return export_response(frames, fmt, fname)
+    def blocks(end=end_ns):
+        return export.aligned_closes(storage.iter_bars(x, timeframe, start_ns, end),
+                                     storage.iter_bars(y, timeframe, start_ns, end), min_volume)
+    # like /analytics/pair, the hedge is fitted on closed bars only (and applied to every row)
+    fit_end = end_ns
+    if open_from is not None and (end_ns is None or open_from.value < end_ns):
+        fit_end = open_from.value
+    def fit():
+        return export.fit_pair_hedge(blocks(fit_end), regression)
+    hkey = hedge_key(x, y, timeframe, regression, min_volume, start_ns, end_ns, "inner", None, versions)
+    hr = await analytics_pool.run(fit if hkey is None else functools.partial(results.get_or_compute, hkey, fit))
     if hr is None:
         return JSONResponse({"error":"insufficient data"}, status_code=400)
-    spread = compute_spread(series_y, series_x, hr["beta"], hr.get("intercept",0.0))
-    z = rolling_zscore(spread, window=roll_window)
-    corr = rolling_correlation(series_x, series_y, window=roll_window)
-    df = pd.concat([spread.rename("spread"), z.rename("zscore"), corr.rename("corr")], axis=1).dropna()
-    csv_buf = df.reset_index().rename(columns={"index":"ts"}).to_csv(index=False)
-    fname = f"pair_{x}_{y}_{timeframe}.csv"
-    return StreamingResponse(io.StringIO(csv_buf), media_type="text/csv", headers={"Content-Disposition": f"attachment; filename={fname}"})
+    return export_response(export.pair_metric_frames(blocks(), hr, roll_window), fmt, fname)
 
 @app.get("/api/export/{symbol}")
-async def export_symbol_csv(symbol: str, timeframe: str = "1s"):
-    df = storage.export_resampled(symbol.lower(), timeframe)
-    if df is None or df.empty:
+async def export_symbol_csv(symbol: str, timeframe: str = "1s", mode: str = "bars", start: Optional[str] = None,
+                            end: Optional[str] = None, fmt: str = Query("csv", alias="format")):
+    # mode = bars (OHLCV at timeframe) | ticks (raw ts, price, size); streamed in time-ordered blocks
+    # from the archive and the in-memory buffer (format = csv | csv.gz | parquet)
+    if fmt not in export.FORMATS:
+        return JSONResponse({"error": f"format must be one of {list(export.FORMATS)}"}, status_code=400)
+    if mode not in ("bars", "ticks"):
+        return JSONResponse({"error": "mode must be bars or ticks"}, status_code=400)
+    try:
+        start_ns, end_ns = time_range(start, end)
+    except ValueError as e:
+        return JSONResponse({"error": f"bad time range: {e}"}, status_code=400)
+    sym = symbol.lower()
+    if mode == "ticks":
+        if storage.latest(sym) is None:
+            return JSONResponse({"error":"no data"}, status_code=404)
+        return export_response(export.tick_frames(storage.iter_ticks(sym, start_ns, end_ns)), fmt, f"{symbol}_ticks")
+    if not has_data(sym, timeframe):
         return JSONResponse({"error":"no data"}, status_code=404)
-    csv_buf = df.reset_index().to_csv(index=False)
-    return StreamingResponse(io.StringIO(csv_buf), media_type="text/csv", headers={"Content-Disposition": f"attachment; filename={symbol}_{timeframe}.csv"})
+    return export_response(storage.iter_bars(sym, timeframe, start_ns, end_ns), fmt, f"{symbol}_{timeframe}")
 
 @app.post("/api/alerts")
 async def add_alert(rule: AlertRule):
-    r = alerts.add_rule(rule)
+    try:
+        r = alerts.add_rule(rule)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
     return r
 
 @app.get("/api/alerts")
 async def get_alerts():
     return alerts.list_rules()
 
+@app.get("/api/alerts/triggered")
+async def get_triggered_alerts(limit: int = 50):
+    # most recent triggers from continuous (bar-close) evaluation
+    return {"triggered": list(alerts.recent)[-limit:][::-1]}
+
 @app.delete("/api/alerts/{rid}")
 async def rm_alert(rid:int):
     r = alerts.remove_rule(rid)
     return {"removed": bool(r)}
 
-# WebSocket endpoint to stream live metrics & alerts to clients
+# WebSocket endpoint to stream live metrics & alerts to clients.
+# Snapshots are computed once by the broadcaster task and fanned out; this handler only reads subscriptions.
 @app.websocket("/ws/live")
 async def ws_live(websocket: WebSocket):
     await websocket.accept()
-    ws_clients.add(websocket)
+    client = LiveClient(websocket, broadcaster.snapshot_text, analytics_pool.executor)
+    broadcaster.add(client)
+    sender = asyncio.create_task(client.run_sender())
     try:
         while True:
-            # send heartbeat + some metrics every 1s
-            await asyncio.sleep(1.0)
-            # prepare small payload: latest price per symbol, optionally call analytics for key pairs
-            payload = {"type":"heartbeat", "ts": time.time(), "symbols": {}}
-            for sym, df in storage.dfs.items():
-                if df.empty: continue
-                latest = df["price"].iloc[-1]
-                payload["symbols"][sym] = {"price": float(latest)}
-            await websocket.send_json(payload)
-    except Exception:
+            try:
+                msg = await websocket.receive_json()
+            except json.JSONDecodeError:
+                client.offer("error", json.dumps({"type": "error", "msg": "messages must be JSON"}))
+                continue
+            # subscribing computes snapshots (bars, pair metrics): off the loop like everything else heavy
+            await analytics_pool.run(broadcaster.handle, client, msg)
+    except WebSocketDisconnect:
         pass
+    except Exception:
+        log.exception("live client failed")
     finally:
-        ws_clients.discard(websocket)
+        broadcaster.remove(client)
+        sender.cancel()
+        try:
+            await websocket.close()
+        except Exception:
+            pass  # already closed by the peer
+
+@app.get("/api/live/stats")
+async def live_stats():
+    return broadcaster.stats()
+
+@app.get("/api/analytics/cache")
+async def analytics_cache_stats():
+    # memoized results: entries/bytes, hit rate overall and per kind (pair, pair_response, hedge)
+    return results.stats()
+
+@app.get("/api/workers/stats")
+async def workers_stats():
+    # analytics pool: jobs submitted/running/queued and the longest wait for a free worker;
+    # processes: the process pool used by backtest sweeps and scans
+    return {**analytics_pool.stats(), "processes": process_pool.stats(), "scans": scanner.stats()}
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+@metrics.REGISTRY.collector
+def storage_metrics():
+    # read at scrape time: buffers is replaced copy-on-write, so this dict is a consistent snapshot
+    buffers = storage.buffers
+    yield ("tick_buffer_rows", "gauge", "Ticks held in memory per symbol", [({"symbol": s}, len(b)) for s, b in buffers.items()])
+    yield ("tick_buffer_capacity", "gauge", "Allocated tick buffer rows per symbol",
+           [({"symbol": s}, b.capacity) for s, b in buffers.items()])
+    yield ("tick_buffer_bytes", "gauge", "Tick buffer arrays per symbol", [({"symbol": s}, b.nbytes) for s, b in buffers.items()])
+    bars = storage.bar_cache.stats()
+    res = results.stats()
+    uploaded = sum(int(df.memory_usage(deep=False).sum()) for tfs in list(storage.bars.values()) for df in list(tfs.values()))
+    yield ("memory_estimate_bytes", "gauge", "Estimated bytes held by each in-memory structure",
+           [({"component": "tick_buffers"}, sum(b.nbytes for b in buffers.values())), ({"component": "bar_cache"}, bars["bytes"]),
+            ({"component": "result_cache"}, res["bytes"]), ({"component": "uploaded_bars"}, uploaded)])
+    yield ("process_resident_memory_bytes", "gauge", "Resident set size of the server process", [({}, _rss_bytes())])
+    yield ("bar_cache_entries", "gauge", "Bar cache entries", [({}, bars["entries"])])
+    yield ("result_cache_entries", "gauge", "Memoized analytics results", [({}, res["entries"])])
+    yield ("bar_cache_lookups_total", "counter", "Bar cache lookups by outcome",
+           [({"result": "hit"}, bars["hits"]), ({"result": "miss"}, bars["misses"])])
+    writer = storage.writer.stats()
+    yield ("sqlite_queue_depth", "gauge", "Ticks queued for the sqlite writer", [({}, writer["queue_depth"])])
+    yield ("sqlite_rows_written_total", "counter", "Ticks committed to sqlite", [({}, writer["rows_written"])])
+    yield ("sqlite_rows_dropped_total", "counter", "Ticks never committed to sqlite (full queue or rejected batch)",
+           [({}, writer["rows_dropped"])])
+
+@metrics.REGISTRY.collector
+def runtime_metrics():
+    ing = ingestor.stats()
+    yield ("ingest_trades_total", "counter", "Trades received from sources", [({}, ing["trades"])])
+    yield ("ingest_dropped_total", "counter", "Trades dropped on a full ingest queue", [({}, ing["queue"]["dropped"])])
+    yield ("ingest_queue_depth", "gauge", "Trades waiting in the ingest queue", [({}, ing["queue"]["depth"])])
+    yield ("ingest_lag_ms", "gauge", "Ingest queue lag", [({}, ing["queue"]["lag_ms"])])
+    pool = analytics_pool.stats()
+    yield ("analytics_pool_jobs", "gauge", "Analytics pool jobs by state",
+           [({"state": "running"}, pool["running"]), ({"state": "queued"}, pool["queued"])])
+    yield ("analytics_pool_busy_seconds_total", "counter", "Worker time spent on analytics jobs", [({}, pool["busy_s"])])
+    yield ("live_clients", "gauge", "Connected live websocket clients", [({}, broadcaster.stats()["clients"])])
+    yield ("process_cpu_seconds_total", "counter", "CPU time of the server process", [({}, time.process_time())])
+
+@app.get("/api/metrics")
+async def metrics_scrape():
+    # Prometheus text format; rendering reads a few counters under short locks, cheap enough for the loop
+    return Response(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/api/metrics/profiler")
+async def metrics_profiler(enabled: bool = Query(...), interval_ms: Optional[float] = Query(None, gt=0), reset: bool = False):
+    # sampling profiler toggle: enabled=true starts sampling every thread's stack, false stops it
+    # (collected stacks are kept for /api/metrics/profile until reset=true)
+    if reset:
+        metrics.PROFILER.reset()
+    if enabled:
+        metrics.PROFILER.start(interval_ms / 1000.0 if interval_ms else None)
+    else:
+        await asyncio.to_thread(metrics.PROFILER.stop)
+    return metrics.PROFILER.stats()
+
+@app.get("/api/metrics/profile")
+async def metrics_profile(reset: bool = False):
+    # collapsed stacks ("thread;frame;...;frame count"), input for flamegraph.pl or speedscope
+    body = metrics.PROFILER.collapsed()
+    if reset:
+        metrics.PROFILER.reset()
+    return Response(body, media_type="text/plain; charset=utf-8")
@@ -0,0 +1,268 @@
+# archive.py - columnar on-disk tick archive: Arrow IPC files partitioned by symbol and UTC day
+#
+# Layout: <root>/<symbol>/<YYYY-MM-DD>/part-<min_ts>-<max_ts>-<seq>.arrow
+# Parts are never modified; each compaction batch adds one per day, and once a day has collected enough small
+# parts they are replaced by a single merged one. The ts range in the file name lets reads prune parts without
+# opening them; surviving parts are memory-mapped, so a single-part read is zero-copy.
+import os
+import threading
+import time
+import numpy as np
+import pyarrow as pa
+
+NS_PER_DAY = 86_400_000_000_000
+PENDING_SUFFIX = ".pending"
+MERGE_PREFIX = "merge-"          # journal of an in-progress merge (see merge_small_parts)
+SMALL_PART_BYTES = 16 * 2**20    # parts below this size are merged...
+MERGE_MIN_PARTS = 8              # ...once a day has at least this many of them
+_SCHEMA = pa.schema([("ts", pa.timestamp("ns")), ("price", pa.float64()), ("size", pa.float64())])
+
+
+def _parse_part(name: str):
+    # part-<min_ts>-<max_ts>-<seq>.arrow -> (min_ts, max_ts)
+    stem = name[len("part-"):-len(".arrow")]
+    lo, hi, _seq = stem.split("-", 2)
+    return int(lo), int(hi)
+
+
+class TickArchive:
+    def __init__(self, root: str = "tick_archive"):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._seq = time.time_ns()
+        # readers list and open parts under _lock, and a merge swaps parts under it, so a read sees either the
+        # small parts or the merged one, never both or neither. _merge_lock serializes merges
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+
+    def symbols(self):
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def has(self, symbol: str) -> bool:
+        return os.path.isdir(os.path.join(self.root, symbol))
+
+    def _parts(self, symbol: str, start_ns=None, end_ns=None):
+        # (path, min_ts, max_ts) for committed parts overlapping [start_ns, end_ns), in day order
+        sym_dir = os.path.join(self.root, symbol)
+        if not os.path.isdir(sym_dir):
+            return []
+        day_lo = None if start_ns is None else np.datetime64(start_ns - start_ns % NS_PER_DAY, "ns").astype("datetime64[D]")
+        day_hi = None if end_ns is None else np.datetime64(end_ns, "ns").astype("datetime64[D]")
+        out = []
+        for day in sorted(os.listdir(sym_dir)):
+            d = np.datetime64(day)
+            if (day_lo is not None and d < day_lo) or (day_hi is not None and d > day_hi):
+                continue  # partition pruning
+            day_dir = os.path.join(sym_dir, day)
+            for name in sorted(os.listdir(day_dir)):
+                if not name.endswith(".arrow"):
+                    continue
+                lo, hi = _parse_part(name)
+                if (start_ns is not None and hi < start_ns) or (end_ns is not None and lo >= end_ns):
+                    continue
+                out.append((os.path.join(day_dir, name), lo, hi))
+        return out
+
+    def last_ts(self, symbol: str):
+        parts = self._parts(symbol)
+        return max(hi for _, _, hi in parts) if parts else None
+
+    def first_ts(self, symbol: str):
+        parts = self._parts(symbol)
+        return min(lo for _, lo, _ in parts) if parts else None
+
+    def last(self, symbol: str):
+        """(ts_ns, price, size) of the newest archived tick, reading only the last part."""
+        hi = self.last_ts(symbol)
+        if hi is None:
+            return None
+        ts, price, size = self.read(symbol, hi, hi + 1)
+        return (int(ts[-1]), float(price[-1]), float(size[-1])) if ts.size else None
+
+    @staticmethod
+    def _open(path: str):
+        # memory-mapped table of one part; no data is read until its columns are sliced
+        return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+    def _open_parts(self, symbol: str, start_ns=None, end_ns=None):
+        # (table, min_ts, max_ts) for committed parts overlapping [start_ns, end_ns), opened under the lock
+        with self._lock:
+            return [(self._open(p), lo, hi) for p, lo, hi in self._parts(symbol, start_ns, end_ns)]
+
+    @staticmethod
+    def _column(table, name: str) -> np.ndarray:
+        # zero-copy for the usual single-batch part; parts written in several batches are concatenated
+        col = table.column(name)
+        if col.num_chunks == 1:
+            return col.chunk(0).to_numpy(zero_copy_only=True)
+        return col.to_numpy()
+
+    @classmethod
+    def _read_part(cls, table, start_ns=None, end_ns=None):
+        # columns of one part, sliced to [start_ns, end_ns) without copying
+        ts = cls._column(table, "ts").view(np.int64)
+        price = cls._column(table, "price")
+        size = cls._column(table, "size")
+        i = int(np.searchsorted(ts, start_ns, side="left")) if start_ns is not None else 0
+        j = int(np.searchsorted(ts, end_ns, side="left")) if end_ns is not None else ts.size
+        j = max(i, j)
+        return ts[i:j], price[i:j], size[i:j]
+
+    @staticmethod
+    def _merge(cols):
+        if len(cols) == 1:
+            return cols[0]
+        ts = np.concatenate([c[0] for c in cols])
+        price = np.concatenate([c[1] for c in cols])
+        size = np.concatenate([c[2] for c in cols])
+        if np.any(ts[1:] < ts[:-1]):
+            order = np.argsort(ts, kind="stable")
+            ts, price, size = ts[order], price[order], size[order]
+        return ts, price, size
+
+    def read(self, symbol: str, start_ns=None, end_ns=None):
+        """(ts_ns, price, size) arrays for start_ns <= ts < end_ns, sorted by ts."""
+        cols = [c for c in (self._read_part(t, start_ns, end_ns) for t, _, _ in self._open_parts(symbol, start_ns, end_ns))
+                if c[0].size]
+        if not cols:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        return self._merge(cols)
+
+    def iter_blocks(self, symbol: str, start_ns=None, end_ns=None, block_rows: int = 100_000):
+        """
+        Yield (ts_ns, price, size) blocks of at most block_rows in time order, one part at a time, so memory
+        stays bounded by the largest part. Parts whose ts ranges overlap (late ticks compacted later) are
+        merged together first. Every part is opened (memory-mapped) up front, so a concurrent merge cannot
+        pull files from under the iteration.
+        """
+        parts = sorted(self._open_parts(symbol, start_ns, end_ns), key=lambda p: p[1])
+        k = 0
+        while k < len(parts):
+            group = [parts[k]]
+            hi = parts[k][2]
+            k += 1
+            while k < len(parts) and parts[k][1] <= hi:
+                group.append(parts[k])
+                hi = max(hi, parts[k][2])
+                k += 1
+            cols = [c for c in (self._read_part(t, start_ns, end_ns) for t, _, _ in group) if c[0].size]
+            if not cols:
+                continue
+            ts, price, size = self._merge(cols)
+            for i in range(0, ts.size, block_rows):
+                yield ts[i:i + block_rows], price[i:i + block_rows], size[i:i + block_rows]
+
+    def write_pending(self, symbol: str, ts_ns, price, size):
+        """
+        Write one symbol's ticks as new parts (one per UTC day) under a .pending name.
+        Returns the pending paths; call promote() once the source rows are durably removed.
+        """
+        ts_ns = np.asarray(ts_ns, dtype=np.int64)
+        price = np.asarray(price, dtype=np.float64)
+        size = np.asarray(size, dtype=np.float64)
+        order = np.argsort(ts_ns, kind="stable")
+        ts_ns, price, size = ts_ns[order], price[order], size[order]
+        days = ts_ns // NS_PER_DAY
+        brk = np.flatnonzero(days[1:] != days[:-1]) + 1
+        paths = []
+        for a, b in zip(np.concatenate(([0], brk)), np.concatenate((brk, [ts_ns.size]))):
+            if b <= a:
+                continue
+            day = str(np.datetime64(int(days[a]), "D"))
+            day_dir = os.path.join(self.root, symbol, day)
+            os.makedirs(day_dir, exist_ok=True)
+            path = self._write_part(day_dir, ts_ns[a:b], price[a:b], size[a:b])
+            paths.append(path)
+        return paths
+
+    def _write_part(self, day_dir: str, ts_ns, price, size) -> str:
+        # one sorted block as a new part under a .pending name; returns the pending path
+        self._seq += 1
+        name = f"part-{int(ts_ns[0])}-{int(ts_ns[-1])}-{self._seq}.arrow"
+        path = os.path.join(day_dir, name) + PENDING_SUFFIX
+        table = pa.Table.from_arrays(
+            [pa.array(ts_ns.view("datetime64[ns]")), pa.array(price), pa.array(size)],
+            schema=_SCHEMA,
+        )
+        with pa.OSFile(path, "wb") as f:
+            with pa.ipc.new_file(f, _SCHEMA) as w:
+                w.write_table(table)
+        return path
+
+    def merge_small_parts(self, symbol: str, max_bytes: int = SMALL_PART_BYTES, min_parts: int = MERGE_MIN_PARTS) -> int:
+        """
+        Replace each day's small parts with one merged part once there are at least min_parts of them, so reads
+        open a few large files instead of one per compaction batch. Crash-safe: the merged part is written as
+        .pending, then a journal naming it and its sources, and only then is it promoted and are the sources
+        deleted (recover() finishes or rolls back an interrupted merge). Returns the number of parts removed.
+        """
+        sym_dir = os.path.join(self.root, symbol)
+        if not os.path.isdir(sym_dir):
+            return 0
+        removed = 0
+        with self._merge_lock:
+            for day in sorted(os.listdir(sym_dir)):
+                day_dir = os.path.join(sym_dir, day)
+                small = [os.path.join(day_dir, n) for n in sorted(os.listdir(day_dir))
+                         if n.endswith(".arrow") and os.path.getsize(os.path.join(day_dir, n)) < max_bytes]
+                if len(small) < min_parts:
+                    continue
+                ts, price, size = self._merge([self._read_part(self._open(p)) for p in small])
+                pending = self._write_part(day_dir, ts, price, size)
+                self._seq += 1
+                journal = os.path.join(day_dir, f"{MERGE_PREFIX}{self._seq}")
+                with open(journal, "w") as f:
+                    f.write("\n".join([os.path.basename(pending)[:-len(PENDING_SUFFIX)]] + [os.path.basename(p) for p in small]))
+                    f.flush()
+                    os.fsync(f.fileno())
+                with self._lock:
+                    self.promote([pending])
+                    for p in small:
+                        os.remove(p)
+                os.remove(journal)
+                removed += len(small) - 1
+        return removed
+
+    @staticmethod
+    def promote(paths):
+        for p in paths:
+            os.replace(p, p[:-len(PENDING_SUFFIX)])
+
+    def recover(self, committed):
+        """
+        Resolve .pending parts left by an interrupted compaction: promote those whose source rows were
+        deleted (name in `committed`), drop the rest (their rows are still in sqlite). A merge journal whose
+        merged part was promoted gets its remaining sources deleted; otherwise the merged part is still pending
+        and is dropped with the rest.
+        """
+        for dirpath, _dirs, files in os.walk(self.root):
+            for name in files:
+                if not name.startswith(MERGE_PREFIX):
+                    continue
+                path = os.path.join(dirpath, name)
+                with open(path) as f:
+                    merged, *sources = f.read().split("\n")
+                if merged and os.path.exists(os.path.join(dirpath, merged)):
+                    for src in sources:
+                        if os.path.exists(os.path.join(dirpath, src)):
+                            os.remove(os.path.join(dirpath, src))
+                os.remove(path)
+        for dirpath, _dirs, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith(PENDING_SUFFIX):
+                    continue
+                path = os.path.join(dirpath, name)
+                if name[:-len(PENDING_SUFFIX)] in committed:
+                    os.replace(path, path[:-len(PENDING_SUFFIX)])
+                else:
+                    os.remove(path)
+
+    def stats(self) -> dict:
+        parts = 0
+        nbytes = 0
+        for dirpath, _dirs, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".arrow"):
+                    parts += 1
+                    nbytes += os.path.getsize(os.path.join(dirpath, name))
+        return {"symbols": len(self.symbols()), "parts": parts, "bytes": nbytes}
@@ -0,0 +1,246 @@
+# barcache.py - incremental OHLCV bars per (symbol, timeframe), built from TickBuffer rows as they arrive
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+import pandas as pd
+from tickbuffer import TickSnapshot
+
+BAR_COLUMNS = ["open", "high", "low", "close", "volume"]
+_MIN_BARS = 256
+
+
+def timeframe_ns(timeframe: str) -> Optional[int]:
+    """Fixed bar width in ns for pandas-style timeframes ('1s', '1min', '5min', '1h'...); None if not fixed-width."""
+    try:
+        td = pd.to_timedelta(pd.tseries.frequencies.to_offset(timeframe))
+    except (ValueError, TypeError):
+        return None
+    ns = int(td.value)
+    return ns if ns > 0 else None
+
+
+class BarSeries:
+    """
+    OHLCV bars for one symbol/timeframe, bucketed on epoch-aligned bar starts.
+    Only the newest (open) bar is ever modified; closed bars are immutable. update() consumes just the ticks
+    appended to the buffer since the last call, so a read costs O(new ticks).
+    """
+
+    def __init__(self, tf_ns: int):
+        self.tf_ns = tf_ns
+        self._ts = np.empty(_MIN_BARS, dtype=np.int64)
+        self._vals = np.empty((_MIN_BARS, 5), dtype=np.float64)  # open, high, low, close, volume
+        self._n = 0
+        self._consumed = 0
+        self._generation = -1
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def nbytes(self) -> int:
+        return self._ts.nbytes + self._vals.nbytes
+
+    def _reset(self):
+        # fresh arrays: frames handed out earlier are views of the old ones and must not be rewritten
+        self._ts = np.empty_like(self._ts)
+        self._vals = np.empty_like(self._vals)
+        self._n = 0
+        self._consumed = 0
+
+    def _trim(self, first_ts):
+        # drop bars that start before the buffer's retention window, in batches once they are at least as
+        # many as the bars kept (amortized O(1) per bar; memory stays within ~2x the window)
+        if first_ts is None or not self._n:
+            return
+        k = int(np.searchsorted(self._ts[:self._n], first_ts - first_ts % self.tf_ns, side="left"))
+        if k < max(self._n - k, _MIN_BARS):
+            return
+        live = self._n - k
+        cap = max(_MIN_BARS, 2 * live)
+        ts = np.empty(cap, dtype=np.int64)
+        vals = np.empty((cap, 5), dtype=np.float64)
+        ts[:live] = self._ts[k:self._n]
+        vals[:live] = self._vals[k:self._n]
+        self._ts, self._vals, self._n = ts, vals, live
+
+    def _reserve(self, extra: int):
+        need = self._n + extra
+        cap = self._ts.shape[0]
+        if need <= cap:
+            return
+        while cap < need:
+            cap *= 2
+        # copy-on-grow: frames handed out earlier keep referencing the old arrays
+        ts = np.empty(cap, dtype=np.int64)
+        vals = np.empty((cap, 5), dtype=np.float64)
+        ts[:self._n] = self._ts[:self._n]
+        vals[:self._n] = self._vals[:self._n]
+        self._ts, self._vals = ts, vals
+
+    @classmethod
+    def from_ticks(cls, tf_ns: int, ts, price, size) -> "BarSeries":
+        """One-off bars from sorted tick arrays (e.g. an archive window); not tied to a buffer."""
+        series = cls(tf_ns)
+        series.add_ticks(np.asarray(ts, dtype=np.int64), np.asarray(price, dtype=np.float64),
+                         np.asarray(size, dtype=np.float64))
+        return series
+
+    def add_ticks(self, ts, price, size):
+        """Fold a sorted block of ticks (newer than everything added so far) into the bars."""
+        if len(ts):
+            self._aggregate(ts, price, size)
+
+    def pop_closed(self) -> pd.DataFrame:
+        """Remove and return every bar but the open (newest) one, e.g. to stream bars with bounded memory."""
+        k = max(self._n - 1, 0)
+        index = pd.DatetimeIndex(self._ts[:k].view("datetime64[ns]").copy(), name="ts")
+        out = pd.DataFrame(self._vals[:k].copy(), index=index, columns=BAR_COLUMNS, copy=False)
+        if k:
+            self._ts[0] = self._ts[k]
+            self._vals[0] = self._vals[k]
+            self._n = 1
+        return out
+
+    def update(self, buf: TickSnapshot):
+        if buf.generation != self._generation or self._consumed > buf.appended:
+            # history was rewritten (late ticks) - rebuild from what the buffer holds
+            self._reset()
+            self._generation = buf.generation
+            self._consumed = buf.appended - len(buf)
+        new = buf.appended - self._consumed
+        if new <= 0:
+            return
+        if new > len(buf):
+            # cache fell further behind than the buffer's retention; rebuild
+            self._reset()
+            new = len(buf)
+        ts, price, size = buf.tail(new)
+        self._consumed = buf.appended
+        self._aggregate(ts, price, size)
+        self._trim(buf.first_ts())
+
+    def _aggregate(self, ts, price, size):
+        tf = self.tf_ns
+        bucket = ts - ts % tf
+        brk = np.flatnonzero(bucket[1:] != bucket[:-1]) + 1
+        starts = np.concatenate(([0], brk))
+        ends = np.concatenate((brk, [bucket.size]))
+        o = price[starts]
+        h = np.maximum.reduceat(price, starts)
+        l = np.minimum.reduceat(price, starts)
+        c = price[ends - 1]
+        v = np.add.reduceat(size, starts)
+        b = bucket[starts]
+        k = 0
+        if self._n and b[0] == self._ts[self._n - 1]:
+            # first group continues the open bar
+            row = self._vals[self._n - 1]
+            row[1] = max(row[1], h[0])
+            row[2] = min(row[2], l[0])
+            row[3] = c[0]
+            row[4] += v[0]
+            k = 1
+        m = b.size - k
+        if m:
+            self._reserve(m)
+            sl = slice(self._n, self._n + m)
+            self._ts[sl] = b[k:]
+            self._vals[sl] = np.column_stack((o[k:], h[k:], l[k:], c[k:], v[k:]))
+            self._n += m
+
+    def open_ts(self):
+        """Start (ns) of the newest bar, the one still being updated; None if empty."""
+        return int(self._ts[self._n - 1]) if self._n else None
+
+    def to_frame(self, start_ns=None, end_ns=None) -> pd.DataFrame:
+        """Bars with start_ns <= bar start < end_ns as a ts-indexed DataFrame over the cached arrays (no copy)."""
+        ts = self._ts[:self._n]
+        i = int(np.searchsorted(ts, start_ns, side="left")) if start_ns is not None else 0
+        j = int(np.searchsorted(ts, end_ns, side="left")) if end_ns is not None else self._n
+        j = max(i, j)
+        index = pd.DatetimeIndex(ts[i:j].view("datetime64[ns]"), name="ts")
+        return pd.DataFrame(self._vals[i:j], index=index, columns=BAR_COLUMNS, copy=False)
+
+
+class BarCache:
+    """
+    LRU/TTL cache of BarSeries keyed by (symbol, timeframe). Entries are created on first request and
+    evicted when more than max_entries are held or they have not been read for ttl seconds.
+    Safe to call from several threads: the O(new ticks) catch-up runs under a lock, and frames that contain
+    the open bar (the only row later updates modify) are copied before they are handed out.
+    """
+
+    def __init__(self, max_entries: int = 64, ttl: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (symbol, timeframe) -> (BarSeries, last_access)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, symbol: str, timeframe: str, buf: TickSnapshot, start_ns: int = None, end_ns: int = None) -> Optional[pd.DataFrame]:
+        """
+        Bars for symbol/timeframe brought up to date with the buffer snapshot, optionally only those starting
+        in [start_ns, end_ns); None if timeframe is not fixed-width.
+        """
+        with self._lock:
+            return self._get(symbol, timeframe, buf, start_ns, end_ns)
+
+    def _get(self, symbol, timeframe, buf, start_ns, end_ns):
+        key = (symbol, timeframe)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is None:
+            tf = timeframe_ns(timeframe)
+            if tf is None:
+                return None
+            series = BarSeries(tf)
+            self.misses += 1
+        else:
+            series = entry[0]
+            self.hits += 1
+        self._entries[key] = (series, now)
+        self._entries.move_to_end(key)
+        self._evict(now)
+        series.update(buf)
+        first = buf.first_ts()
+        start = first - first % series.tf_ns if first is not None else None
+        if start_ns is not None:
+            start = start_ns if start is None else max(start, start_ns)
+        df = series.to_frame(start, end_ns)
+        if len(df) and series.open_ts() == df.index.asi8[-1]:
+            df = df.copy()
+        return df
+
+    def _evict(self, now: float):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        while self._entries:
+            key, (_series, last) = next(iter(self._entries.items()))
+            if now - last <= self.ttl:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+    def invalidate(self, symbol: str = None):
+        with self._lock:
+            for key in [k for k in self._entries if symbol is None or k[0] == symbol]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes": sum(s.nbytes for s, _ in self._entries.values()),
+            }
@@ -0,0 +1,75 @@
+# bench_align.py - pair pipeline alignment: per-function pd.concat joins vs one align.py pass reused by every step
+# Run from backend/:  python -m benchmarks.bench_align [--bars 200000] [--fill 0.3]
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from align import align
+from analytics import hedge_ratio_ols, compute_spread, rolling_correlation
+
+T0_NS = 1_700_000_000_000 * 1_000_000
+
+
+def make_bars(bars: int, fill: float, seed: int = 0):
+    # two symbols' 1s closes on an irregular grid: each has a bar in only `fill` of the seconds
+    rng = np.random.default_rng(seed)
+    idx = pd.DatetimeIndex((T0_NS + np.arange(bars, dtype=np.int64) * 1_000_000_000).view("M8[ns]"), name="ts")
+    p = 100 + np.cumsum(rng.normal(0, 0.05, bars))
+    kx, ky = rng.random(bars) < fill, rng.random(bars) < fill
+    return (pd.Series(p[kx], index=idx[kx], name="close"),
+            pd.Series(0.5 * p[ky] + rng.normal(0, 0.02, ky.sum()), index=idx[ky], name="close"))
+
+
+def pipeline(x, y):
+    hr = hedge_ratio_ols(y, x)
+    spread = compute_spread(y, x, hr["beta"], hr["intercept"])
+    corr = rolling_correlation(x, y, 60)
+    return hr, spread, corr
+
+
+def best_of(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+def run(bars: int = 200_000, fill: float = 0.3):
+    x, y = make_bars(bars, fill)
+    joined_s, (hr0, spread0, corr0) = best_of(lambda: pipeline(x, y))
+
+    def aligned(how, stale=None):
+        al = align({"x": x, "y": y}, how, stale)
+        return pipeline(al.series("x"), al.series("y")), len(al)
+
+    aligned_s, ((hr1, spread1, corr1), n_inner) = best_of(lambda: aligned("inner"))
+    # the inner policy reproduces the per-function joins exactly
+    assert hr1 == hr0
+    assert np.array_equal(spread1.to_numpy(), spread0.to_numpy()) and spread1.index.equals(spread0.index)
+    assert np.allclose(corr1.to_numpy(), corr0.to_numpy(), equal_nan=True)
+    align_s, _ = best_of(lambda: align({"x": x, "y": y}, "inner"))
+    concat_s, _ = best_of(lambda: pd.concat([y, x], axis=1).dropna())
+    kept = {"inner": n_inner}
+    for how, stale in (("ffill", "5s"), ("ffill", None), ("asof", "5s")):
+        kept[f"{how} {stale or 'unlimited'}"] = len(align({"x": x, "y": y}, how, stale))
+    return {"joined_s": joined_s, "aligned_s": aligned_s, "align_s": align_s, "concat_s": concat_s,
+            "kept": kept, "x": len(x), "y": len(y)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bars", type=int, default=200_000)
+    ap.add_argument("--fill", type=float, default=0.3, help="share of seconds in which each symbol has a bar")
+    args = ap.parse_args()
+    r = run(args.bars, args.fill)
+    print(f"seconds={args.bars} x bars={r['x']} y bars={r['y']}")
+    print(f"  one join:  pd.concat+dropna {r['concat_s'] * 1000:7.1f}ms  align.py inner {r['align_s'] * 1000:7.1f}ms")
+    print(f"  pipeline (hedge, spread, corr): per-function joins {r['joined_s'] * 1000:7.1f}ms  "
+          f"aligned once {r['aligned_s'] * 1000:7.1f}ms")
+    print("  bars kept: " + ", ".join(f"{k}={v}" for k, v in r["kept"].items()))
+
+
+if __name__ == "__main__":
+    main()
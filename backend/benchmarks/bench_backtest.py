@@ -0,0 +1,119 @@
+# bench_backtest.py - mean-reversion backtests: vectorized engine vs the original per-bar loop
+# Run from backend/:  python -m benchmarks.bench_backtest [--bars 50000] [--pairs 4]
+# Checks that backtest_mean_reversion reproduces the loop exactly and that every backtest_sweep
+# parameter set matches a loop run (PnL, trade count), then times a full grid.
+import argparse
+import math
+import time
+import numpy as np
+import pandas as pd
+from analytics import (backtest_mean_reversion, backtest_sweep, backtest_sweep_pairs, rolling_zscore,
+                       _scan_trades, _scan_trades_loop, _scan_set)
+from workers import ProcessPool
+
+WINDOWS = list(range(20, 241, 20))
+ENTRIES = np.round(np.arange(1.0, 3.01, 0.25), 2).tolist()
+EXITS = np.round(np.arange(-0.5, 1.01, 0.25), 2).tolist()
+
+
+def loop_backtest(z: pd.Series, entry: float = 2.0, exit: float = 0.0):
+    # the original implementation, kept as the reference
+    z = z.dropna()
+    if z.empty:
+        return {"trades": [], "equity": {}}
+    position = 0
+    equity = 0.0
+    equity_curve = []
+    entry_z = None
+    trades = []
+    for ts, zval in z.items():
+        if position == 0:
+            if zval > entry:
+                position = -1
+                entry_z = zval
+                trades.append({"ts": str(ts), "side": "SHORT", "z": float(zval)})
+            elif zval < -entry:
+                position = 1
+                entry_z = zval
+                trades.append({"ts": str(ts), "side": "LONG", "z": float(zval)})
+        else:
+            if (position == -1 and zval < exit) or (position == 1 and zval > -exit):
+                pnl = (entry_z - zval) if position == -1 else (zval - entry_z)
+                equity += pnl
+                trades.append({"ts": str(ts), "side": "FLAT", "z": float(zval), "pnl": float(pnl), "equity": float(equity)})
+                position = 0
+                entry_z = None
+        equity_curve.append((str(ts), float(equity)))
+    return {"trades": trades, "equity": {ts: val for ts, val in equity_curve}}
+
+
+def make_spread(bars: int, seed: int) -> pd.Series:
+    # mean-reverting (AR(1)) spread with a slow random-walk component, 1s bars
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(0, 1, bars)
+    ar = np.empty(bars)
+    ar[0] = 0.0
+    for i in range(1, bars):
+        ar[i] = 0.98 * ar[i - 1] + noise[i]
+    return pd.Series(ar + np.cumsum(rng.normal(0, 0.05, bars)),
+                     index=pd.date_range("2024-01-01", periods=bars, freq="1s"), name="spread")
+
+
+def check(spread: pd.Series, samples: int = 40):
+    rng = np.random.default_rng(1)
+    # vectorized scan == the per-set bar loop (the kernel numba compiles when installed), run uncompiled
+    z = rolling_zscore(spread.iloc[:5000], 60).dropna().to_numpy()
+    for a, b in zip(_scan_trades(z, ENTRIES, EXITS), _scan_trades_loop(z, ENTRIES, EXITS, _scan_set)):
+        assert np.array_equal(a, b)
+    sweep = backtest_sweep(spread, WINDOWS, ENTRIES, EXITS)["results"]
+    for r in rng.choice(sweep, size=min(samples, len(sweep)), replace=False):
+        z = rolling_zscore(spread, r["window"])
+        ref = loop_backtest(z, r["entry"], r["exit"])
+        assert backtest_mean_reversion(z, r["entry"], r["exit"]) == ref, r
+        closed = [t["pnl"] for t in ref["trades"] if t["side"] == "FLAT"]
+        assert r["trades"] == len(closed) and math.isclose(r["pnl"], sum(closed), abs_tol=1e-6), (r, len(closed))
+    return len(sweep)
+
+
+def run(bars: int = 50_000, pairs: int = 4):
+    spreads = {f"pair{i}": make_spread(bars, i) for i in range(pairs)}
+    n_sets = check(spreads["pair0"])
+    z = rolling_zscore(spreads["pair0"], 60)
+    t0 = time.perf_counter()
+    loop_backtest(z)
+    loop_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    backtest_mean_reversion(z)
+    single_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    backtest_sweep(spreads["pair0"], WINDOWS, ENTRIES, EXITS)
+    sweep_s = time.perf_counter() - t0
+    kwargs = dict(windows=WINDOWS, entries=ENTRIES, exits=EXITS)
+    t0 = time.perf_counter()
+    backtest_sweep_pairs(spreads, **kwargs)
+    pairs_serial_s = time.perf_counter() - t0
+    pool = ProcessPool()
+    backtest_sweep_pairs({"warm": spreads["pair0"].iloc[:1000]}, executor=pool.executor, **kwargs)
+    t0 = time.perf_counter()
+    backtest_sweep_pairs(spreads, executor=pool.executor, **kwargs)
+    pairs_pool_s = time.perf_counter() - t0
+    pool.shutdown()
+    return {"sets": n_sets, "loop_s": loop_s, "single_s": single_s, "sweep_s": sweep_s,
+            "pairs_serial_s": pairs_serial_s, "pairs_pool_s": pairs_pool_s, "workers": pool.workers}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bars", type=int, default=50_000)
+    ap.add_argument("--pairs", type=int, default=4)
+    args = ap.parse_args()
+    r = run(args.bars, args.pairs)
+    print(f"bars={args.bars} grid={r['sets']} sets ({len(WINDOWS)} windows x {len(ENTRIES)} entries x {len(EXITS)} exits)")
+    print(f"  single backtest    loop {r['loop_s'] * 1000:8.1f}ms  vectorized {r['single_s'] * 1000:8.1f}ms")
+    print(f"  grid, one pair     {r['sweep_s'] * 1000:8.1f}ms  (loop estimate {r['loop_s'] * r['sets']:6.1f}s)")
+    print(f"  grid, {args.pairs} pairs      serial {r['pairs_serial_s'] * 1000:8.1f}ms  "
+          f"process pool ({r['workers']} workers) {r['pairs_pool_s'] * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
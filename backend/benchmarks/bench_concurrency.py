@@ -0,0 +1,152 @@
+# bench_concurrency.py - stress: live ingestion + concurrent API queries + snapshot consistency checks
+# Run from backend/:  python -m benchmarks.bench_concurrency [--seconds 10] [--clients 8] [--rate 5000] [--inline]
+# --inline runs the handlers' heavy work on the event loop (the pre-pool behaviour) for comparison.
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import httpx
+from benchmarks.bench_ingest_replay import write_recording, T0_MS
+
+SYMBOLS = 4
+HISTORY_TICKS = 100_000      # per symbol, 500ms apart, before the replayed stream
+QUERIES = [
+    "/api/analytics/pair?x=sym0&y=sym1&timeframe=1min",
+    "/api/analytics/pair?x=sym2&y=sym3&timeframe=1min&regression=kalman&max_points=500",
+    "/api/resampled/sym0?timeframe=1s&limit=1000",
+    "/api/resampled/sym1?timeframe=1min&format=columnar",
+    "/api/analytics/corr_matrix?symbols=sym0,sym1,sym2,sym3&timeframe=1min",
+]
+
+
+class InlinePool:
+    # stands in for app.analytics_pool: runs the work right on the event loop
+    async def run(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+
+def pct(values, q):
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def check_snapshots(storage, stop: threading.Event, out: dict):
+    # readers never lock: every snapshot must be sorted, and must read back identically later on
+    # however much has been appended since; bar frames must be valid OHLC
+    held = []
+    while not stop.is_set():
+        for sym, buf in storage.buffers.items():
+            snap = buf.snapshot()
+            ts, price, _ = snap.view()
+            if ts.size > 1 and np.any(ts[1:] < ts[:-1]):
+                out["violations"] += 1
+            held.append((snap, ts.size, int(ts.sum()), float(price.sum())))
+            bars = storage.export_resampled(sym, "1s")
+            if bars is not None and len(bars):
+                v = bars.to_numpy()
+                if (np.any(v[:, 1] < np.maximum(v[:, 0], v[:, 3])) or np.any(v[:, 2] > np.minimum(v[:, 0], v[:, 3]))
+                        or np.any(np.diff(bars.index.asi8) <= 0)):
+                    out["violations"] += 1
+            out["checks"] += 1
+        for snap, n, tsum, psum in held[:-8]:
+            ts, price, _ = snap.view()
+            if ts.size != n or int(ts.sum()) != tsum or float(price.sum()) != psum:
+                out["violations"] += 1
+            out["rechecks"] += 1
+        held = held[-8:]
+        time.sleep(0.005)
+
+
+async def run_load(app, seconds: float, clients: int):
+    lat = {q: [] for q in QUERIES}
+    probe, lag = [], []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+
+        async def worker(i):
+            nonlocal errors
+            k = i
+            while time.perf_counter() < deadline:
+                q = QUERIES[k % len(QUERIES)]
+                k += 1
+                t0 = time.perf_counter()
+                r = await client.get(q)
+                lat[q].append((time.perf_counter() - t0) * 1000.0)
+                if r.status_code != 200:
+                    errors += 1
+
+        async def prober():
+            # event-loop responsiveness: oversleep of a 10ms timer, and a trivial endpoint's latency
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lag.append((time.perf_counter() - t0 - 0.01) * 1000.0)
+                t0 = time.perf_counter()
+                await client.get("/api/live/stats")
+                probe.append((time.perf_counter() - t0) * 1000.0)
+
+        await asyncio.gather(prober(), *(worker(i) for i in range(clients)))
+    return lat, probe, lag, errors
+
+
+def run(seconds: float = 10.0, clients: int = 8, rate: int = 5000, inline: bool = False):
+    os.chdir(tempfile.mkdtemp())
+    import app as A  # after chdir: the app opens its sqlite file in the working directory
+    if inline:
+        A.analytics_pool = InlinePool()
+    rng = np.random.default_rng(1)
+    hist_ts = (T0_MS - HISTORY_TICKS * 500 + np.arange(HISTORY_TICKS, dtype=np.int64) * 500) * 1_000_000
+    for s in range(SYMBOLS):
+        A.storage.append_ticks(f"sym{s}", hist_ts, 100 + np.cumsum(rng.normal(0, 0.01, HISTORY_TICKS)),
+                               np.ones(HISTORY_TICKS))
+    # a recording 1ms per tick replayed at `rate` ticks/s for (a bit more than) the whole run
+    write_recording("rec.ndjson", int(rate * (seconds + 2)), SYMBOLS)
+    before = A.ingestor.stats()["queue"]["written"] if A.ingestor.loop is not None else 0
+    A.ingestor.start_replay("rec.ndjson", speed=rate / 1000.0)
+    stop = threading.Event()
+    checks = {"checks": 0, "rechecks": 0, "violations": 0}
+    checker = threading.Thread(target=check_snapshots, args=(A.storage, stop, checks), daemon=True)
+    checker.start()
+    t0 = time.perf_counter()
+    lat, probe, lag, errors = asyncio.run(run_load(A.app, seconds, clients))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    checker.join()
+    ingested = A.ingestor.stats()["queue"]["written"] - before
+    pool = A.analytics_pool.stats() if not inline else None
+    A.ingestor.stop()
+    if not inline:
+        A.analytics_pool.shutdown()
+    A.storage.close()
+    return {"seconds": elapsed, "ingest_rate": ingested / elapsed, "queries": lat, "probe_ms": probe,
+            "loop_lag_ms": lag, "errors": errors, "checks": checks, "pool": pool}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--rate", type=int, default=5000, help="replayed ticks per second")
+    ap.add_argument("--inline", action="store_true", help="heavy work on the event loop (no worker pool)")
+    args = ap.parse_args()
+    r = run(args.seconds, args.clients, args.rate, args.inline)
+    print(f"{'inline' if args.inline else 'worker pool'}: {args.clients} clients for {r['seconds']:.1f}s, "
+          f"ingesting {r['ingest_rate']:,.0f} ticks/s")
+    for q, v in r["queries"].items():
+        print(f"  {q:<78} n={len(v):4d} p50={pct(v, 50):8.1f}ms p99={pct(v, 99):8.1f}ms")
+    print(f"  event loop lag  p50={pct(r['loop_lag_ms'], 50):.1f}ms p99={pct(r['loop_lag_ms'], 99):.1f}ms "
+          f"max={max(r['loop_lag_ms'], default=float('nan')):.1f}ms")
+    print(f"  /api/live/stats p50={pct(r['probe_ms'], 50):.1f}ms p99={pct(r['probe_ms'], 99):.1f}ms")
+    c = r["checks"]
+    print(f"  snapshot checks={c['checks']} rechecks={c['rechecks']} violations={c['violations']} errors={r['errors']}")
+    if r["pool"]:
+        print(f"  pool {r['pool']}")
+    assert c["violations"] == 0 and r["errors"] == 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# bench_encoding.py - serialization time and bytes for a bar response: default records JSON vs columnar encodings
+# Run from backend/:  python -m benchmarks.bench_encoding [--bars 100000]
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from fastapi.encoders import jsonable_encoder
+import encoding
+from barcache import BAR_COLUMNS
+
+
+def synthetic_bars(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 30000 + np.cumsum(rng.normal(0, 5, n))
+    idx = pd.date_range("2024-01-01", periods=n, freq="1s", name="ts")
+    return pd.DataFrame({"open": close + rng.normal(0, 1, n), "high": close + 3, "low": close - 3,
+                         "close": close, "volume": rng.uniform(0, 10, n)}, index=idx)
+
+
+def records_json(df: pd.DataFrame) -> bytes:
+    # the default /api/resampled path: str timestamps, per-row dicts, FastAPI's encoder + json
+    out = df.reset_index()
+    out["ts"] = out["ts"].astype(str)
+    return json.dumps(jsonable_encoder({"data": out.to_dict(orient="records")})).encode()
+
+
+def columnar(fmt: str):
+    def enc(df: pd.DataFrame) -> bytes:
+        return encoding.encode({"symbol": "x", "timeframe": "1s", **encoding.columns(df)}, fmt, df).body
+    return enc
+
+
+def timed(fn, df, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = fn(df)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, len(body), body
+
+
+def run(bars: int = 100_000):
+    df = synthetic_bars(bars)
+    cases = {"records json (default)": records_json, "columnar json": columnar("columnar"), "arrow ipc": columnar("arrow")}
+    if encoding.msgpack is not None:
+        cases["msgpack"] = columnar("msgpack")
+    out = {}
+    for name, fn in cases.items():
+        secs, nbytes, body = timed(fn, df)
+        out[name] = {"seconds": secs, "bytes": nbytes}
+        if name == "arrow ipc":
+            got = pa.ipc.open_stream(body).read_all()
+            np.testing.assert_array_equal(got.column("close").to_numpy(), df["close"].to_numpy())
+        if name == "columnar json":
+            got = json.loads(body)
+            assert got["ts"][0] == df.index.asi8[0] // 1_000_000 and len(got["close"]) == bars
+    return {"bars": bars, "orjson": encoding.orjson is not None, "cases": out}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bars", type=int, default=100_000)
+    args = ap.parse_args()
+    r = run(args.bars)
+    base = r["cases"]["records json (default)"]
+    print(f"bars={r['bars']} orjson={r['orjson']} columns={['ts'] + BAR_COLUMNS}")
+    for name, c in r["cases"].items():
+        print(f"  {name:<24} {c['seconds'] * 1e3:8.1f}ms ({base['seconds'] / c['seconds']:5.1f}x) "
+              f"{c['bytes'] / 1024:9.1f}KiB ({c['bytes'] / base['bytes']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
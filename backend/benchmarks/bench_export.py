@@ -0,0 +1,59 @@
+# bench_export.py - peak memory/time of the streaming tick export vs building the whole CSV in memory
+# Run from backend/:  python -m benchmarks.bench_export [--ticks 2000000]
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import export
+from storage import TickStorage
+
+T0_NS = 1_700_000_000_000 * 1_000_000
+
+
+def measure(fn):
+    # time without tracing (tracemalloc slows allocation-heavy code a lot), then a traced run for the peak
+    t0 = time.perf_counter()
+    nbytes = fn()
+    secs = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": secs, "peak_mib": peak / 2**20, "bytes": nbytes}
+
+
+def run(ticks: int = 500_000):
+    os.chdir(tempfile.mkdtemp())
+    storage = TickStorage(db_file="bench.db")
+    rng = np.random.default_rng(0)
+    ts = T0_NS + np.arange(ticks, dtype=np.int64) * 100_000_000  # 10 ticks/s
+    storage.append_ticks("x", ts, 30000 + np.cumsum(rng.normal(0, 1, ticks)), rng.uniform(0, 1, ticks))
+    storage.compact()  # as a long-running server would have
+
+    def whole():
+        return len(storage.get_raw("x").reset_index().to_csv(index=False).encode())
+
+    def streamed(fmt):
+        def fn():
+            return sum(len(c) for c in export.encode(export.tick_frames(storage.iter_ticks("x")), fmt))
+        return fn
+
+    out = {"to_csv (previous)": measure(whole)}
+    for fmt in export.FORMATS:
+        out[f"streamed {fmt}"] = measure(streamed(fmt))
+    storage.close()
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ticks", type=int, default=500_000)
+    args = ap.parse_args()
+    for name, r in run(args.ticks).items():
+        print(f"  {name:<20} {r['seconds']:7.2f}s  peak {r['peak_mib']:8.1f}MiB  output {r['bytes'] / 2**20:8.1f}MiB")
+
+
+if __name__ == "__main__":
+    main()
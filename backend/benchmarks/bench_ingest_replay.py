@@ -0,0 +1,62 @@
+# bench_ingest_replay.py - offline ingestion throughput: replay a synthetic NDJSON recording through the Ingestor
+# Run from backend/:  python -m benchmarks.bench_ingest_replay [--ticks 200000] [--symbols 20] [--speed 0]
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from ingestion import Ingestor
+from storage import TickStorage
+
+T0_MS = 1_700_000_000_000
+
+
+def write_recording(path: str, ticks: int, symbols: int, seed: int = 0):
+    # round-robin symbols, 1ms apart, ts as epoch ms like a captured trade stream
+    rng = np.random.default_rng(seed)
+    prices = 100 + np.cumsum(rng.normal(0, 0.01, ticks))
+    with open(path, "w") as f:
+        for i in range(ticks):
+            f.write(json.dumps({"symbol": f"sym{i % symbols}", "ts": T0_MS + i, "price": float(prices[i]), "size": 1.0}) + "\n")
+
+
+def run(ticks: int = 200_000, symbols: int = 20, speed: float = 0.0):
+    os.chdir(tempfile.mkdtemp())
+    write_recording("rec.ndjson", ticks, symbols)
+    storage = TickStorage(db_file="bench.db")
+    ingestor = Ingestor(storage)
+    t0 = time.perf_counter()
+    ingestor.start_replay("rec.ndjson", speed=speed)
+    while not ingestor.sources["replay"].done:
+        time.sleep(0.01)
+    replay_s = time.perf_counter() - t0
+    while ingestor.stats()["queue"]["written"] < ticks:
+        time.sleep(0.005)
+    ingest_s = time.perf_counter() - t0
+    storage.writer.flush()
+    total_s = time.perf_counter() - t0
+    stats = ingestor.stats()
+    ingestor.stop()
+    storage.close()
+    assert stats["trades"] == ticks
+    return {"ticks": ticks, "replay_s": replay_s, "ingest_s": ingest_s, "total_s": total_s,
+            "lag_ms": stats["sources"]["replay"]["lag_ms"], "queue": stats["queue"]}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ticks", type=int, default=200_000)
+    ap.add_argument("--symbols", type=int, default=20)
+    ap.add_argument("--speed", type=float, default=0.0, help="multiple of recorded speed (0 = as fast as possible)")
+    args = ap.parse_args()
+    r = run(args.ticks, args.symbols, args.speed)
+    q = r["queue"]
+    print(f"ticks={r['ticks']} read in {r['replay_s']:.2f}s, in storage after {r['ingest_s']:.2f}s "
+          f"({r['ticks'] / r['ingest_s']:,.0f} ticks/s), durable in sqlite after {r['total_s']:.2f}s, lag={r['lag_ms']:.1f}ms")
+    print(f"queue: high_water={q['high_water']} batches={q['batches']} max_batch={q['max_batch']} "
+          f"max_lag={q['max_lag_ms']:.1f}ms dropped={q['dropped']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# bench_kalman.py - closed-form Kalman hedge filter vs the original per-step numpy-matrix loop
+# Run from backend/:  python -m benchmarks.bench_kalman [--bars 86400] [--pairs 50]
+import argparse
+import time
+import numpy as np
+import analytics
+from analytics import kalman_hedge_path
+
+
+def reference_kalman(y, x, process_var=1e-5, obs_var=1e-3):
+    # the original hedge_ratio_kalman loop (2x2 numpy matrices allocated every step), returning the beta path
+    state = np.array([0.0, 1.0])
+    P = np.eye(2)
+    Q = np.eye(2) * process_var
+    R = obs_var
+    betas = np.empty(len(y))
+    for t in range(len(y)):
+        P = P + Q
+        H = np.array([1.0, x[t]])
+        y_pred = H @ state
+        S = H @ P @ H.T + R
+        K = (P @ H.T) / S
+        state = state + K * (y[t] - y_pred)
+        P = (np.eye(2) - np.outer(K, H)) @ P
+        betas[t] = state[1]
+    return betas
+
+
+def synthetic_pairs(bars: int, pairs: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    x = 100 + np.cumsum(rng.normal(0, 0.1, (bars, pairs)), axis=0)
+    beta = 0.5 + np.cumsum(rng.normal(0, 1e-4, (bars, pairs)), axis=0)
+    y = beta * x + rng.normal(0, 0.05, (bars, pairs))
+    return y, x
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def run(bars: int = 86400, pairs: int = 50):
+    y, x = synthetic_pairs(bars, pairs)
+    # warm-up (numba compiles once per array layout, if installed)
+    kalman_hedge_path(y[:10], x[:10])
+    kalman_hedge_path(y[:10, 0], x[:10, 0])
+    ref, t_ref = timed(reference_kalman, y[:, 0], x[:, 0])
+    single, t_single = timed(kalman_hedge_path, y[:, 0], x[:, 0])
+    np.testing.assert_allclose(single["beta"], ref, rtol=1e-9, atol=1e-12)
+    # resuming from a saved state must give the same path as one uninterrupted run
+    half = bars // 2
+    first = kalman_hedge_path(y[:half, 0], x[:half, 0])
+    second = kalman_hedge_path(y[half:, 0], x[half:, 0], state=first["state"])
+    np.testing.assert_allclose(second["beta"], single["beta"][half:], rtol=1e-12)
+    batch, t_batch = timed(kalman_hedge_path, y, x)
+    np.testing.assert_allclose(batch["beta"][:, 0], ref, rtol=1e-9, atol=1e-12)
+    return {
+        "bars": bars, "pairs": pairs, "numba": analytics._kalman_run_2d_jit is not None,
+        "reference_s": t_ref, "single_s": t_single, "batch_s": t_batch,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bars", type=int, default=86400, help="bars per pair (86400 = one day of 1s bars)")
+    ap.add_argument("--pairs", type=int, default=50)
+    args = ap.parse_args()
+    r = run(args.bars, args.pairs)
+    print(f"bars={r['bars']} numba={r['numba']}")
+    print(f"  original loop, 1 pair : {r['reference_s']:.3f}s")
+    print(f"  closed-form,   1 pair : {r['single_s']:.3f}s ({r['reference_s'] / r['single_s']:.0f}x)")
+    print(f"  closed-form, {r['pairs']:>3} pairs: {r['batch_s']:.3f}s ({r['batch_s'] / r['pairs'] * 1e3:.1f}ms/pair)")
+
+
+if __name__ == "__main__":
+    main()
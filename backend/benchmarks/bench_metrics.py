@@ -0,0 +1,122 @@
+# bench_metrics.py - cost of the instrumentation: one timer observation, the tick append path with metrics on vs
+# off, a busy thread with the sampling profiler on vs off; checks the /api/metrics text format
+# Run from backend/:  python -m benchmarks.bench_metrics [--ticks 200000] [--batch 500]
+import argparse
+import re
+import tempfile
+import threading
+import time
+import os
+import numpy as np
+import metrics
+from metrics import Registry, SamplingProfiler
+from storage import TickStorage
+
+LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? [-+0-9.eEInfNa]+$')
+
+
+def per_observation(n: int = 200_000):
+    out = {}
+    for enabled in (True, False):
+        reg = Registry(enabled=enabled)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            with reg.timer("x_seconds", op="bench"):
+                pass
+        out[enabled] = (time.perf_counter() - t0) / n
+    return out
+
+
+def append_path(ticks: int, batch: int):
+    rng = np.random.default_rng(0)
+    ts = 1_700_000_000_000 * 1_000_000 + np.arange(ticks, dtype=np.int64) * 250_000_000
+    price = 100 + np.cumsum(rng.normal(0, 0.01, ticks))
+    size = rng.exponential(1.0, ticks)
+    out = {}
+    for enabled in (False, True, False, True):  # interleaved; best of two each
+        metrics.REGISTRY.enabled = enabled
+        with tempfile.TemporaryDirectory() as d:
+            st = TickStorage(os.path.join(d, "t.db"), os.path.join(d, "archive"))
+            t0 = time.perf_counter()
+            for k in range(0, ticks, batch):
+                st.append_ticks("btcusdt", ts[k:k + batch], price[k:k + batch], size[k:k + batch])
+            dt = time.perf_counter() - t0
+            st.close()
+        out[enabled] = min(out.get(enabled, dt), dt)
+    metrics.REGISTRY.enabled = True
+    return out
+
+
+def busy(seconds: float):
+    # pure-Python work in a second thread, as a request handler would be
+    done = []
+
+    def work():
+        n, t_end = 0, time.perf_counter() + seconds
+        while time.perf_counter() < t_end:
+            sum(i * i for i in range(200))
+            n += 1
+        done.append(n)
+    t = threading.Thread(target=work, name="busy")
+    t.start()
+    t.join()
+    return done[0]
+
+
+def profiler_overhead(seconds: float = 1.0, interval: float = 0.005):
+    base = busy(seconds)
+    prof = SamplingProfiler(interval)
+    prof.start()
+    sampled = busy(seconds)
+    prof.stop()
+    stacks = prof.collapsed()
+    assert prof.stats()["samples"] > 0 and "busy;" in stacks, "profiler saw no samples of the busy thread"
+    assert all(re.match(r"^.+ \d+$", l) for l in stacks.splitlines())
+    return 1.0 - sampled / base, prof.stats()
+
+
+def check_format(text: str):
+    families = {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ", 3)
+            families[name] = kind
+            continue
+        if line.startswith("#"):
+            continue
+        assert LINE.match(line), f"bad sample line: {line!r}"
+    # histogram buckets are cumulative and end in +Inf == _count
+    buckets = {}
+    for line in text.splitlines():
+        m = re.match(r'^(\w+)_bucket\{(.*)le="([^"]+)"\} (\d+)$', line)
+        if m:
+            buckets.setdefault((m.group(1), m.group(2)), []).append((m.group(3), int(m.group(4))))
+    for (name, labels), rows in buckets.items():
+        counts = [c for _, c in rows]
+        assert counts == sorted(counts) and rows[-1][0] == "+Inf", name
+        count_line = f"{name}_count{{{labels.rstrip(',')}}} " if labels else f"{name}_count "
+        assert any(l.startswith(count_line) and int(l.split()[-1]) == counts[-1] for l in text.splitlines()), name
+        assert families.get(name) == "histogram"
+    return len(families), len(buckets)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ticks", type=int, default=200_000)
+    ap.add_argument("--batch", type=int, default=500, help="ticks per append_ticks call (an ingest batch)")
+    args = ap.parse_args()
+    per = per_observation()
+    print(f"timer observation: {per[True] * 1e6:.2f}us enabled, {per[False] * 1e6:.2f}us disabled")
+    app = append_path(args.ticks, args.batch)
+    print(f"append_ticks {args.ticks} ticks in batches of {args.batch}: metrics off {app[False] * 1000:.1f}ms, "
+          f"on {app[True] * 1000:.1f}ms ({(app[True] / app[False] - 1) * 100:+.1f}%)")
+    slow, stats = profiler_overhead()
+    print(f"sampling profiler at {stats['interval_ms']}ms: {stats['samples']} samples, {stats['stacks']} stacks, "
+          f"busy thread throughput {-slow * 100:+.1f}%")
+    metrics.observe("bench_seconds", 0.003, route='/a"b\\c')
+    n_fam, n_hist = check_format(metrics.REGISTRY.render())
+    print(f"scrape format ok: {n_fam} families, {n_hist} histogram series")
+
+
+if __name__ == "__main__":
+    main()
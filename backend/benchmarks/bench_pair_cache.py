@@ -0,0 +1,64 @@
+# bench_pair_cache.py - /api/analytics/pair latency: cold (full pipeline) vs repeated polls served from the result cache
+# Run from backend/:  python -m benchmarks.bench_pair_cache [--bars 20000] [--polls 50]
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+
+T0_NS = 1_700_000_000_000 * 1_000_000
+
+
+def timed_get(client, url):
+    t0 = time.perf_counter()
+    r = client.get(url)
+    assert r.status_code == 200
+    return (time.perf_counter() - t0) * 1000.0, r.content
+
+
+def run(bars: int = 20_000, polls: int = 50):
+    os.chdir(tempfile.mkdtemp())
+    from fastapi.testclient import TestClient
+    import app as A  # after chdir: the app opens its sqlite file in the working directory
+    rng = np.random.default_rng(0)
+    ts = T0_NS + np.arange(bars, dtype=np.int64) * 1_000_000_000  # one tick per 1s bar
+    x = 100 + np.cumsum(rng.normal(0, 0.1, bars))
+    A.storage.append_ticks("x", ts, x, np.ones(bars))
+    A.storage.append_ticks("y", ts, 0.5 * x + rng.normal(0, 0.2, bars), np.ones(bars))
+    out = {}
+    with TestClient(A.app) as client:
+        for name, url in {"ols": "/api/analytics/pair?x=x&y=y&timeframe=1s",
+                          "kalman": "/api/analytics/pair?x=x&y=y&timeframe=1s&regression=kalman"}.items():
+            cold, body = timed_get(client, url)
+            warm = []
+            for _ in range(polls):
+                ms, again = timed_get(client, url)
+                assert again == body  # nothing changed: identical response
+                warm.append(ms)
+            # a tick that opens a new bar changes the data version: recomputed
+            ts_new = int(A.storage.latest("x")[0]) + 1_000_000_000
+            A.storage.append_ticks("x", [ts_new], [x[-1]], [1.0])
+            A.storage.append_ticks("y", [ts_new], [0.5 * x[-1]], [1.0])
+            after, body2 = timed_get(client, url)
+            assert body2 != body
+            out[name] = {"cold_ms": cold, "warm_p50_ms": float(np.median(warm)), "after_new_bar_ms": after}
+        out["cache"] = client.get("/api/analytics/cache").json()
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bars", type=int, default=20_000)
+    ap.add_argument("--polls", type=int, default=50)
+    args = ap.parse_args()
+    r = run(args.bars, args.polls)
+    print(f"bars={args.bars} polls={args.polls}")
+    for name in ("ols", "kalman"):
+        c = r[name]
+        print(f"  {name:<7} cold {c['cold_ms']:8.1f}ms  warm p50 {c['warm_p50_ms']:6.2f}ms "
+              f"({c['cold_ms'] / c['warm_p50_ms']:6.0f}x)  after new bar {c['after_new_bar_ms']:8.1f}ms")
+    print(f"  cache hit_rate={r['cache']['hit_rate']} entries={r['cache']['entries']} bytes={r['cache']['bytes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# bench_pair_state.py - PairState (streaming) vs the batch pair functions: agreement check + per-bar cost
+# Run from backend/:  python -m benchmarks.bench_pair_state [--bars 20000] [--window 60]
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from analytics import PairState, hedge_ratio_ols, compute_spread, rolling_zscore, rolling_correlation
+
+RTOL = 1e-6
+
+
+def synthetic_pair(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range("2024-01-01", periods=n, freq="1s", name="ts")
+    x = pd.Series(30000 + np.cumsum(rng.normal(0, 10, n)), index=idx)
+    y = pd.Series(0.05 * x.values + np.cumsum(rng.normal(0, 0.5, n)) + 100, index=idx)
+    return x, y
+
+
+def check(ps: PairState, x: pd.Series, y: pd.Series, window: int):
+    # the streaming state must reproduce the last value of each batch function
+    hr = hedge_ratio_ols(y, x)
+    got = ps.hedge()
+    for k in ("beta", "intercept", "rsq"):
+        np.testing.assert_allclose(got[k], hr[k], rtol=RTOL)
+    spread = compute_spread(y, x, hr["beta"], hr["intercept"])
+    np.testing.assert_allclose(ps.spread(), spread.iloc[-1], rtol=RTOL, atol=1e-8)
+    np.testing.assert_allclose(ps.zscore(), rolling_zscore(spread, window).iloc[-1], rtol=RTOL, atol=1e-8)
+    np.testing.assert_allclose(ps.corr(), rolling_correlation(x, y, window).iloc[-1], rtol=RTOL)
+
+
+def run(bars: int = 20000, window: int = 60, checks: int = 5):
+    x, y = synthetic_pair(bars)
+    ps = PairState(window=window)
+    step = bars // checks
+    stream_s = 0.0
+    batch_s = 0.0
+    for end in range(step, bars + 1, step):
+        t0 = time.perf_counter()
+        ps.update_many(x.values[end - step:end], y.values[end - step:end])
+        stream_s += time.perf_counter() - t0
+        xs, ys = x.iloc[:end], y.iloc[:end]
+        t0 = time.perf_counter()
+        hr = hedge_ratio_ols(ys, xs)
+        spread = compute_spread(ys, xs, hr["beta"], hr["intercept"])
+        rolling_zscore(spread, window)
+        rolling_correlation(xs, ys, window)
+        batch_s += time.perf_counter() - t0
+        check(ps, xs, ys, window)
+    return {"bars": bars, "stream_us_per_bar": stream_s / bars * 1e6, "batch_ms_per_call": batch_s / checks * 1e3}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bars", type=int, default=20000)
+    ap.add_argument("--window", type=int, default=60)
+    args = ap.parse_args()
+    r = run(args.bars, args.window)
+    print(f"agreement ok (rtol={RTOL}); bars={r['bars']} stream={r['stream_us_per_bar']:.2f}us/bar "
+          f"batch recompute={r['batch_ms_per_call']:.1f}ms/call")
+
+
+if __name__ == "__main__":
+    main()
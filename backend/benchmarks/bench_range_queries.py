@@ -0,0 +1,70 @@
+# bench_range_queries.py - full-history vs range/downsampled responses for /api/resampled and /api/analytics/pair
+# Run from backend/:  python -m benchmarks.bench_range_queries [--bars 100000] [--window 3600] [--max-points 1000]
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from fastapi.testclient import TestClient
+
+T0_MS = 1_700_000_000_000
+
+
+def load(storage, bars: int, seed: int = 0):
+    # one tick per second per symbol -> `bars` 1s bars
+    rng = np.random.default_rng(seed)
+    ts = (T0_MS + np.arange(bars, dtype=np.int64) * 1000) * 1_000_000
+    x = 30000 + np.cumsum(rng.normal(0, 5, bars))
+    y = 0.05 * x + np.cumsum(rng.normal(0, 0.2, bars))
+    storage.append_ticks("x", ts, x, np.ones(bars))
+    storage.append_ticks("y", ts, y, np.ones(bars))
+
+
+def timed_get(client, url: str):
+    t0 = time.perf_counter()
+    r = client.get(url)
+    assert r.status_code == 200, r.text
+    return time.perf_counter() - t0, len(r.content), r.json()
+
+
+def run(bars: int = 100_000, window: int = 3600, max_points: int = 1000):
+    os.chdir(tempfile.mkdtemp())
+    import app as A
+    load(A.storage, bars)
+    client = TestClient(A.app)
+    client.get("/api/resampled/x?timeframe=1s")  # warm the bar cache
+    start_ms = T0_MS + (bars - window) * 1000
+    cases = {
+        "resampled full": "/api/resampled/x?timeframe=1s",
+        f"resampled last {window} bars": f"/api/resampled/x?timeframe=1s&start={start_ms}",
+        f"resampled full, max_points={max_points}": f"/api/resampled/x?timeframe=1s&max_points={max_points}",
+        "pair full": "/api/analytics/pair?x=x&y=y&timeframe=1s&regression=kalman",
+        f"pair full, max_points={max_points}": f"/api/analytics/pair?x=x&y=y&timeframe=1s&regression=kalman&max_points={max_points}",
+        f"pair last {window} bars": f"/api/analytics/pair?x=x&y=y&timeframe=1s&regression=kalman&start={start_ms}",
+    }
+    out = {}
+    for name, url in cases.items():
+        secs, nbytes, body = timed_get(client, url)
+        out[name] = {"seconds": secs, "bytes": nbytes}
+        if "max_points" in url and name.startswith("resampled"):
+            # merged candles keep the exact range
+            data = body["data"]
+            assert len(data) <= max_points
+            full = A.storage.export_resampled("x", "1s")
+            assert max(d["high"] for d in data) == full["high"].max()
+            assert min(d["low"] for d in data) == full["low"].min()
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bars", type=int, default=100_000, help="1s bars per symbol")
+    ap.add_argument("--window", type=int, default=3600, help="bars in the ranged queries")
+    ap.add_argument("--max-points", type=int, default=1000)
+    args = ap.parse_args()
+    for name, r in run(args.bars, args.window, args.max_points).items():
+        print(f"  {name:<38} {r['seconds'] * 1e3:9.1f}ms {r['bytes'] / 1024:10.1f}KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# bench_scan.py - cointegration scan: one pair test per pair, sequentially (the old one-request-per-pair
+# workflow) vs POST /api/analytics/scan (correlation prefilter + process pool)
+# Run from backend/:  python -m benchmarks.bench_scan [--symbols 16] [--bars 3000] [--min-corr 0.5]
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+
+T0_NS = 1_700_000_000_000 * 1_000_000
+
+
+def make_universe(storage, symbols: int, bars: int, seed: int = 0):
+    # a few independent factors; each symbol tracks one factor with either stationary noise (cointegrated
+    # with its factor's other members) or a random-walk drift (correlated but not cointegrated)
+    rng = np.random.default_rng(seed)
+    ts = T0_NS + np.arange(bars, dtype=np.int64) * 1_000_000_000
+    factors = 100 + np.cumsum(rng.normal(0, 0.1, (4, bars)), axis=1)
+    planted = set()
+    members = {}
+    for k in range(symbols):
+        f = k % 4
+        stationary = k % 3 != 2
+        noise = rng.normal(0, 0.05, bars) if stationary else np.cumsum(rng.normal(0, 0.05, bars))
+        storage.append_ticks(f"s{k}", ts, (1 + k % 5 * 0.25) * factors[f] + noise, np.ones(bars))
+        if stationary:
+            planted |= {(m, f"s{k}") for m in members.get(f, [])}
+            members.setdefault(f, []).append(f"s{k}")
+    return [f"s{k}" for k in range(symbols)], planted
+
+
+def run(symbols: int = 16, bars: int = 3000, min_corr: float = 0.5):
+    os.chdir(tempfile.mkdtemp())
+    from fastapi.testclient import TestClient
+    import app as A  # after chdir: the app opens its sqlite file in the working directory
+    from scanner import test_pairs
+    syms, planted = make_universe(A.storage, symbols, bars)
+    closes = np.column_stack([A.storage.export_resampled(s, "1s")["close"].to_numpy() for s in syms])
+    all_pairs = [(i, j) for i in range(symbols) for j in range(i + 1, symbols)]
+    t0 = time.perf_counter()
+    keys = A.storage.export_resampled(syms[0], "1s").index.asi8
+    sequential = {(r["x"], r["y"]): r for r in test_pairs(keys, closes, syms, all_pairs)}
+    sequential_s = time.perf_counter() - t0
+    with TestClient(A.app) as client:
+        t0 = time.perf_counter()
+        jid = client.post("/api/analytics/scan", json={"symbols": syms, "min_corr": min_corr}).json()["id"]
+        first_s = None
+        while True:
+            status = client.get(f"/api/analytics/scan/{jid}").json()
+            if status["done"] and first_s is None:
+                first_s = time.perf_counter() - t0
+            if status["state"] != "running":
+                break
+            time.sleep(0.05)
+        scan_s = time.perf_counter() - t0
+        # the stream replays every event of the finished job
+        events = [json.loads(line) for line in client.get(f"/api/analytics/scan/{jid}/stream").text.splitlines()]
+        workers = client.get("/api/workers/stats").json()["processes"]["workers"]
+    final = events[-1]
+    assert final["type"] == "done" and final["done"] == final["total"], final
+    # same numbers as testing the pair on its own
+    for r in final["ranked"]:
+        ref = sequential[(r["x"], r["y"])]
+        assert all(r[k] == ref[k] for k in ("beta", "pvalue", "half_life")), (r, ref)
+    top = [(r["x"], r["y"]) for r in final["ranked"][:len(planted)]]
+    found = sum(p in planted for p in top)
+    return {"pairs": len(all_pairs), "tested": final["total"], "sequential_s": sequential_s, "scan_s": scan_s,
+            "first_result_s": first_s, "planted": len(planted), "found": found, "workers": workers,
+            "progress_events": sum(e["type"] == "result" for e in events)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--symbols", type=int, default=16)
+    ap.add_argument("--bars", type=int, default=3000)
+    ap.add_argument("--min-corr", type=float, default=0.5)
+    args = ap.parse_args()
+    r = run(args.symbols, args.bars, args.min_corr)
+    print(f"symbols={args.symbols} bars={args.bars} pairs={r['pairs']}")
+    print(f"  sequential pair tests   {r['sequential_s']:7.2f}s")
+    print(f"  scan (min_corr={args.min_corr})    {r['scan_s']:7.2f}s  tested {r['tested']} pairs on {r['workers']} "
+          f"worker processes, first result after {r['first_result_s']:.2f}s, {r['progress_events']} progress events")
+    print(f"  planted cointegrated pairs in the top {r['planted']}: {r['found']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# bench_tick_buffer.py - ticks/sec of TickBuffer.append as the buffer fills up to its 7-day retention window
+# Run from backend/:  python -m benchmarks.bench_tick_buffer [--rate 5] [--days 7]
+import argparse
+import time
+import numpy as np
+from tickbuffer import TickBuffer
+
+NS_PER_S = 1_000_000_000
+
+
+def run(rate: float = 5.0, days: float = 7.0, checkpoints: int = 14):
+    n = int(rate * days * 86400)
+    rng = np.random.default_rng(0)
+    # event timestamps at `rate` ticks/sec of simulated time, random-walk prices
+    ts = (np.arange(n, dtype=np.int64) * int(NS_PER_S / rate)) + 1_700_000_000 * NS_PER_S
+    price = 100.0 + np.cumsum(rng.normal(0, 0.01, n))
+    size = rng.exponential(1.0, n)
+    buf = TickBuffer()
+    step = max(n // checkpoints, 1)
+    results = []
+    for start in range(0, step * checkpoints, step):
+        end = start + step
+        # feed python scalars, as the ingest path does
+        t_ts, t_p, t_s = ts[start:end].tolist(), price[start:end].tolist(), size[start:end].tolist()
+        t0 = time.perf_counter()
+        append = buf.append
+        for i in range(end - start):
+            append(t_ts[i], t_p[i], t_s[i])
+        dt = time.perf_counter() - t0
+        filled_days = (ts[end - 1] - ts[0]) / NS_PER_S / 86400
+        results.append({"filled_days": round(filled_days, 2), "rows": len(buf), "ticks_per_sec": (end - start) / dt})
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rate", type=float, default=5.0, help="simulated ticks per second")
+    ap.add_argument("--days", type=float, default=7.0)
+    args = ap.parse_args()
+    for r in run(args.rate, args.days):
+        print(f"filled={r['filled_days']:>6.2f}d rows={r['rows']:>10d} ticks/sec={r['ticks_per_sec']:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+# suite.py - reproducible benchmark suite over deterministic synthetic data (benchmarks/synthetic.py), fully offline:
+# ingestion, export_resampled vs history size, every analytics function at 1k/100k/1M bars, HTTP endpoints through
+# an in-process client and /ws/live fan-out. Results go to one JSON file per run for comparison between commits.
+# Run from backend/:  python -m benchmarks.suite [--quick] [--groups ingest,export,analytics,http,ws]
+#                     [--sizes 1000,100000,1000000] [--out FILE] [--compare BASELINE.json] [--threshold 0.25]
+# Default output: benchmarks/results/<commit>.json. --compare prints new/baseline ratios and exits with status 1
+# when a measurement got slower by more than --threshold (and by at least --min-delta-ms).
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import TickGenerator, merged, write_ndjson, NS_PER_S, NS_PER_MS
+
+GROUPS = ("ingest", "export", "analytics", "http", "ws")
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# adfuller's lag search builds (bars x maxlag) designs per candidate lag: ~35s at 100k bars, and 1M bars
+# exhausts memory on an 8 GB machine. Larger sizes are recorded as skipped unless --no-caps.
+SIZE_CAPS = {"adf_test": 100_000}
+
+FULL = {"sizes": [1_000, 100_000, 1_000_000], "symbols": 8, "rate": 5.0, "ingest_ticks": 1_000_000,
+        "tick_calls": 20_000, "batch": 500, "ndjson_ticks": 200_000, "histories": [10_000, 100_000, 1_000_000],
+        "http_bars": 20_000, "http_requests": 30, "ws_clients": [1, 16, 64], "ws_rounds": 10}
+QUICK = {"sizes": [1_000, 10_000], "symbols": 4, "rate": 5.0, "ingest_ticks": 100_000,
+         "tick_calls": 5_000, "batch": 500, "ndjson_ticks": 50_000, "histories": [10_000, 100_000],
+         "http_bars": 5_000, "http_requests": 10, "ws_clients": [1, 16], "ws_rounds": 5}
+
+
+def measure(fn, setup=None, min_time: float = 0.25, max_repeat: int = 25) -> dict:
+    """
+    Times fn() (or fn(setup()) when setup is given; setup is not timed) at least once, then again until
+    min_time has been spent or max_repeat calls were made. best_s is the least noisy figure, median_s the
+    one used by --compare.
+    """
+    times = []
+    while not times or (sum(times) < min_time and len(times) < max_repeat):
+        arg = setup() if setup is not None else None
+        t0 = time.perf_counter()
+        fn(arg) if setup is not None else fn()
+        times.append(time.perf_counter() - t0)
+    return {"best_s": min(times), "median_s": statistics.median(times), "repeat": len(times)}
+
+
+class Results:
+    def __init__(self):
+        self.records = []
+
+    def add(self, group: str, name: str, params: dict, **values):
+        rec = {"group": group, "name": name, "params": params, **values}
+        self.records.append(rec)
+        shown = ", ".join(f"{k}={v}" for k, v in params.items())
+        if "skipped" in values:
+            print(f"  {group:9} {name:28} {shown:32} skipped: {values['skipped']}", flush=True)
+            return
+        extra = "".join(f"  {k}={v:,.0f}" for k, v in values.items() if k.endswith("_per_s"))
+        print(f"  {group:9} {name:28} {shown:32} median {values['median_s'] * 1000:10.3f}ms"
+              f"  best {values['best_s'] * 1000:10.3f}ms{extra}", flush=True)
+
+
+def key(rec: dict) -> str:
+    return f"{rec['group']}/{rec['name']}" + json.dumps(rec["params"], sort_keys=True)
+
+
+def fresh_storage(tmp: str, name: str):
+    from storage import TickStorage
+    d = os.path.join(tmp, name)
+    os.makedirs(d, exist_ok=True)
+    return TickStorage(db_file=os.path.join(d, "ticks.db"), archive_dir=os.path.join(d, "archive"))
+
+
+def bench_ingest(cfg: dict, res: Results, tmp: str, seed: int):
+    gen = TickGenerator(cfg["symbols"], rate=cfg["rate"], seed=seed)
+    ticks = gen.ticks(cfg["ingest_ticks"] / (cfg["symbols"] * cfg["rate"]))
+    syms, ts, price, size = merged(ticks)
+    n = ts.size
+
+    # append_tick: one Python call per tick with an ISO timestamp (the original per-trade path)
+    k = min(cfg["tick_calls"], n)
+    iso = np.datetime_as_string(ts[:k].view("M8[ns]"), unit="ms").tolist()
+    rows = list(zip(syms[:k].tolist(), iso, price[:k].tolist(), size[:k].tolist()))
+    st = fresh_storage(tmp, "append_tick")
+    t0 = time.perf_counter()
+    for s, t, p, q in rows:
+        st.append_tick(s, t, p, q)
+    dt = time.perf_counter() - t0
+    st.writer.flush()
+    durable = time.perf_counter() - t0
+    st.close()
+    res.add("ingest", "append_tick", {"ticks": k}, best_s=dt, median_s=dt, repeat=1, ticks_per_s=k / dt,
+            durable_s=durable)
+
+    # append_ticks: ingest-sized batches split per symbol, as Ingestor._write_batch does
+    calls = []
+    for a in range(0, n, cfg["batch"]):
+        b = slice(a, a + cfg["batch"])
+        codes, names = pd.factorize(syms[b])
+        for c, s in enumerate(names):
+            m = codes == c
+            calls.append((s, ts[b][m], price[b][m], size[b][m]))
+    st = fresh_storage(tmp, "append_ticks")
+    t0 = time.perf_counter()
+    for s, t, p, q in calls:
+        st.append_ticks(s, t, p, q)
+    dt = time.perf_counter() - t0
+    st.writer.flush()
+    durable = time.perf_counter() - t0
+    st.close()
+    res.add("ingest", "append_ticks", {"ticks": n, "batch": cfg["batch"]}, best_s=dt, median_s=dt, repeat=1,
+            ticks_per_s=n / dt, durable_s=durable)
+
+    # bulk load: the NDJSON upload path
+    small = TickGenerator(cfg["symbols"], rate=cfg["rate"], seed=seed).ticks(
+        cfg["ndjson_ticks"] / (cfg["symbols"] * cfg["rate"]))
+    path = os.path.join(tmp, "ticks.ndjson")
+    write_ndjson(path, small)
+    m = sum(v[0].size for v in small.values())
+    st = fresh_storage(tmp, "ndjson")
+    t0 = time.perf_counter()
+    with open(path) as f:
+        stats = st.load_ndjson_stream(f)
+    dt = time.perf_counter() - t0
+    st.close()
+    assert stats["loaded"] == m
+    res.add("ingest", "load_ndjson_stream", {"ticks": m}, best_s=dt, median_s=dt, repeat=1, ticks_per_s=m / dt)
+
+
+def check_epoch_bins(st, ts, price, size):
+    # bar cache bins start at multiples of the width since the epoch; they must match pandas resample(origin="epoch"),
+    # including widths that don't divide a day (where pandas' default start_day origin would differ)
+    from analytics import resample_ticks_to_ohlcv
+    ticks = pd.DataFrame({"price": price, "size": size}, index=pd.DatetimeIndex(ts.view("datetime64[ns]")))
+    for tf in ("13s", "7min", "1min"):
+        got = st.export_resampled("x", tf)
+        ref = resample_ticks_to_ohlcv(ticks, tf)
+        assert np.array_equal(got.index.as_unit("ns").asi8, ref.index.as_unit("ns").asi8), tf
+        assert np.allclose(got.to_numpy(), ref[got.columns].to_numpy()), tf
+
+
+def bench_export(cfg: dict, res: Results, tmp: str, seed: int):
+    for hist in cfg["histories"]:
+        gen = TickGenerator(["x"], rate=cfg["rate"], seed=seed)
+        ts, price, size = gen.ticks(hist / cfg["rate"])["x"]
+        st = fresh_storage(tmp, f"export_{hist}")
+        st.append_ticks("x", ts, price, size)
+        params = {"ticks": int(ts.size)}
+        check_epoch_bins(st, ts, price, size)
+        for tf in ("1s", "1min"):
+            p = dict(params, timeframe=tf)
+            # cold: bars built from every tick in the buffer
+            res.add("export", "export_resampled_cold", p,
+                    **measure(lambda _: st.export_resampled("x", tf), setup=lambda: st.bar_cache.invalidate("x")))
+            # warm: nothing new since the last read (a cache slice)
+            st.export_resampled("x", tf)
+            res.add("export", "export_resampled_warm", p, **measure(lambda: st.export_resampled("x", tf)))
+            # incremental: one new tick since the last read
+            nxt = [int(st.latest("x")[0])]
+
+            def one_tick():
+                nxt[0] += 200 * NS_PER_MS
+                st.append_ticks("x", [nxt[0]], [price[-1]], [1.0])
+            res.add("export", "export_resampled_new_tick", p,
+                    **measure(lambda _: st.export_resampled("x", tf), setup=one_tick))
+            # range: the last hour only
+            start = nxt[0] - 3600 * NS_PER_S
+            res.add("export", "export_resampled_last_hour", p,
+                    **measure(lambda: st.export_resampled("x", tf, start, None)))
+        st.close()
+
+
+def analytics_cases(n: int, seed: int):
+    from analytics import (resample_ticks_to_ohlcv, hedge_ratio_ols, hedge_ratio_kalman, kalman_hedge_path,
+                           compute_spread, rolling_zscore, adf_test, half_life, rolling_correlation,
+                           backtest_mean_reversion, backtest_sweep, correlation_matrix, PairState, CorrelationEngine)
+    closes = TickGenerator(4, corr=0.9, seed=seed).closes(n)
+    x, y = closes["sym0"], closes["sym1"]
+    hr = hedge_ratio_ols(y, x)
+    spread = compute_spread(y, x, hr["beta"], hr["intercept"])
+    z = rolling_zscore(spread, 60)
+    ticks = pd.DataFrame({"price": x.to_numpy(), "size": 1.0}, index=x.index)
+    series = {s: closes[s] for s in closes.columns}
+    return {
+        "resample_ticks_to_ohlcv": lambda: resample_ticks_to_ohlcv(ticks, "1min"),
+        "hedge_ratio_ols": lambda: hedge_ratio_ols(y, x),
+        "hedge_ratio_kalman": lambda: hedge_ratio_kalman(y, x),
+        "kalman_hedge_path": lambda: kalman_hedge_path(y.to_numpy(), x.to_numpy()),
+        "compute_spread": lambda: compute_spread(y, x, hr["beta"], hr["intercept"]),
+        "rolling_zscore": lambda: rolling_zscore(spread, 60),
+        "adf_test": lambda: adf_test(spread),
+        "half_life": lambda: half_life(spread),
+        "rolling_correlation": lambda: rolling_correlation(x, y, 60),
+        "backtest_mean_reversion": lambda: backtest_mean_reversion(z),
+        "backtest_sweep": lambda: backtest_sweep(spread, (30, 60, 120), (1.5, 2.0, 2.5), (0.0, 0.5)),
+        "correlation_matrix": lambda: correlation_matrix(series),
+        "PairState.update_many": lambda: PairState(60).update_many(x.to_numpy(), y.to_numpy()),
+        "CorrelationEngine.update": lambda: CorrelationEngine(list(closes.columns)).update(closes.to_numpy()),
+    }
+
+
+def bench_analytics(cfg: dict, res: Results, seed: int, caps: bool = True):
+    for n in cfg["sizes"]:
+        for name, fn in analytics_cases(n, seed).items():
+            if caps and n > SIZE_CAPS.get(name, n):
+                res.add("analytics", name, {"bars": n}, skipped=f"above the {SIZE_CAPS[name]:,} bar cap (--no-caps)")
+                continue
+            res.add("analytics", name, {"bars": n}, **measure(fn))
+
+
+def bench_app(cfg: dict, res: Results, groups, seed: int):
+    # http and ws share one app instance: its lifespan (pools, storage) runs once per process
+    from fastapi.testclient import TestClient
+    import app as A  # after the chdir to the temp dir: the app opens its sqlite file in the working directory
+    n = cfg["http_bars"]
+    closes = TickGenerator(4, corr=0.9, seed=seed).closes(n)
+    ts = closes.index.asi8
+    for s in closes.columns:
+        A.storage.append_ticks(s, ts, closes[s].to_numpy(), np.ones(n))  # one tick per 1s bar
+    syms = ",".join(closes.columns)
+    endpoints = {
+        "symbols": "/api/symbols",
+        "resampled_json": "/api/resampled/sym0?timeframe=1s",
+        "resampled_arrow": "/api/resampled/sym0?timeframe=1s&format=arrow",
+        "resampled_max_points": "/api/resampled/sym0?timeframe=1s&max_points=1000",
+        "pair_ols": "/api/analytics/pair?x=sym0&y=sym1&timeframe=1s",
+        "pair_kalman": "/api/analytics/pair?x=sym0&y=sym1&timeframe=1s&regression=kalman",
+        "corr_matrix": f"/api/analytics/corr_matrix?symbols={syms}&timeframe=1s",
+        "backtest_sweep": "/api/analytics/backtest_sweep?pairs=sym0/sym1&timeframe=1s&windows=30,60&entry=1.5,2&exit=0",
+        "storage_stats": "/api/storage/stats",
+        "metrics": "/api/metrics",
+    }
+    with TestClient(A.app) as client:
+        if "http" in groups:
+            for name, url in endpoints.items():
+                lat = []
+                for _ in range(cfg["http_requests"] + 1):
+                    t0 = time.perf_counter()
+                    r = client.get(url)
+                    lat.append(time.perf_counter() - t0)
+                    assert r.status_code == 200, (url, r.status_code, r.text[:200])
+                # the first request is cold (bar and result caches empty); the rest are repeated polls
+                warm = lat[1:]
+                res.add("http", name, {"bars": n}, best_s=min(warm), median_s=statistics.median(warm),
+                        p95_s=float(np.percentile(warm, 95)), cold_s=lat[0], repeat=len(warm))
+        if "ws" in groups:
+            bench_ws(cfg, res, client, A)
+
+
+def bench_ws(cfg: dict, res: Results, client, A):
+    # time from a tick that opens a new 1s bar until every subscribed client has received that bar's delta
+    interval = A.broadcaster.interval
+    A.broadcaster.interval = 0.005  # so the broadcaster's sleep does not dominate the figure
+    try:
+        for k in cfg["ws_clients"]:
+            sessions = []
+            for _ in range(k):
+                cm = client.websocket_connect("/ws/live")
+                ws = cm.__enter__()
+                # bar deltas are unthrottled; prices keep their 1s default so they don't flood the readers
+                ws.send_json({"op": "subscribe", "symbols": ["sym0"], "timeframe": "1s"})
+                sessions.append((cm, ws))
+            for _, ws in sessions:
+                while ws.receive_json()["type"] != "bars":  # the subscribe snapshot
+                    pass
+            times, tick_ms = [], []
+            for _ in range(cfg["ws_rounds"]):
+                new = int(A.storage.latest("sym0")[0]) + NS_PER_S
+                t0 = time.perf_counter()
+                A.storage.append_ticks("sym0", [new], [100.0], [1.0])
+                for _, ws in sessions:
+                    while True:
+                        m = ws.receive_json()
+                        if m["type"] == "bars" and m["ts"][-1] * NS_PER_MS >= new:
+                            break
+                times.append(time.perf_counter() - t0)
+                tick_ms.append(A.broadcaster.last_tick_ms)
+            for cm, _ in sessions:
+                cm.__exit__(None, None, None)
+            res.add("ws", "live_bar_fanout", {"clients": k}, best_s=min(times), median_s=statistics.median(times),
+                    repeat=len(times), broadcaster_tick_ms=statistics.median(tick_ms))
+    finally:
+        A.broadcaster.interval = interval
+
+
+def environment(args, cfg) -> dict:
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=BACKEND, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {"commit": git("rev-parse", "--short", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--", ".")),
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"), "python": platform.python_version(),
+            "numpy": np.__version__, "pandas": pd.__version__, "numba": numba_version, "platform": platform.platform(),
+            "cpus": os.cpu_count(), "seed": args.seed, "quick": args.quick, "config": cfg}
+
+
+def compare(records, baseline_path: str, threshold: float, min_delta_ms: float) -> int:
+    with open(baseline_path) as f:
+        base = {key(r): r for r in json.load(f)["results"] if "median_s" in r}
+    regressions = 0
+    print(f"\ncompared with {baseline_path} (median; regression = >{threshold:.0%} and >{min_delta_ms}ms slower)")
+    for r in records:
+        b = base.pop(key(r), None)
+        if "median_s" not in r:
+            continue
+        label = f"{r['group']}/{r['name']} " + ",".join(f"{k}={v}" for k, v in r["params"].items())
+        if b is None:
+            print(f"  {label:60} new")
+            continue
+        ratio = r["median_s"] / b["median_s"] if b["median_s"] > 0 else float("inf")
+        slower = ratio > 1 + threshold and (r["median_s"] - b["median_s"]) * 1000 > min_delta_ms
+        regressions += slower
+        print(f"  {label:60} {b['median_s'] * 1000:10.3f}ms -> {r['median_s'] * 1000:10.3f}ms  x{ratio:5.2f}"
+              + ("  REGRESSION" if slower else ""))
+    for k in base:
+        print(f"  {k:60} not measured in this run")
+    print(f"{regressions} regression(s)")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--quick", action="store_true", help="smaller sizes (well under a minute)")
+    ap.add_argument("--groups", default=",".join(GROUPS))
+    ap.add_argument("--sizes", default=None, help="analytics bar counts, e.g. 1000,100000,1000000")
+    ap.add_argument("--no-caps", action="store_true", help=f"run every size even above {SIZE_CAPS}")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="results JSON (default benchmarks/results/<commit>.json)")
+    ap.add_argument("--compare", default=None, help="baseline results JSON")
+    ap.add_argument("--threshold", type=float, default=0.25)
+    ap.add_argument("--min-delta-ms", type=float, default=0.5)
+    args = ap.parse_args()
+    groups = [g for g in args.groups.split(",") if g]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        ap.error(f"unknown groups {sorted(unknown)}; choose from {GROUPS}")
+    cfg = dict(QUICK if args.quick else FULL)
+    if args.sizes:
+        cfg["sizes"] = [int(s) for s in args.sizes.split(",")]
+    env = environment(args, cfg)
+    out = os.path.abspath(args.out or os.path.join(BACKEND, "benchmarks", "results",
+                                                   f"{env['commit'] or 'nogit'}{'-dirty' if env['dirty'] else ''}.json"))
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    tmp = tempfile.mkdtemp(prefix="bench_suite_")
+    os.chdir(tmp)  # everything the benchmarks write (sqlite, archives, the app's db) stays in here
+    res = Results()
+    t0 = time.perf_counter()
+    print(f"commit {env['commit']}{' (dirty)' if env['dirty'] else ''}, python {env['python']}, "
+          f"numpy {env['numpy']}, pandas {env['pandas']}, {env['cpus']} cpus")
+    if "ingest" in groups:
+        bench_ingest(cfg, res, tmp, args.seed)
+    if "export" in groups:
+        bench_export(cfg, res, tmp, args.seed)
+    if "analytics" in groups:
+        bench_analytics(cfg, res, args.seed, caps=not args.no_caps)
+    if "http" in groups or "ws" in groups:
+        bench_app(cfg, res, groups, args.seed)
+    env["seconds"] = round(time.perf_counter() - t0, 1)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"environment": env, "results": res.records}, f, indent=1)
+    print(f"{len(res.records)} results in {env['seconds']}s -> {out}")
+    if baseline:
+        sys.exit(1 if compare(res.records, baseline, args.threshold, args.min_delta_ms) else 0)
+
+
+if __name__ == "__main__":
+    main()
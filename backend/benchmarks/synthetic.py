@@ -0,0 +1,88 @@
+# synthetic.py - deterministic multi-symbol tick/bar generator for the benchmarks: correlated random walks
+# (one common factor + an idiosyncratic walk per symbol) sampled at Poisson arrival times
+import json
+import numpy as np
+import pandas as pd
+
+T0_NS = 1_700_000_000_000 * 1_000_000
+NS_PER_S = 1_000_000_000
+NS_PER_MS = 1_000_000
+
+
+class TickGenerator:
+    """
+    symbols: names (or a count -> sym0, sym1, ...); rate: mean ticks/second per symbol (a scalar or one per
+    symbol); corr: correlation of any two symbols' log-returns over the same interval; vol: log-price
+    volatility per sqrt(second). Output depends only on the arguments (the factor and every symbol draw
+    from their own child of SeedSequence(seed)), so runs on different machines and commits see the same data.
+    """
+
+    def __init__(self, symbols=4, rate=5.0, corr: float = 0.6, vol: float = 2e-4, seed: int = 0,
+                 start_ns: int = T0_NS, price0: float = 100.0):
+        if isinstance(symbols, int):
+            symbols = [f"sym{k}" for k in range(symbols)]
+        if not 0.0 <= corr <= 1.0:
+            raise ValueError("corr must be in [0, 1]")
+        self.symbols = list(symbols)
+        self.rates = np.broadcast_to(np.asarray(rate, dtype=np.float64), (len(self.symbols),))
+        self.corr = corr
+        self.vol = vol
+        self.seed = seed
+        self.start_ns = start_ns
+        self.price0 = price0
+
+    def _rngs(self):
+        ss = np.random.SeedSequence(self.seed).spawn(len(self.symbols) + 1)
+        return np.random.default_rng(ss[0]), [np.random.default_rng(s) for s in ss[1:]]
+
+    def ticks(self, seconds: float) -> dict:
+        """{symbol: (ts_ns int64, price float64, size float64)}, time-sorted, whole-ms timestamps like live trades."""
+        factor_rng, rngs = self._rngs()
+        times = []
+        for rng, rate in zip(rngs, self.rates):
+            n = rng.poisson(rate * seconds)
+            ts = np.sort(rng.integers(0, int(seconds * 1000), n)) * NS_PER_MS + self.start_ns
+            times.append(ts)
+        # common factor: one Brownian path sampled at every tick time of every symbol
+        grid = np.unique(np.concatenate(times)) if times else np.empty(0, np.int64)
+        dt = np.diff(grid, prepend=self.start_ns) / NS_PER_S
+        factor = np.cumsum(factor_rng.normal(0.0, 1.0, grid.size) * np.sqrt(dt))
+        out = {}
+        for sym, rng, ts in zip(self.symbols, rngs, times):
+            own_dt = np.diff(ts, prepend=self.start_ns) / NS_PER_S
+            own = np.cumsum(rng.normal(0.0, 1.0, ts.size) * np.sqrt(own_dt))
+            common = factor[np.searchsorted(grid, ts)]
+            logp = self.vol * (np.sqrt(self.corr) * common + np.sqrt(1.0 - self.corr) * own)
+            out[sym] = (ts, self.price0 * np.exp(logp), rng.exponential(1.0, ts.size))
+        return out
+
+    def closes(self, bars: int, bar_s: int = 1) -> pd.DataFrame:
+        """(bars x symbols) close prices on a regular bar_s grid, the same process without the tick step."""
+        factor_rng, rngs = self._rngs()
+        scale = np.sqrt(bar_s)
+        factor = np.cumsum(factor_rng.normal(0.0, scale, bars))
+        cols = {}
+        for sym, rng in zip(self.symbols, rngs):
+            own = np.cumsum(rng.normal(0.0, scale, bars))
+            cols[sym] = self.price0 * np.exp(self.vol * (np.sqrt(self.corr) * factor + np.sqrt(1.0 - self.corr) * own))
+        idx = pd.DatetimeIndex((self.start_ns + np.arange(bars, dtype=np.int64) * bar_s * NS_PER_S).view("M8[ns]"),
+                               name="ts")
+        return pd.DataFrame(cols, index=idx)
+
+
+def merged(ticks: dict):
+    """All symbols' ticks in time order: (symbols object array, ts_ns, price, size)."""
+    syms = np.concatenate([np.full(ts.size, s, dtype=object) for s, (ts, _, _) in ticks.items()])
+    ts = np.concatenate([t[0] for t in ticks.values()])
+    price = np.concatenate([t[1] for t in ticks.values()])
+    size = np.concatenate([t[2] for t in ticks.values()])
+    order = np.argsort(ts, kind="stable")
+    return syms[order], ts[order], price[order], size[order]
+
+
+def write_ndjson(path: str, ticks: dict):
+    # the upload/replay format: one {"symbol", "ts" (epoch ms), "price", "size"} per line, in time order
+    syms, ts, price, size = merged(ticks)
+    with open(path, "w") as f:
+        for s, t, p, q in zip(syms.tolist(), (ts // NS_PER_MS).tolist(), price.tolist(), size.tolist()):
+            f.write(json.dumps({"symbol": s, "ts": t, "price": p, "size": q}) + "\n")
@@ -0,0 +1,79 @@
+# downsample.py - visual downsampling so charts get at most max_points per series
+import numpy as np
+import pandas as pd
+from barcache import BAR_COLUMNS
+
+METHODS = ("lttb", "minmax")
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and last point and, per bucket, the point forming the
+    largest triangle with the previously kept point and the next bucket's mean. Returns sorted indices.
+    """
+    size = y.size
+    if n >= size:
+        return np.arange(size)
+    if n < 3:
+        return np.array([0, size - 1][:max(n, 0)], dtype=np.int64)
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)  # n-2 buckets between the end points
+    out = np.empty(n, dtype=np.int64)
+    out[0], out[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < n - 1 else size)
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(y: np.ndarray, n: int) -> np.ndarray:
+    """Min and max of each of n // 2 equal-count buckets (one pixel column each), in time order; at most n points."""
+    size = y.size
+    if n >= size:
+        return np.arange(size)
+    if n < 2:
+        return np.array([0, size - 1][:max(n, 0)], dtype=np.int64)
+    buckets = max(n // 2, 1)
+    bucket = np.arange(size) * buckets // size
+    order = np.lexsort((y, bucket))  # by bucket, then value
+    brk = np.flatnonzero(np.diff(bucket[order])) + 1
+    first = order[np.concatenate(([0], brk))]
+    last = order[np.concatenate((brk - 1, [size - 1]))]
+    return np.unique(np.concatenate((first, last)))
+
+
+def downsample_series(s: pd.Series, max_points: int, method: str = "lttb") -> pd.Series:
+    """Return at most max_points of s (NaNs dropped), picking points that preserve its visual shape."""
+    s = s.dropna()
+    if max_points is None or len(s) <= max_points:
+        return s
+    y = s.to_numpy(dtype=np.float64)
+    if method == "minmax":
+        idx = minmax_indices(y, max_points)
+    else:
+        x = s.index.asi8.astype(np.float64) if isinstance(s.index, pd.DatetimeIndex) else np.arange(y.size, dtype=np.float64)
+        idx = lttb_indices(x, y, max_points)
+    return s.iloc[idx]
+
+
+def downsample_bars(df: pd.DataFrame, max_points: int) -> pd.DataFrame:
+    """Merge runs of consecutive OHLCV bars so at most max_points remain (open/high/low/close/volume kept exact)."""
+    if max_points is None or len(df) <= max_points:
+        return df
+    k = -(-len(df) // max_points)  # bars per bucket
+    starts = np.arange(0, len(df), k)
+    ends = np.append(starts[1:], len(df))
+    vals = df[BAR_COLUMNS].to_numpy(dtype=np.float64)
+    out = np.column_stack((
+        vals[starts, 0],
+        np.maximum.reduceat(vals[:, 1], starts),
+        np.minimum.reduceat(vals[:, 2], starts),
+        vals[ends - 1, 3],
+        np.add.reduceat(vals[:, 4], starts),
+    ))
+    return pd.DataFrame(out, index=df.index[starts], columns=BAR_COLUMNS)
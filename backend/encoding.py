@@ -0,0 +1,109 @@
+# encoding.py - columnar response encodings (orjson JSON, Arrow IPC, MessagePack) chosen by Accept / ?format=
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from fastapi.responses import Response, JSONResponse
+import metrics
+
+try:  # optional: much faster JSON, serializes numpy arrays natively
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # optional: MessagePack responses
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+MSGPACK_MIMES = ("application/msgpack", "application/x-msgpack")
+FORMATS = ("json", "columnar", "arrow", "msgpack")
+
+
+def negotiate(accept: str = None, fmt: str = None) -> str:
+    """
+    Response format: an explicit ?format= wins, then the Accept header; anything else keeps the
+    original row-oriented JSON ("json"). "columnar" is arrays-per-field JSON.
+    """
+    if fmt:
+        return fmt
+    accept = (accept or "").lower()
+    if ARROW_MIME in accept:
+        return "arrow"
+    if any(m in accept for m in MSGPACK_MIMES):
+        return "msgpack"
+    return "json"
+
+
+def unavailable(fmt: str):
+    # None if fmt can be produced here, otherwise the error response to return
+    if fmt not in FORMATS:
+        return JSONResponse({"error": f"format must be one of {FORMATS}"}, status_code=400)
+    if fmt == "msgpack" and msgpack is None:
+        return JSONResponse({"error": "msgpack is not installed on the server"}, status_code=406)
+    return None
+
+
+def epoch_ms(index: pd.DatetimeIndex) -> np.ndarray:
+    # int64 epoch ms whatever the index unit (bar caches are ns, pandas may parse uploads to us)
+    return index.as_unit("ms").asi8
+
+
+def columns(df: pd.DataFrame) -> dict:
+    """{"ts": epoch-ms int64 array, <column>: float array, ...} over a ts-indexed frame (NaN stays NaN)."""
+    out = {"ts": epoch_ms(df.index)}
+    for c in df.columns:
+        # contiguous copies when the frame is a strided view (e.g. over the bar cache's row-major array)
+        out[str(c)] = np.ascontiguousarray(df[c].to_numpy(dtype=np.float64))
+    return out
+
+
+def _plain(obj):
+    # numpy arrays -> lists with NaN -> None, for encoders without native numpy support
+    if isinstance(obj, dict):
+        return {k: _plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "f" and np.isnan(obj).any():
+            return [None if v != v else v for v in obj.tolist()]
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, float) and obj != obj:
+        return None
+    return obj
+
+
+def dumps_json(payload: dict) -> bytes:
+    if orjson is not None:
+        # orjson writes NaN as null, like the default encoder's output for None
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_plain(payload), separators=(",", ":")).encode()
+
+
+def encode(payload: dict, fmt: str, frame: pd.DataFrame = None) -> Response:
+    """
+    Encode a columnar payload. payload holds the scalar fields plus arrays from columns(); for Arrow the
+    tabular part is `frame` (ts-indexed) and the remaining fields travel as JSON in the schema metadata.
+    """
+    with metrics.timer("serialize_seconds", format=fmt):
+        return _encode(payload, fmt, frame)
+
+
+def _encode(payload: dict, fmt: str, frame: pd.DataFrame = None) -> Response:
+    if fmt == "arrow":
+        df = frame if frame is not None else pd.DataFrame(index=pd.DatetimeIndex([], name="ts"))
+        arrays = [pa.array(epoch_ms(df.index), type=pa.int64()).cast(pa.timestamp("ms"))]
+        arrays += [pa.array(df[c].to_numpy(dtype=np.float64), from_pandas=True) for c in df.columns]
+        meta = {k: v for k, v in payload.items() if not isinstance(v, np.ndarray)}
+        table = pa.Table.from_arrays(arrays, names=["ts"] + [str(c) for c in df.columns])
+        table = table.replace_schema_metadata({"meta": json.dumps(_plain(meta), default=str)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as w:
+            w.write_table(table)
+        return Response(sink.getvalue().to_pybytes(), media_type=ARROW_MIME)
+    if fmt == "msgpack":
+        return Response(msgpack.packb(_plain(payload)), media_type=MSGPACK_MIMES[0])
+    return Response(dumps_json(payload), media_type="application/json")
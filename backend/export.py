@@ -0,0 +1,174 @@
+# export.py - streaming exports: frame blocks -> CSV / gzip CSV / Parquet byte chunks with bounded memory
+import io
+import zlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from analytics import PairState, kalman_hedge_path
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "csv.gz": ("application/gzip", "csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def csv_chunks(frames):
+    # header once, then each block as it arrives (ts index written as the first column)
+    header = True
+    for df in frames:
+        if len(df):
+            yield df.to_csv(header=header).encode()
+            header = False
+
+
+def gzip_chunks(chunks, level: int = 6):
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+
+class _Spool(io.RawIOBase):
+    # write-only file object whose contents are handed out (and forgotten) after every row group
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+def parquet_chunks(frames):
+    # one row group per block; only the current block and the footer metadata are held in memory
+    spool = _Spool()
+    writer = None
+    for df in frames:
+        if not len(df):
+            continue
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        if writer is None:
+            writer = pq.ParquetWriter(spool, table.schema)
+        writer.write_table(table)
+        yield spool.drain()
+    if writer is not None:
+        writer.close()
+        yield spool.drain()
+
+
+def encode(frames, fmt: str):
+    if fmt == "parquet":
+        return parquet_chunks(frames)
+    chunks = csv_chunks(frames)
+    return gzip_chunks(chunks) if fmt == "csv.gz" else chunks
+
+
+def tick_frames(blocks):
+    for ts, price, size in blocks:
+        yield pd.DataFrame({"price": price, "size": size}, index=pd.DatetimeIndex(ts.view("datetime64[ns]"), name="ts"))
+
+
+def aligned_closes(frames_x, frames_y, min_volume: float = 0.0):
+    """
+    Inner-join two time-ordered bar frame streams on ts, block by block. Yields frames with columns x, y
+    (close prices); bars past the end of the other stream's current block are carried to the next block.
+    """
+    def closes(frames):
+        for df in frames:
+            if min_volume > 0:
+                df = df[df["volume"] >= min_volume]
+            yield df["close"]
+
+    def join(a, b):
+        return pd.concat([a.rename("x"), b.rename("y")], axis=1, join="inner").dropna()
+
+    its = [closes(frames_x), closes(frames_y)]
+    pend = [None, None]
+    while True:
+        # pull from the stream that is behind (one with nothing pending counts as furthest behind)
+        k = 0 if pend[0] is None or (pend[1] is not None and pend[0].index[-1] <= pend[1].index[-1]) else 1
+        nxt = next(its[k], None)
+        if nxt is None:
+            # the lagging stream is exhausted: nothing later in the other one can match
+            if pend[0] is not None and pend[1] is not None:
+                block = join(pend[0], pend[1])
+                if len(block):
+                    yield block
+            return
+        if not len(nxt):
+            continue
+        pend[k] = nxt if pend[k] is None else pd.concat([pend[k], nxt])
+        if pend[0] is None or pend[1] is None:
+            continue
+        # bars up to the smaller of the two newest ts can no longer gain a partner
+        cut = min(pend[0].index[-1], pend[1].index[-1])
+        i = int(pend[0].index.searchsorted(cut, side="right"))
+        j = int(pend[1].index.searchsorted(cut, side="right"))
+        block = join(pend[0].iloc[:i], pend[1].iloc[:j])
+        pend[0] = pend[0].iloc[i:] if i < len(pend[0]) else None
+        pend[1] = pend[1].iloc[j:] if j < len(pend[1]) else None
+        if len(block):
+            yield block
+
+
+def fit_pair_hedge(blocks, regression: str = "ols"):
+    """
+    Pass 1 of a streaming pair export over aligned_closes() blocks: the whole-range hedge from running OLS
+    sums, or the resumable Kalman filter's final state. None if there is too little data.
+    """
+    if regression == "kalman":
+        state = None
+        hedge = None
+        for blk in blocks:
+            res = kalman_hedge_path(blk["y"].to_numpy(), blk["x"].to_numpy(), state=state)
+            state = res["state"]
+            hedge = {"beta": float(res["beta"][-1]), "intercept": float(res["intercept"][-1])}
+    else:
+        ps = PairState()
+        for blk in blocks:
+            ps.update_many(blk["x"].to_numpy(), blk["y"].to_numpy())
+        hedge = ps.hedge()
+    return hedge
+
+
+def pair_metric_frames(blocks, hedge: dict, roll_window: int = 60):
+    """
+    Pass 2: ts-indexed spread, zscore, corr per aligned_closes() block. The last roll_window-1 rows are
+    carried into the next block so rolling values match a single pass over the full history.
+    """
+    carry = None
+    for blk in blocks:
+        spread = (blk["y"] - (hedge["beta"] * blk["x"] + hedge["intercept"])).rename("spread")
+        frame = pd.concat([spread, blk["x"], blk["y"]], axis=1)
+        if carry is not None:
+            frame = pd.concat([carry, frame])
+        s = frame["spread"]
+        mean = s.rolling(roll_window).mean()
+        std = s.rolling(roll_window).std().replace(0, np.nan)
+        out = pd.DataFrame({
+            "spread": s,
+            "zscore": (s - mean) / std,
+            "corr": frame["x"].rolling(roll_window).corr(frame["y"]),
+        })
+        if carry is not None:
+            out = out.iloc[len(carry):]
+        carry = frame.iloc[-(roll_window - 1):] if roll_window > 1 else frame.iloc[:0]
+        out = out.dropna()
+        if len(out):
+            yield out
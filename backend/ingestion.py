@@ -1,58 +1,461 @@
 # ingestion.py - manages websocket connections to Binance futures streams (fstream) and handles file upload ingestion
+#
+# Trades come from pluggable sources (TradeSource): live Binance combined streams, or an NDJSON file replayed at a
+# configurable speed for offline load tests. All sources run on one background event loop. Receivers only parse
+# and push (symbol, ts_ms, price, size) tuples into a bounded asyncio queue; a consumer task drains it in batches
+# into storage, so a slow write never delays socket reads. Timestamps stay int64 epoch ms throughout.
 import asyncio
 import json
+import random
+import time
+import numpy as np
+import pandas as pd
 import websockets
-from typing import List
+from collections import deque
+from typing import Iterable, List, Optional
 from storage import TickStorage
-from datetime import datetime
+from tickbuffer import to_ns, NS_PER_MS
+import metrics
 import threading
 
-BINANCE_WS_URL_TEMPLATE = "wss://fstream.binance.com/ws/{}@trade"
+try:  # optional: faster message parsing
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
 
-class Ingestor:
-    def __init__(self, storage: TickStorage):
-        self.storage = storage
-        self._tasks = {}
-        self._running = False
+BINANCE_COMBINED_URL = "wss://fstream.binance.com/stream?streams={}"
+MAX_STREAMS_PER_CONNECTION = 200   # fstream limit per combined connection
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 30.0
+RECENT_GAPS = 100
+QUEUE_MAX = 100_000      # trades buffered between receivers and the storage consumer
+BATCH_MAX = 10_000       # trades per storage write
+LAG_WARN_MS = 1000.0     # a batch whose oldest trade waited longer than this counts as lagged
+REPLAY_YIELD_LINES = 1000  # replay gives the loop a turn at least this often, even when behind schedule
+
+
+class TradeSource:
+    """
+    A producer of trades. run(emit) is a coroutine that calls emit(symbol, ts_ms, price, size, trade_id)
+    for every trade until cancelled; emit never blocks and returns False when the ingest queue is full
+    (live sources drop and count the trade, offline ones may wait and retry). add()/remove() change the
+    symbol set at runtime (called on the ingestion loop). An empty symbol set means "everything the source
+    has" for sources that support it.
+    """
+    kind = "source"
+
+    def __init__(self, symbols: Iterable[str] = ()):
+        self.symbols = {s.lower() for s in symbols}
+        self.messages = 0
+        self.dropped = 0
+
+    async def run(self, emit):
+        raise NotImplementedError
+
+    def add(self, symbols: Iterable[str]):
+        self.symbols |= {s.lower() for s in symbols}
+
+    def remove(self, symbols: Iterable[str]):
+        self.symbols -= {s.lower() for s in symbols}
+
+    def stats(self) -> dict:
+        return {"kind": self.kind, "symbols": sorted(self.symbols), "messages": self.messages, "dropped": self.dropped}
+
+
+class _Shard:
+    # one combined-stream connection and the symbols it carries
+    def __init__(self):
+        self.symbols = set()
+        self.ws = None
+        self.task = None
+        self.connects = 0
+        self.last_error = None
+
+
+class BinanceCombinedSource(TradeSource):
+    """
+    Binance combined streams: up to shard_size <symbol>@trade streams per connection, more symbols open more
+    connections. Each connection reconnects with exponential backoff and full jitter; symbols added or removed
+    while connected are (un)subscribed in place via SUBSCRIBE/UNSUBSCRIBE, without reconnecting.
+    """
+    kind = "binance"
+
+    def __init__(self, symbols: Iterable[str] = (), url_template: str = BINANCE_COMBINED_URL,
+                 shard_size: int = MAX_STREAMS_PER_CONNECTION):
+        super().__init__()
+        self.url_template = url_template
+        self.shard_size = shard_size
+        self.shards = []
+        self.reconnects = 0
+        self.errors = 0
+        self._emit = None
+        self._req_id = 0
+        self._pending = {s.lower() for s in symbols}
+
+    async def run(self, emit):
+        self._emit = emit
+        self.add(self._pending)
+        self._pending = set()
+        try:
+            await asyncio.Event().wait()  # shards run as their own tasks
+        finally:
+            tasks = [s.task for s in self.shards if s.task is not None]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def add(self, symbols: Iterable[str]):
+        new = {s.lower() for s in symbols} - self.symbols
+        if self._emit is None:
+            self._pending |= new
+            return
+        self.symbols |= new
+        for sym in sorted(new):
+            shard = next((s for s in self.shards if len(s.symbols) < self.shard_size), None)
+            if shard is None:
+                shard = _Shard()
+                self.shards.append(shard)
+            shard.symbols.add(sym)
+            if shard.task is None:
+                shard.task = asyncio.get_running_loop().create_task(self._run_shard(shard))
+            elif shard.ws is not None:
+                self._send(shard, "SUBSCRIBE", [sym])
+
+    def remove(self, symbols: Iterable[str]):
+        gone = {s.lower() for s in symbols} & self.symbols
+        self.symbols -= gone
+        self._pending -= gone
+        for shard in list(self.shards):
+            drop = shard.symbols & gone
+            if not drop:
+                continue
+            shard.symbols -= drop
+            if not shard.symbols:
+                shard.task.cancel()
+                self.shards.remove(shard)
+            elif shard.ws is not None:
+                self._send(shard, "UNSUBSCRIBE", sorted(drop))
+
+    def _send(self, shard: _Shard, method: str, symbols: List[str]):
+        self._req_id += 1
+        msg = json.dumps({"method": method, "params": [f"{s}@trade" for s in symbols], "id": self._req_id})
+        asyncio.get_running_loop().create_task(shard.ws.send(msg))
+
+    async def _run_shard(self, shard: _Shard):
+        attempt = 0
+        while shard.symbols:
+            url = self.url_template.format("/".join(f"{s}@trade" for s in sorted(shard.symbols)))
+            try:
+                async with websockets.connect(url, ping_interval=20, ping_timeout=20) as ws:
+                    shard.ws = ws
+                    shard.connects += 1
+                    attempt = 0
+                    async for message in ws:
+                        self._handle(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                shard.last_error = repr(e)
+            finally:
+                shard.ws = None
+            if not shard.symbols:
+                break
+            # reconnect: exponential backoff with full jitter so shards don't stampede together
+            self.reconnects += 1
+            await asyncio.sleep(random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)))
+            attempt += 1
+
+    def _handle(self, message):
+        try:
+            j = _loads(message)
+            # combined stream envelope: {"stream": "btcusdt@trade", "data": {...}}
+            j = j.get("data", j)
+            # trade event structure: fields like e:'trade', E:eventTime, s:symbol, p:price, q:qty, T:tradeTime, t:tradeId
+            if j.get("e") == "trade":
+                self.messages += 1
+                ts_ms = int(j.get("T", j.get("E", time.time() * 1000)))
+                if not self._emit(j.get("s").lower(), ts_ms, float(j.get("p")), float(j.get("q")), j.get("t")):
+                    self.dropped += 1
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        out = super().stats()
+        out.update({
+            "connections": sum(1 for s in self.shards if s.ws is not None),
+            "shards": [{"symbols": len(s.symbols), "connected": s.ws is not None, "connects": s.connects,
+                        "last_error": s.last_error} for s in self.shards],
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+        })
+        return out
+
+
+class FileReplaySource(TradeSource):
+    """
+    Replays recorded NDJSON ticks ({"symbol", "ts", "price", "size"}; ts ISO or epoch ms, file in time order)
+    with the recorded spacing divided by `speed` (speed <= 0: as fast as possible). symbols filters the replay
+    (empty = all); loop=True restarts at the end of the file. Useful for offline throughput tests.
+    """
+    kind = "replay"
+
+    def __init__(self, path: str, speed: float = 100.0, symbols: Iterable[str] = (), loop: bool = False):
+        super().__init__(symbols)
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.done = False
+        self.lag_ms = 0.0
+        self.waits = 0
 
-    async def _single_ws(self, symbol: str):
-        url = BINANCE_WS_URL_TEMPLATE.format(symbol.lower())
-        async with websockets.connect(url) as ws:
-            async for message in ws:
+    async def run(self, emit):
+        while True:
+            await self._replay_once(emit)
+            if not self.loop:
+                break
+        self.done = True
+
+    async def _replay_once(self, emit):
+        t_start = None  # (wall clock, first recorded ts ms)
+        with open(self.path, "r", encoding="utf-8") as f:
+            for n, line in enumerate(f):
+                if n % REPLAY_YIELD_LINES == 0:
+                    await asyncio.sleep(0)  # never starve the loop (receivers, consumer), paced or not
+                line = line.strip()
+                if not line:
+                    continue
                 try:
-                    j = json.loads(message)
-                    # trade event structure: fields like e:'trade', E:eventTime, s:symbol, p:price, q:qty, T:tradeTime
-                    if j.get("e") == "trade":
-                        ts = datetime.utcfromtimestamp(j.get("T", j.get("E", int(datetime.utcnow().timestamp()*1000)))/1000.0).isoformat()
-                        price = float(j.get("p"))
-                        size = float(j.get("q"))
-                        self.storage.append_tick(j.get("s").lower(), ts, price, size)
+                    j = _loads(line)
+                    sym = str(j["symbol"]).lower()
+                    ts = j["ts"]
+                    ts_ms = int(ts) if isinstance(ts, (int, float)) else to_ns(ts) // NS_PER_MS
+                    price, size = float(j["price"]), float(j.get("size") or 0.0)
                 except Exception:
                     continue
+                if self.symbols and sym not in self.symbols:
+                    continue
+                if self.speed > 0:
+                    if t_start is None:
+                        t_start = (time.monotonic(), ts_ms)
+                    due = t_start[0] + (ts_ms - t_start[1]) / 1000.0 / self.speed
+                    delay = due - time.monotonic()
+                    if delay > 0.001:
+                        await asyncio.sleep(delay)
+                    else:
+                        self.lag_ms = max(-delay, 0.0) * 1000.0  # behind schedule: ingestion can't keep up
+                self.messages += 1
+                while not emit(sym, ts_ms, price, size, None):
+                    self.waits += 1
+                    await asyncio.sleep(0.001)  # offline: wait for the consumer instead of dropping
 
-    def start_ws_for_symbols(self, symbols: List[str]):
-        # start tasks for each symbol on an event loop thread
-        if self._running:
+    def stats(self) -> dict:
+        out = super().stats()
+        out.update({"path": self.path, "speed": self.speed, "loop": self.loop, "done": self.done,
+                    "lag_ms": round(self.lag_ms, 3), "queue_waits": self.waits})
+        return out
+
+
+class Ingestor:
+    def __init__(self, storage: TickStorage, queue_max: int = QUEUE_MAX, batch_max: int = BATCH_MAX):
+        self.storage = storage
+        self.sources = {}  # name -> TradeSource
+        self._tasks = {}   # name -> asyncio.Task on the ingestion loop
+        self.loop = None
+        self._thread = None
+        self.queue_max = queue_max
+        self.batch_max = batch_max
+        self._queue = None
+        self._consumer = None
+        self._last_id = {}  # symbol -> last trade id (gap / duplicate detection)
+        self.trades = 0
+        self.duplicates = 0
+        self.gaps = 0
+        self.missed = 0
+        self.recent_gaps = deque(maxlen=RECENT_GAPS)
+        # queue / consumer counters
+        self.high_water = 0
+        self.queue_full = 0
+        self.batches = 0
+        self.written = 0
+        self.max_batch = 0
+        self.lagged = 0
+        self.max_lag_ms = 0.0
+        self.last_lag_ms = 0.0
+        self.write_errors = 0
+        self._dropped_retired = 0  # drops counted by sources that were stopped since
+
+    @property
+    def _running(self) -> bool:
+        return bool(self._tasks)
+
+    def _ensure_loop(self):
+        if self.loop is not None:
             return
-        self._running=True
         loop = asyncio.new_event_loop()
         self.loop = loop
         def runner():
             asyncio.set_event_loop(loop)
-            tasks = [loop.create_task(self._single_ws(sym)) for sym in symbols]
             try:
-                loop.run_until_complete(asyncio.gather(*tasks))
+                loop.run_forever()
             finally:
                 loop.close()
-        t = threading.Thread(target=runner, daemon=True)
+        t = threading.Thread(target=runner, name="ingestor", daemon=True)
         t.start()
         self._thread = t
+        def start_consumer():
+            self._queue = asyncio.Queue(maxsize=self.queue_max)
+            self._consumer = loop.create_task(self._consume())
+        self._call(start_consumer)
 
-    def stop(self):
-        if self._running:
-            # stopping websockets elegantly is complicated; for prototype just stop loop
+    def _call(self, fn, *args):
+        # run fn on the ingestion loop and wait for its result
+        async def call():
+            return fn(*args)
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result(timeout=10)
+
+    def _emit(self, symbol: str, ts_ms: int, price: float, size: float, trade_id: Optional[int] = None) -> bool:
+        # receiver side: dedupe/gap check and enqueue only; False if the queue is full (trade not taken)
+        if trade_id is not None:
+            last = self._last_id.get(symbol)
+            if last is not None and trade_id <= last:
+                self.duplicates += 1  # overlap after a reconnect
+                return True
+        q = self._queue
+        if q.full():
+            self.queue_full += 1
+            return False
+        q.put_nowait((symbol, ts_ms, price, size, time.monotonic()))
+        depth = q.qsize()
+        if depth > self.high_water:
+            self.high_water = depth
+        if trade_id is not None:
+            last = self._last_id.get(symbol)
+            if last is not None and trade_id > last + 1:
+                self.gaps += 1
+                self.missed += trade_id - last - 1
+                self.recent_gaps.append({"symbol": symbol, "from_id": last, "to_id": trade_id, "ts": ts_ms})
+            self._last_id[symbol] = trade_id
+        self.trades += 1
+        return True
+
+    async def _consume(self):
+        # drain the queue in batches; the storage write runs on a worker thread so receivers keep reading
+        q = self._queue
+        while True:
+            batch = [await q.get()]
+            while len(batch) < self.batch_max and not q.empty():
+                batch.append(q.get_nowait())
+            lag_ms = (time.monotonic() - batch[0][4]) * 1000.0
+            self.last_lag_ms = lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms > LAG_WARN_MS:
+                self.lagged += 1
             try:
-                self.loop.call_soon_threadsafe(self.loop.stop)
+                await asyncio.to_thread(self._write_batch, batch)
             except Exception:
-                pass
-            self._running=False
+                self.write_errors += 1
+            self.batches += 1
+            self.written += len(batch)
+            self.max_batch = max(self.max_batch, len(batch))
+            for _ in batch:
+                q.task_done()
+
+    @metrics.timed("ingest_batch_seconds", fn="write_batch")
+    def _write_batch(self, batch):
+        # one columnar append per symbol; epoch ms -> ns only here, at the storage boundary
+        syms, ts_ms, price, size, _t = zip(*batch)
+        ts_ns = np.fromiter(ts_ms, dtype=np.int64, count=len(batch)) * NS_PER_MS
+        price = np.fromiter(price, dtype=np.float64, count=len(batch))
+        size = np.fromiter(size, dtype=np.float64, count=len(batch))
+        codes, names = pd.factorize(pd.Series(syms, dtype=object))
+        if len(names) == 1:
+            self.storage.append_ticks(names[0], ts_ns, price, size)
+            return
+        order = np.argsort(codes, kind="stable")
+        splits = np.searchsorted(codes[order], np.arange(1, len(names)))
+        for s, idx in zip(names, np.split(order, splits)):
+            self.storage.append_ticks(s, ts_ns[idx], price[idx], size[idx])
+
+    def start_source(self, name: str, source: TradeSource):
+        """Run source under name on the ingestion loop (replacing a previous source with that name)."""
+        self._ensure_loop()
+        self.stop_source(name)
+        self.sources[name] = source
+        self._tasks[name] = self._call(lambda: self.loop.create_task(source.run(self._emit)))
+
+    def stop_source(self, name: str):
+        task = self._tasks.pop(name, None)
+        src = self.sources.pop(name, None)
+        if src is not None:
+            self._dropped_retired += src.dropped
+        if task is not None:
+            self.loop.call_soon_threadsafe(task.cancel)
+
+    def start_ws_for_symbols(self, symbols: List[str]):
+        # live Binance trades; calling again adds symbols to the running source
+        src = self.sources.get("binance")
+        if src is None:
+            self.start_source("binance", BinanceCombinedSource(symbols))
+        else:
+            self._call(src.add, symbols)
+
+    def remove_symbols(self, symbols: List[str]):
+        src = self.sources.get("binance")
+        if src is not None:
+            self._call(src.remove, symbols)
+            for sym in symbols:
+                self._last_id.pop(sym.lower(), None)  # no gap report for trades missed while unsubscribed
+            if not src.symbols:
+                self.stop_source("binance")
+
+    def start_replay(self, path: str, speed: float = 100.0, symbols: Optional[List[str]] = None, loop: bool = False):
+        self.start_source("replay", FileReplaySource(path, speed, symbols or (), loop))
+
+    def stop(self):
+        if self.loop is None:
+            return
+        async def shutdown():
+            tasks = list(self._tasks.values())
+            self._tasks.clear()
+            self.sources.clear()
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # let the consumer write out what the receivers already queued
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=5)
+            finally:
+                self._consumer.cancel()
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout=10)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self.loop = None
+
+    def stats(self) -> dict:
+        return {
+            "trades": self.trades,
+            "queue": {
+                "depth": self._queue.qsize() if self._queue is not None else 0,
+                "max": self.queue_max,
+                "high_water": self.high_water,
+                "full": self.queue_full,
+                "dropped": self._dropped_retired + sum(src.dropped for src in list(self.sources.values())),
+                "batches": self.batches,
+                "written": self.written,
+                "max_batch": self.max_batch,
+                "lag_ms": round(self.last_lag_ms, 3),
+                "max_lag_ms": round(self.max_lag_ms, 3),
+                "lagged": self.lagged,
+                "write_errors": self.write_errors,
+            },
+            "duplicates": self.duplicates,
+            "gaps": self.gaps,
+            "missed": self.missed,
+            "recent_gaps": list(self.recent_gaps)[-10:],
+            "sources": {name: src.stats() for name, src in list(self.sources.items())},
+        }
@@ -0,0 +1,314 @@
+# live.py - one broadcaster task computes live snapshots and fans them out to every /ws/live client
+import asyncio
+import json
+import logging
+import threading
+import time
+from barcache import BAR_COLUMNS, timeframe_ns
+from encoding import epoch_ms
+
+BAR_SNAPSHOT = 500          # bars sent when a client subscribes to (symbol, timeframe)
+MAX_PENDING_DELTAS = 64     # queued bar deltas per stream before a slow client is resynced instead
+HEARTBEAT_S = 1.0           # legacy heartbeat / default price throttle
+
+log = logging.getLogger(__name__)
+
+
+def bars_message(symbol: str, timeframe: str, df) -> dict:
+    # columnar payload, epoch-ms timestamps
+    msg = {"type": "bars", "symbol": symbol, "timeframe": timeframe, "ts": epoch_ms(df.index).tolist()}
+    for c in BAR_COLUMNS:
+        msg[c] = df[c].tolist()
+    return msg
+
+
+class LiveClient:
+    """
+    One /ws/live connection. Updates are queued per stream key: metric streams keep only the newest message,
+    bar streams keep deltas (collapsed into a resync once MAX_PENDING_DELTAS pile up), alerts are all kept. A dedicated sender task
+    drains the queue, so a slow socket only delays itself and never the broadcaster or other clients.
+    offer() may be called from worker threads; the sender itself runs on the event loop that created the client.
+    """
+
+    def __init__(self, websocket, resync, executor=None):
+        self.ws = websocket
+        self._resync = resync  # key -> message text (fresh snapshot for a stream), run on `executor`
+        self._executor = executor
+        self._loop = asyncio.get_running_loop()
+        self.legacy = True  # until the first subscribe: all-symbol heartbeat every second
+        self.symbols = set()
+        self.bars = set()   # (symbol, timeframe)
+        self.pairs = set()  # (x, y, timeframe, roll_window)
+        self.throttle = {"heartbeat": HEARTBEAT_S, "prices": HEARTBEAT_S}  # stream key -> seconds
+        self._pending = {}  # stream key -> list of message texts (None = resync)
+        self._pending_lock = threading.Lock()
+        self._next_send = {}
+        self._wake = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, key, text: str, delta: bool = False, keep: bool = False):
+        # keep: an event with no snapshot to resync from (alerts); always queued in full, never collapsed
+        with self._pending_lock:
+            q = self._pending.get(key)
+            if keep and q is not None:
+                q.append(text)
+            elif not delta or q is None:
+                self._pending[key] = [text]
+            elif q == [None]:
+                pass  # already resyncing; the snapshot will include this update
+            elif len(q) >= MAX_PENDING_DELTAS:
+                self.dropped += len(q)
+                self._pending[key] = [None]
+            else:
+                q.append(text)
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _take_due(self, now: float):
+        # pop the queues whose throttle has elapsed; also the delay until the next one is due
+        due, retry = [], None
+        with self._pending_lock:
+            for key in list(self._pending):
+                t = self._next_send.get(key, 0.0)
+                if t > now:
+                    retry = t - now if retry is None else min(retry, t - now)
+                else:
+                    due.append((key, self._pending.pop(key)))
+        return due, retry
+
+    async def run_sender(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            due, retry = self._take_due(time.monotonic())
+            for key, texts in due:
+                for text in texts:
+                    if text is None:
+                        text = await loop.run_in_executor(self._executor, self._resync, key)
+                    if text:
+                        await self.ws.send_text(text)
+                        self.sent += 1
+                self._next_send[key] = time.monotonic() + self.throttle.get(key, 0.0)
+            if retry is not None:
+                loop.call_later(retry, self._wake.set)
+
+
+class LiveBroadcaster:
+    """
+    Computes one snapshot per interval for the union of all client subscriptions and fans the serialized
+    messages out. Client protocol (JSON text frames):
+      {"op": "subscribe"|"unsubscribe", "symbols": [...], "timeframe": "1s",
+       "pairs": [{"x": ..., "y": ..., "timeframe": "1s", "roll_window": 60}], "throttle_ms": 500}
+    symbols -> "prices" messages (+ "bars" deltas when timeframe is given; a delta repeats the previously open
+    bar, so clients upsert bars by ts); pairs -> "pair" metric messages emitted as bars close.
+    Every client also receives {"type": "alert"} messages from continuous alert evaluation.
+    Clients that never subscribe get the original {"type": "heartbeat"} stream.
+    tick() and handle() do blocking work (bars, pair metrics): tick() runs on `pool` (a WorkerPool; the loop's
+    default executor if None) and callers should do the same for handle().
+    """
+
+    def __init__(self, storage, pair_metrics, alerts=None, interval: float = 0.25, pool=None):
+        self.storage = storage
+        self.pair_metrics = pair_metrics  # (x, y, timeframe, roll_window) -> dict or None
+        self.alerts = alerts  # AlertEngine evaluated as pair bars close
+        self.interval = interval
+        self.pool = pool
+        self.clients = set()
+        self._bar_cursor = {}  # (symbol, timeframe) -> (ts ns of the newest bar sent, its values)
+        self._pair_seen = {}   # pair key -> bar count at last broadcast
+        self.ticks = 0
+        self.last_tick_ms = 0.0
+
+    def add(self, client: LiveClient):
+        self.clients = self.clients | {client}
+
+    def remove(self, client: LiveClient):
+        self.clients = self.clients - {client}
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if self.pool is not None:
+                    await self.pool.run(self.tick)
+                else:
+                    await asyncio.to_thread(self.tick)
+            except Exception:
+                continue
+
+    def handle(self, client: LiveClient, msg: dict):
+        op = msg.get("op") if isinstance(msg, dict) else None
+        if op not in ("subscribe", "unsubscribe"):
+            client.offer("error", json.dumps({"type": "error", "msg": f"unknown op {op!r}"}))
+            return
+        try:
+            syms, tf, pairs, throttle = self._parse(msg)
+        except (ValueError, TypeError, AttributeError) as e:
+            client.offer("error", json.dumps({"type": "error", "msg": f"bad {op}: {e}"}))
+            return
+        bars = {(s, tf) for s in syms} if tf else set()
+        client.legacy = False
+        # subscription sets are replaced rather than mutated: tick() reads them from another thread
+        if op == "unsubscribe":
+            client.symbols = client.symbols - syms
+            client.bars = client.bars - bars
+            client.pairs = client.pairs - pairs
+            return
+        client.symbols = client.symbols | syms
+        client.bars = client.bars | bars
+        client.pairs = client.pairs | pairs
+        keys = [("bars",) + b for b in bars] + [("pair",) + p for p in pairs] + (["prices"] if syms else [])
+        for key in keys:
+            if throttle is not None:
+                client.throttle[key] = max(throttle, 0.0) / 1000.0
+            if key != "prices":
+                text = self.snapshot_text(key)
+                if text:
+                    client.offer(key, text, delta=key[0] == "bars")
+        client.offer("subscribed", json.dumps({"type": "subscribed", "symbols": sorted(client.symbols),
+                                               "bars": sorted(client.bars), "pairs": sorted(client.pairs)}))
+
+    @staticmethod
+    def _parse(msg: dict):
+        # validated (symbols, timeframe, pairs, throttle_ms) of a subscribe/unsubscribe; ValueError if malformed
+        syms = {str(s).lower() for s in msg.get("symbols") or []}
+        tf = msg.get("timeframe")
+        if tf is not None and timeframe_ns(tf) is None:
+            raise ValueError(f"timeframe {tf!r} is not a fixed-width timeframe")
+        pairs = set()
+        for p in msg.get("pairs") or []:
+            if not isinstance(p, dict) or not p.get("x") or not p.get("y"):
+                raise ValueError(f"pair {p!r} needs x and y")
+            ptf = p.get("timeframe", "1s")
+            if timeframe_ns(ptf) is None:
+                raise ValueError(f"pair timeframe {ptf!r} is not a fixed-width timeframe")
+            rw = p.get("roll_window", 60)
+            if isinstance(rw, bool) or not isinstance(rw, int) or rw < 2:
+                raise ValueError(f"roll_window must be an integer >= 2, got {rw!r}")
+            pairs.add((str(p["x"]).lower(), str(p["y"]).lower(), ptf, rw))
+        throttle = msg.get("throttle_ms")
+        if throttle is not None:
+            throttle = float(throttle)
+        return syms, tf, pairs, throttle
+
+    def snapshot_text(self, key):
+        # full current state of one stream (initial subscribe / resync of a lagging client)
+        if key[0] == "bars":
+            _, sym, tf = key
+            df = self.storage.export_resampled(sym, tf)
+            if df is None or df.empty:
+                return None
+            # deltas for this stream continue from the snapshot's newest bar
+            self._bar_cursor.setdefault((sym, tf), (int(df.index.as_unit("ns").asi8[-1]), tuple(df.iloc[-1].tolist())))
+            return json.dumps(dict(bars_message(sym, tf, df.tail(BAR_SNAPSHOT)), snapshot=True))
+        if key[0] == "pair":
+            snap = self.pair_metrics(*key[1:])
+            return json.dumps(self._pair_message(key, snap)) if snap else None
+        return None
+
+    @staticmethod
+    def _pair_message(key, snap):
+        _, x, y, tf, rw = key
+        return dict({"type": "pair", "x": x, "y": y, "timeframe": tf, "roll_window": rw}, **snap)
+
+    def tick(self):
+        t0 = time.perf_counter()
+        clients = list(self.clients)
+        watched = self.alerts.watched_pairs() if self.alerts is not None else set()
+        bar_keys = set().union(*(c.bars for c in clients))
+        # cursors of streams nobody follows stop advancing; drop them so a later subscribe starts afresh
+        # from its snapshot instead of receiving one large stale delta
+        for bk in list(self._bar_cursor):
+            if bk not in bar_keys:
+                self._bar_cursor.pop(bk, None)
+        if not clients and not watched:
+            return
+        now = time.time()
+        prices = {}
+        for sym in self.storage.symbols():
+            last = self.storage.latest(sym)
+            if last is not None:
+                prices[sym] = {"price": last[1]}
+        # prices: one serialization per distinct symbol set
+        by_set = {}
+        for c in clients:
+            if c.legacy:
+                key, subset = "heartbeat", None
+            elif c.symbols:
+                key, subset = "prices", frozenset(c.symbols)
+            else:
+                continue
+            text = by_set.get((key, subset))
+            if text is None:
+                syms = prices if subset is None else {s: prices[s] for s in subset if s in prices}
+                text = by_set[(key, subset)] = json.dumps({"type": key, "ts": now, "symbols": syms})
+            c.offer(key, text)
+        # bar deltas: bars from the previously open one onwards, once per (symbol, timeframe)
+        for bk in bar_keys:
+            try:
+                text = self._bar_delta(*bk)
+            except Exception:
+                # one bad stream (e.g. an unparseable timeframe) must not stop every other one
+                log.exception("live bars %s failed", bk)
+                continue
+            if text:
+                for c in clients:
+                    if bk in c.bars:
+                        c.offer(("bars",) + bk, text, delta=True)
+        # pair metrics: only when a new bar has closed for the pair; also drives continuous alert evaluation
+        subscribed = set().union(*(c.pairs for c in clients))
+        for pk in subscribed | watched:
+            try:
+                self._tick_pair(pk, pk in subscribed, pk in watched, clients)
+            except Exception:
+                # one bad pair (e.g. a symbol with unusable data) must not stop every other one
+                log.exception("live pair %s failed", pk)
+        self.ticks += 1
+        self.last_tick_ms = (time.perf_counter() - t0) * 1000.0
+
+    def _tick_pair(self, pk, subscribed: bool, watched: bool, clients):
+        snap = self.pair_metrics(*pk)
+        key = ("pair",) + pk
+        if not snap or self._pair_seen.get(key) == snap.get("n"):
+            return
+        self._pair_seen[key] = snap.get("n")
+        if watched:
+            self._evaluate_alerts(pk, snap, clients)
+        if subscribed:
+            text = json.dumps(self._pair_message(key, snap))
+            for c in clients:
+                if pk in c.pairs:
+                    c.offer(key, text)
+
+    def _evaluate_alerts(self, pk, snap, clients):
+        x, y, tf, rw = pk
+        context = {"x": x, "y": y, "timeframe": tf, "roll_window": rw, "ts": snap.get("ts")}
+        triggered = self.alerts.on_metrics(pk, {"zscore": snap.get("zscore"), "spread": snap.get("spread")}, context)
+        for r, msg, ctx in triggered:
+            text = json.dumps({"type": "alert", "id": r.id, "message": msg, **ctx})
+            for c in clients:
+                c.offer(("alert",), text, keep=True)
+
+    def _bar_delta(self, sym: str, tf: str):
+        df = self.storage.export_resampled(sym, tf)
+        if df is None or df.empty:
+            return None
+        ts = df.index.as_unit("ns").asi8
+        last_ts = int(ts[-1])
+        last_vals = tuple(df.iloc[-1].tolist())
+        cursor = self._bar_cursor.get((sym, tf))
+        self._bar_cursor[(sym, tf)] = (last_ts, last_vals)
+        if cursor is None or cursor == (last_ts, last_vals):
+            return None
+        i = int(ts.searchsorted(cursor[0], side="left"))
+        return json.dumps(bars_message(sym, tf, df.iloc[i:]))
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self.clients),
+            "ticks": self.ticks,
+            "last_tick_ms": round(self.last_tick_ms, 3),
+            "sent": sum(c.sent for c in self.clients),
+            "dropped": sum(c.dropped for c in self.clients),
+        }
@@ -0,0 +1,124 @@
+# memo.py - size-bounded LRU of analytics results keyed by request inputs + the data version they were built from
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+
+_MISSING = object()
+
+
+def sizeof(value) -> int:
+    """Approximate bytes held by a cached value (arrays/frames/bytes counted, small scalars ignored)."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(sizeof(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(sizeof(v) for v in value)
+    return 0
+
+
+class ResultCache:
+    """
+    Memoized results keyed by tuples whose first element names the kind of result ("pair", "hedge", ...)
+    and whose tail includes the data version of every symbol involved, so a stale entry is simply never
+    asked for again and ages out. Bounded by entry count and approximate bytes (LRU). Concurrent misses for
+    the same key compute once; the other callers wait for that result.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 256 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, bytes)
+        self._inflight = {}            # key -> Future
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.evictions = 0
+        self._counts = {}  # kind -> [hits, misses, compute seconds]
+
+    def _count(self, key, hit: bool, seconds: float = 0.0):
+        c = self._counts.setdefault(key[0], [0, 0, 0.0])
+        c[0 if hit else 1] += 1
+        c[2] += seconds
+
+    def peek(self, key, default=None):
+        """Cached value without computing (counts as a hit or miss)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            self._count(key, entry is not None)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_compute(self, key, compute):
+        """The cached value for key, or compute() stored under it (exceptions are not cached)."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                self._entries.move_to_end(key)
+                self._count(key, True)
+                return entry[0]
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = self._inflight[key] = Future()
+            else:
+                self._count(key, True)  # joins a computation already running
+        if not owner:
+            return fut.result()
+        t0 = time.perf_counter()
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            self._count(key, False, time.perf_counter() - t0)
+            self._store(key, value)
+            del self._inflight[key]
+        fut.set_result(value)
+        return value
+
+    def _store(self, key, value):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        size = sizeof(value)
+        self._entries[key] = (value, size)
+        self.bytes += size
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            kinds = {}
+            for kind, (hits, misses, secs) in self._counts.items():
+                kinds[kind] = {"hits": hits, "misses": misses,
+                               "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+                               "compute_s": round(secs, 3)}
+            hits = sum(k["hits"] for k in kinds.values())
+            total = hits + sum(k["misses"] for k in kinds.values())
+            return {"entries": len(self._entries), "bytes": self.bytes, "evictions": self.evictions,
+                    "hit_rate": round(hits / total, 4) if total else None, "kinds": kinds}
@@ -0,0 +1,322 @@
+# metrics.py - in-process timers/counters/gauges rendered as Prometheus text, ASGI request timing, sampling profiler
+import bisect
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# seconds; le (<=) upper bounds, +Inf implied
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0)
+PREFIX = "app_"
+ENABLED = os.environ.get("APP_METRICS", "1") != "0"  # APP_METRICS=0 turns timers and counters into no-ops
+MAX_LABEL_VALUES = 200  # distinct values kept per metric label (e.g. symbols); later ones are counted under OTHER
+OTHER = "other"
+
+
+def _labels_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(pairs) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def _fmt_value(v) -> str:
+    v = float(v)
+    if v != v:
+        return "NaN"
+    if v in (float("inf"), float("-inf")):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(int(v)) if v.is_integer() and abs(v) < 2**53 else repr(v)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "t0")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.t0, **self.labels)
+        return False
+
+
+class Registry:
+    """
+    Histograms and counters keyed by (name, labels), updated on the hot path under one short lock; gauges
+    come from collectors called at scrape time, so they cost nothing between scrapes. Each label of a metric
+    keeps at most max_label_values distinct values, so client-supplied values can't grow the series count.
+    """
+
+    def __init__(self, prefix: str = PREFIX, enabled: bool = ENABLED, max_label_values: int = MAX_LABEL_VALUES):
+        self.prefix = prefix
+        self.enabled = enabled
+        self.max_label_values = max_label_values
+        self._lock = threading.Lock()
+        self._hist = {}      # name -> {labels key: Histogram}
+        self._counters = {}  # name -> {labels key: float}
+        self._values = {}    # (name, label) -> values seen so far
+        self._help = {}      # name -> help text
+        self._collectors = []
+
+    def describe(self, name: str, help: str):
+        self._help[name] = help
+
+    def _bounded(self, name: str, labels: dict):
+        # labels key with values past the per-label cap replaced by OTHER; called under the lock
+        for label, v in labels.items():
+            seen = self._values.setdefault((name, label), set())
+            if v not in seen:
+                if len(seen) >= self.max_label_values:
+                    labels[label] = OTHER
+                else:
+                    seen.add(v)
+        return _labels_key(labels)
+
+    def observe(self, name: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            key = self._bounded(name, labels)
+            series = self._hist.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                h = series[key] = Histogram()
+            h.observe(seconds)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            key = self._bounded(name, labels)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def timer(self, name: str, **labels) -> _Timer:
+        """with registry.timer("storage_append_seconds", op="append_ticks"): ..."""
+        return _Timer(self, name, labels)
+
+    def timed(self, name: str, **labels):
+        """Decorator: observe the call time under name, labelled fn=<qualified name> unless given."""
+        def wrap(fn):
+            lab = dict({"fn": fn.__qualname__}, **labels)
+
+            @functools.wraps(fn)
+            def inner(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                t0 = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - t0, **lab)
+            return inner
+        return wrap
+
+    def collector(self, fn):
+        """Register fn() -> iterable of (name, "gauge"|"counter", help, [(labels dict, value), ...])."""
+        self._collectors.append(fn)
+        return fn
+
+    def snapshot(self) -> dict:
+        # copies taken under the lock; rendering happens outside it
+        with self._lock:
+            hist = {n: {k: (list(h.counts), h.sum, h.count, h.buckets) for k, h in s.items()} for n, s in self._hist.items()}
+            counters = {n: dict(s) for n, s in self._counters.items()}
+        return {"histograms": hist, "counters": counters}
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        snap = self.snapshot()
+        out = []
+        for name, series in sorted(snap["histograms"].items()):
+            full = self.prefix + name
+            out.append(f"# HELP {full} {self._help.get(name, name)}")
+            out.append(f"# TYPE {full} histogram")
+            for key, (counts, total, count, buckets) in sorted(series.items()):
+                acc = 0
+                for le, c in zip(buckets + (float("inf"),), counts):
+                    acc += c
+                    out.append(f"{full}_bucket{_fmt_labels(key + (('le', _fmt_value(le)),))} {acc}")
+                out.append(f"{full}_sum{_fmt_labels(key)} {_fmt_value(total)}")
+                out.append(f"{full}_count{_fmt_labels(key)} {count}")
+        for name, series in sorted(snap["counters"].items()):
+            full = self.prefix + name
+            out.append(f"# HELP {full} {self._help.get(name, name)}")
+            out.append(f"# TYPE {full} counter")
+            for key, v in sorted(series.items()):
+                out.append(f"{full}{_fmt_labels(key)} {_fmt_value(v)}")
+        for fn in self._collectors:
+            try:
+                families = list(fn())
+            except Exception:
+                continue  # a failing collector must not break the scrape
+            for name, kind, help, samples in families:
+                full = self.prefix + name
+                out.append(f"# HELP {full} {help}")
+                out.append(f"# TYPE {full} {kind}")
+                for labels, v in samples:
+                    if v is not None:
+                        out.append(f"{full}{_fmt_labels(_labels_key(labels))} {_fmt_value(v)}")
+        return "\n".join(out) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._hist.clear()
+            self._counters.clear()
+            self._values.clear()
+
+
+REGISTRY = Registry()
+observe = REGISTRY.observe
+inc = REGISTRY.inc
+timer = REGISTRY.timer
+timed = REGISTRY.timed
+
+REGISTRY.describe("http_request_seconds", "HTTP request time from receipt to the last body byte")
+REGISTRY.describe("storage_append_seconds", "Tick appends into storage (buffer + sqlite queue)")
+REGISTRY.describe("storage_bars_seconds", "export_resampled: OHLCV bars for one symbol/timeframe")
+REGISTRY.describe("sqlite_flush_seconds", "One batched INSERT + commit by the sqlite writer thread")
+REGISTRY.describe("ingest_batch_seconds", "One ingest queue batch written to storage")
+REGISTRY.describe("analytics_seconds", "Analytics function calls")
+REGISTRY.describe("serialize_seconds", "Response body encoding")
+REGISTRY.describe("ticks_appended_total", "Ticks appended to storage")
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by method, route template and status (streamed bodies included)."""
+
+    def __init__(self, app, registry: Registry = REGISTRY):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.enabled:
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # templates, not raw paths: /api/resampled/{symbol} stays one series
+            path = getattr(route, "path", None) or "unmatched"
+            self.registry.observe("http_request_seconds", time.perf_counter() - t0,
+                                  method=scope["method"], route=path, status=str(status[0]))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for production use: while running, a daemon thread snapshots every other thread's
+    Python stack every `interval` seconds (sys._current_frames) and counts identical stacks. collapsed()
+    returns them as "thread;outer;...;inner count" lines (flamegraph.pl / speedscope input).
+    Costs nothing while stopped; while running, roughly the stack walk per sample.
+    """
+
+    def __init__(self, interval: float = 0.01, max_stacks: int = 50_000, max_depth: int = 64):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.samples = 0
+        self.dropped = 0
+        self.started = None
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = None):
+        if interval is not None:
+            self.interval = max(float(interval), 0.001)
+        if self.running:
+            return
+        self._stop.clear()
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                parts = []
+                while frame is not None and len(parts) < self.max_depth:
+                    co = frame.f_code
+                    parts.append(f"{co.co_name} ({os.path.basename(co.co_filename)}:{co.co_firstlineno})")
+                    frame = frame.f_back
+                parts.append(names.get(tid, f"thread-{tid}"))
+                stacks.append(";".join(reversed(parts)))
+            with self._lock:
+                self.samples += 1
+                for s in stacks:
+                    if s in self._stacks or len(self._stacks) < self.max_stacks:
+                        self._stacks[s] += 1
+                    else:
+                        self.dropped += 1
+
+    def collapsed(self) -> str:
+        with self._lock:
+            items = self._stacks.most_common()
+        return "".join(f"{s} {n}\n" for s, n in items)
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.dropped = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"running": self.running, "interval_ms": round(self.interval * 1000.0, 3), "samples": self.samples,
+                    "stacks": len(self._stacks), "dropped": self.dropped, "started": self.started}
+
+
+PROFILER = SamplingProfiler()
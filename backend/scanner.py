@@ -0,0 +1,186 @@
+# scanner.py - multi-pair cointegration scan: correlation prefilter, then hedge/ADF/half-life per pair in worker processes
+import asyncio
+import itertools
+import math
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from analytics import hedge_ratio_ols, compute_spread, adf_test, half_life
+from align import align
+
+SCAN_BATCH_PAIRS = 4   # pairs per process task (the ADF test dominates: up to seconds per pair on long histories)
+MIN_SCAN_BARS = 30     # aligned bars a pair needs to be tested
+MAX_SCAN_JOBS = 16     # jobs kept for status queries (oldest finished ones are dropped first)
+
+
+def _finite(v):
+    return None if isinstance(v, float) and not math.isfinite(v) else v
+
+
+def test_pairs(keys: np.ndarray, values: np.ndarray, names, pairs, join: str = "inner", stale=None) -> list:
+    """
+    Runs in a worker process. keys: bar timestamps (int64 ns); values: (bars, symbols) closes, NaN where a
+    symbol has no bar; pairs: (i, j) column indexes, tested as /analytics/pair with x = names[i],
+    y = names[j] on their bars aligned by `join`/`stale` (align.py): OLS hedge, ADF on the spread,
+    half-life of the spread in bars.
+    """
+    index = pd.Index(keys)
+    out = []
+    for i, j in pairs:
+        aligned = align({"x": pd.Series(values[:, i], index=index), "y": pd.Series(values[:, j], index=index)},
+                        join, stale)
+        row = {"x": names[i], "y": names[j], "bars": len(aligned)}
+        hr = None
+        if row["bars"] >= MIN_SCAN_BARS:
+            x, y = aligned.series("x"), aligned.series("y")
+            hr = hedge_ratio_ols(y, x)
+        if hr is None:
+            out.append(dict(row, error="insufficient data"))
+            continue
+        spread = compute_spread(y, x, hr["beta"], hr["intercept"])
+        adf = adf_test(spread)
+        row.update(beta=hr["beta"], intercept=hr["intercept"], rsq=hr["rsq"], pvalue=adf["pvalue"],
+                   adf_stat=adf["stat"], half_life=half_life(spread))
+        out.append({k: _finite(v) for k, v in row.items()})
+    return out
+
+
+def rank_key(row):
+    # most significant first, then fastest mean reversion; failed pairs last
+    p, hl = row.get("pvalue"), row.get("half_life")
+    return (p is None, p if p is not None else 0.0, hl is None, hl if hl is not None else 0.0)
+
+
+class ScanJob:
+    """
+    One scan. state: running -> done | cancelled | error; progress is pairs tested out of the candidates the
+    prefilter kept. Every change is also appended to `events`, which follow() replays and then tails, so any
+    number of stream readers can attach at any time.
+    """
+
+    def __init__(self, jid: str, params: dict):
+        self.id = jid
+        self.params = params
+        self.state = "running"
+        self.error = None
+        self.symbols = 0
+        self.total = 0
+        self.done = 0
+        self.results = []
+        self.started = time.time()
+        self.finished = None
+        self.events = []
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def _emit(self, event: dict):
+        self.events.append(event)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def ranked(self, limit: int = None) -> list:
+        rows = sorted(self.results, key=rank_key)
+        return rows if limit is None else rows[:limit]
+
+    def progress(self) -> dict:
+        elapsed = (self.finished or time.time()) - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 and self.state == "running" else None
+        return {"state": self.state, "done": self.done, "total": self.total, "elapsed_s": round(elapsed, 3),
+                "pairs_per_s": round(rate, 3), "eta_s": None if eta is None else round(eta, 1)}
+
+    def status(self, limit: int = 50) -> dict:
+        out = {"id": self.id, "params": self.params, "symbols": self.symbols, **self.progress(),
+               "ranked": self.ranked(limit)}
+        if self.error:
+            out["error"] = self.error
+        return out
+
+    async def follow(self):
+        """All events so far, then new ones as they happen, until the job finishes."""
+        i = 0
+        while True:
+            changed = self._changed
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.finished is not None:
+                return
+            await changed.wait()
+
+    async def run(self, prepare, pool, join: str = "inner", stale=None):
+        # prepare: awaitable -> (timestamps, values, names, candidates as (x, y, corr)); the pairs are then
+        # tested on `pool`
+        futures = []
+        try:
+            keys, values, names, candidates = await prepare
+            col = {n: k for k, n in enumerate(names)}
+            corr = {(x, y): c for x, y, c in candidates}
+            self.symbols, self.total = len(names), len(candidates)
+            self._emit({"type": "started", "id": self.id, "symbols": self.symbols, "total": self.total})
+            for k in range(0, len(candidates), SCAN_BATCH_PAIRS):
+                batch = [(col[x], col[y]) for x, y, _ in candidates[k:k + SCAN_BATCH_PAIRS]]
+                # ship only the columns this batch uses
+                cols = sorted(set(itertools.chain.from_iterable(batch)))
+                local = {c: m for m, c in enumerate(cols)}
+                futures.append(pool.submit(test_pairs, keys, values[:, cols], [names[c] for c in cols],
+                                           [(local[i], local[j]) for i, j in batch], join, stale))
+            for fut in asyncio.as_completed([asyncio.wrap_future(f) for f in futures]):
+                rows = await fut
+                for r in rows:
+                    r["corr"] = corr[(r["x"], r["y"])]
+                self.results.extend(rows)
+                self.done += len(rows)
+                self._emit({"type": "result", "pairs": rows, "done": self.done, "total": self.total})
+            self.state = "done"
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+        except Exception as e:
+            self.state = "error"
+            self.error = str(e)
+        finally:
+            for f in futures:
+                f.cancel()  # queued batches never start; running ones finish and are ignored
+            self.finished = time.time()
+            self._emit(dict({"type": self.state, **self.progress(), "ranked": self.ranked()},
+                            **({"error": self.error} if self.error else {})))
+
+
+class Scanner:
+    """Registry of scan jobs (each an asyncio task on the server loop)."""
+
+    def __init__(self, max_jobs: int = MAX_SCAN_JOBS):
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def start(self, params: dict, prepare, pool, join: str = "inner", stale=None) -> ScanJob:
+        job = ScanJob(str(next(self._ids)), params)
+        job.task = asyncio.create_task(job.run(prepare, pool, join, stale))
+        self.jobs[job.id] = job
+        finished = [j for j in self.jobs.values() if j.finished is not None]
+        while len(self.jobs) > self.max_jobs and finished:
+            self.jobs.pop(finished.pop(0).id)
+        return job
+
+    def get(self, jid: str):
+        return self.jobs.get(jid)
+
+    def cancel(self, jid: str):
+        job = self.jobs.get(jid)
+        if job is not None and job.finished is None:
+            job.task.cancel()
+        return job
+
+    async def cancel_all(self):
+        tasks = [j.task for j in self.jobs.values() if j.finished is None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        states = {}
+        for j in self.jobs.values():
+            states[j.state] = states.get(j.state, 0) + 1
+        return {"jobs": len(self.jobs), **states}
@@ -8,8 +8,11 @@ class Tick(BaseModel):
     size: float
 
 class IngestMode(BaseModel):
-    mode: str  # "ws" or "upload"
+    mode: str  # "ws", "replay" or "upload"
     symbols: Optional[List[str]] = None
+    path: Optional[str] = None   # replay: NDJSON file on the server
+    speed: float = 100.0         # replay: multiple of recorded speed (<= 0: as fast as possible)
+    loop: bool = False           # replay: restart at end of file
 
 class AlertRule(BaseModel):
     id: Optional[int] = None
@@ -18,3 +21,17 @@ class AlertRule(BaseModel):
     metric: str  # "zscore" or "spread"
     op: str      # ">" or "<"
     threshold: float
+    timeframe: str = "1s"   # bars the metric is evaluated on (continuous evaluation)
+    roll_window: int = 60
+    cooldown: float = 0.0   # seconds before the same rule may fire again
+
+class ScanRequest(BaseModel):
+    symbols: List[str]
+    timeframe: str = "1s"
+    min_volume: float = 0.0
+    on: str = "logret"        # prefilter correlation of "logret" (log-returns) or "close" (levels)
+    min_corr: float = 0.5     # keep pairs with |corr| >= min_corr
+    max_pairs: int = 500      # strongest-correlated candidates tested at most
+    bars: Optional[int] = None  # test on the newest N bars only (None: all)
+    join: str = "inner"       # how each pair's bars are paired: inner | ffill | asof (see align.py)
+    max_staleness: Optional[str] = None  # ffill/asof: oldest value carried forward, e.g. "5s"
@@ -1,20 +1,256 @@
-# Simple storage: in-memory time-indexed pandas DataFrames + sqlite persistence for ticks
+# Simple storage: in-memory columnar tick buffers (see tickbuffer.py) + sqlite persistence for ticks,
+# periodically compacted into a columnar on-disk archive (see archive.py)
+import codecs
+import io
+import logging
+import numpy as np
 import pandas as pd
 import sqlite3
 import os
+import threading
+import time
 from datetime import datetime
 from typing import Dict
+from tickbuffer import TickBuffer, to_ns, empty_tick_frame, NS_PER_MS, DEFAULT_RETENTION_NS
+from barcache import BarCache, BarSeries, timeframe_ns
+from archive import TickArchive
+import metrics
 
 DB_FILE = "ticks.db"
+ARCHIVE_DIR = "tick_archive"
+COMPACT_BATCH_ROWS = 500_000
+EXPORT_BLOCK_ROWS = 100_000
+NDJSON_CHUNK_ROWS = 200_000
+FLUSH_ROWS = 5000
+FLUSH_INTERVAL_S = 0.25
+MAX_PENDING_ROWS = 1_000_000  # ticks queued for sqlite before producers are held back
+PUT_TIMEOUT_S = 1.0           # how long a producer waits for room before its rows are dropped (and counted)
+RETRY_BASE_S = 0.1            # backoff after a failed flush, doubling per consecutive failure up to RETRY_MAX_S
+RETRY_MAX_S = 5.0
+CLOSE_ATTEMPTS = 3            # consecutive failed flushes after which a closing writer gives up its queue
+
+log = logging.getLogger(__name__)
+
+
+def _latin1_fallback(err: UnicodeDecodeError):
+    # decode error handler: bytes that are not valid UTF-8 are read as latin-1 instead of failing the upload
+    return err.object[err.start:err.end].decode("latin-1"), err.end
+
+
+codecs.register_error("latin1_fallback", _latin1_fallback)
+
+
+def ndjson_ts_ns(ts: pd.Series) -> np.ndarray:
+    """int64 ns for an NDJSON ts column; each value may be epoch ms (number or numeric string) or ISO."""
+    if pd.api.types.is_numeric_dtype(ts):
+        return ts.to_numpy(dtype=np.int64) * NS_PER_MS
+    try:  # all ISO (the usual case for string columns): one parse
+        parsed = pd.to_datetime(ts, utc=True, format="ISO8601")
+        return parsed.dt.tz_localize(None).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    except (ValueError, TypeError):
+        pass  # mixed: epoch ms where the value is numeric, ISO for the rest
+    ms = pd.to_numeric(ts, errors="coerce")
+    is_ms = ms.notna().to_numpy()
+    out = np.empty(len(ts), dtype=np.int64)
+    out[is_ms] = ms.to_numpy()[is_ms].astype(np.int64) * NS_PER_MS
+    if not is_ms.all():
+        parsed = pd.to_datetime(ts[~is_ms], utc=True, format="ISO8601", errors="coerce")
+        if parsed.isna().any():
+            raise ValueError(f"ts {ts[~is_ms][parsed.isna()].iloc[0]!r} is neither epoch ms nor ISO 8601")
+        out[~is_ms] = parsed.dt.tz_localize(None).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    return out
+
+
+class TickWriter:
+    """
+    Batched sqlite writer: a single long-lived WAL connection owned by a background thread.
+    Producers only append to an in-memory queue (no disk I/O on the caller); the thread flushes with
+    executemany whenever FLUSH_ROWS rows are pending or FLUSH_INTERVAL_S has elapsed.
+    A batch that fails with a transient error (locked or full database) goes back to the front of the queue and is
+    retried with exponential backoff. The queue is capped at max_pending rows: producers wait up to put_timeout
+    for room, after which their rows are dropped and counted (they stay in memory, only durability is lost).
+    """
+
+    def __init__(self, db_file: str, flush_rows: int = FLUSH_ROWS, flush_interval: float = FLUSH_INTERVAL_S,
+                 max_pending: int = MAX_PENDING_ROWS, put_timeout: float = PUT_TIMEOUT_S):
+        self.db_file = db_file
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self._pending = []  # rows (symbol, ts, price, size) waiting for the next flush
+        self._cond = threading.Condition()
+        self._closed = False
+        self._flush_requested = False
+        self._in_flight = 0
+        self._failures = 0  # consecutive failed flushes
+        # counters (read via stats())
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.flushes = 0
+        self.errors = 0
+        self.retries = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self.max_queue_depth = 0
+        self._thread = threading.Thread(target=self._run, name="tick-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, symbol: str, ts, price: float, size: float):
+        self.put_many([(symbol, ts, price, size)])
+
+    def put_many(self, rows):
+        rows = list(rows)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("TickWriter is closed")
+            # backpressure: hold the producer while the queue is full (sqlite slow or down)
+            if not self._cond.wait_for(lambda: self._closed or len(self._pending) < self.max_pending, self.put_timeout):
+                self.rows_dropped += len(rows)
+                log.warning("sqlite writer queue full (%d rows): dropped %d rows", len(self._pending), len(rows))
+                return
+            if self._closed:
+                raise RuntimeError("TickWriter is closed")
+            self._pending.extend(rows)
+            depth = len(self._pending)
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+            if depth >= self.flush_rows:
+                self._cond.notify_all()
+
+    def _run(self):
+        # WAL is set once by TickStorage._ensure_db (it persists in the file): switching modes here would race
+        # the constructor's and compaction's connections for an exclusive lock and kill this thread
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS ticks (symbol TEXT, ts TEXT, price REAL, size REAL)")
+        conn.commit()
+        try:
+            while True:
+                with self._cond:
+                    if self._failures:
+                        # back off before retrying the requeued batch (not cut short by new rows or close)
+                        self._cond.wait_for(lambda: False, min(RETRY_BASE_S * 2 ** (self._failures - 1), RETRY_MAX_S))
+                    else:
+                        self._cond.wait_for(
+                            lambda: self._closed or self._flush_requested or len(self._pending) >= self.flush_rows,
+                            self.flush_interval,
+                        )
+                    batch, self._pending = self._pending, []
+                    self._in_flight = len(batch)
+                    self._flush_requested = False
+                    done = self._closed
+                    self._cond.notify_all()  # room for producers held back by a full queue
+                ok = self._write(conn, batch) if batch else True
+                with self._cond:
+                    self._in_flight = 0
+                    if ok:
+                        self._failures = 0
+                    else:
+                        self._failures += 1
+                        if done and self._failures >= CLOSE_ATTEMPTS:
+                            self.rows_dropped += len(batch) + len(self._pending)
+                            log.error("sqlite writer closing after %d failed flushes: %d rows not persisted",
+                                      self._failures, len(batch) + len(self._pending))
+                            self._pending = []
+                        else:
+                            self._pending[:0] = batch  # oldest rows first, ahead of anything queued meanwhile
+                            self.retries += 1
+                    self._cond.notify_all()
+                    if done and not self._pending:
+                        break
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch) -> bool:
+        # False if the batch should be retried; rows sqlite rejects outright are dropped (retrying cannot help)
+        t0 = time.perf_counter()
+        ok = True
+        try:
+            conn.executemany("INSERT INTO ticks (symbol, ts, price, size) VALUES (?, ?, ?, ?)", batch)
+            conn.commit()
+            self.rows_written += len(batch)
+        except sqlite3.OperationalError as e:
+            # locked, busy, disk full or I/O error: transient
+            conn.rollback()
+            self.errors += 1
+            ok = False
+            log.warning("sqlite flush of %d rows failed (%s); retrying", len(batch), e)
+        except sqlite3.Error:
+            conn.rollback()
+            self.errors += 1
+            self.rows_dropped += len(batch)
+            log.exception("sqlite flush of %d rows failed; rows dropped", len(batch))
+        ms = (time.perf_counter() - t0) * 1000.0
+        metrics.observe("sqlite_flush_seconds", ms / 1000.0)
+        self.flushes += 1
+        self.last_flush_ms = ms
+        self._total_flush_ms += ms
+        self.max_flush_ms = max(self.max_flush_ms, ms)
+        return ok
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Block until everything queued so far has been committed. Returns False if that did not happen: timeout,
+        or a flush failed (the rows stay queued for the writer's retries).
+        """
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: (not self._pending and not self._in_flight) or self._failures, timeout)
+            return not self._pending and not self._in_flight
+
+    def close(self, timeout: float = 30.0):
+        """Durable shutdown: stop accepting rows, flush the queue and close the connection."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth = len(self._pending) + self._in_flight
+        return {
+            "queue_depth": depth,
+            "max_queue_depth": self.max_queue_depth,
+            "max_pending": self.max_pending,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "retries": self.retries,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
 
 class TickStorage:
-    def __init__(self, db_file=DB_FILE):
+    def __init__(self, db_file=DB_FILE, archive_dir=ARCHIVE_DIR):
         self.db_file = db_file
         self._ensure_db()
-        # in-memory per-symbol DataFrame (columns: ts (datetime), price, size)
-        self.dfs = {}  # symbol -> DataFrame
+        self.writer = TickWriter(db_file)
+        # columnar history (symbol/day partitions); sqlite only holds ticks not compacted yet
+        self.archive = TickArchive(archive_dir)
+        self._archive_symbols = set(self.archive.symbols())
+        self._recover_archive()
+        # in-memory per-symbol columnar tick buffers (int64 ns ts, float64 price/size), 7-day retention;
+        # created on first use, archived ticks are paged in as reads ask for them (see _page_in).
+        # buffers, _paged and _archive_symbols are replaced, never mutated, so readers use them without locking
+        self.buffers = {}  # type: Dict[str, TickBuffer]
+        self._paged = {}   # symbol -> oldest ts (ns) archived ticks have been paged in from
+        self._lock = threading.RLock()
+        self.last_compaction = None
+        # bumped whenever compaction moves rows into the archive / bars are uploaded (see data_version)
+        self.archive_version = 0
+        self.bars_version = 0
         # optional in-memory OHLCV bars loaded from files: bars[symbol][timeframe] -> DataFrame
         self.bars = {}  # type: Dict[str, Dict[str, pd.DataFrame]]
+        # incrementally maintained OHLCV bars computed from the tick buffers
+        self.bar_cache = BarCache()
 
     def _ensure_db(self):
         if not os.path.exists(self.db_file):
@@ -24,37 +260,352 @@ class TickStorage:
             )
             conn.commit()
             conn.close()
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS archive_log (name TEXT PRIMARY KEY)")
+        conn.commit()
+        conn.close()
 
-    def append_tick(self, symbol: str, ts_iso: str, price: float, size: float):
-        ts = pd.to_datetime(ts_iso)
-        # append to sqlite
-        conn = sqlite3.connect(self.db_file)
-        conn.execute(
-            "INSERT INTO ticks (symbol, ts, price, size) VALUES (?, ?, ?, ?)",
-            (symbol, ts_iso, float(price), float(size)),
-        )
+    def _recover_archive(self):
+        # finish (or roll back) a compaction interrupted between writing parts and promoting them
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        committed = {r[0] for r in conn.execute("SELECT name FROM archive_log")}
+        self.archive.recover(committed)
+        conn.execute("DELETE FROM archive_log")
         conn.commit()
         conn.close()
-        # update in-memory
-        df = self.dfs.get(symbol)
-        row = {"ts": ts, "price": float(price), "size": float(size)}
-        if df is None:
-            self.dfs[symbol] = pd.DataFrame([row]).set_index("ts")
-        else:
-            self.dfs[symbol] = pd.concat([df, pd.DataFrame([row]).set_index("ts")])
-            # trim memory to last N points (optional)
-            self.dfs[symbol] = self.dfs[symbol].sort_index().last("7D")  # keep 7 days max
-
-    def get_raw(self, symbol: str):
-        return self.dfs.get(symbol, pd.DataFrame(columns=["price","size"]))
+
+    def _buffer(self, symbol: str, create: bool = False, capacity: int = 1024):
+        """The symbol's tick buffer (created if create), without paging anything in from the archive."""
+        buf = self.buffers.get(symbol)
+        if buf is not None or not create:
+            return buf
+        with self._lock:
+            buf = self.buffers.get(symbol)
+            if buf is None:
+                buf = TickBuffer(capacity=capacity)
+                self.buffers = {**self.buffers, symbol: buf}
+        return buf
+
+    def _page_in(self, symbol: str, start_ns=None, end_ns=None):
+        # make the buffer hold the archived ticks a read of [start_ns, end_ns) needs, within the retention window
+        # (start_ns None: all of it); returns the buffer. Only ticks older than everything in the buffer are
+        # loaded, so nothing is loaded twice and each widening is one merge (one generation bump)
+        buf = self.buffers.get(symbol)
+        paged = self._paged.get(symbol)
+        if symbol not in self._archive_symbols or (paged is not None and start_ns is not None and start_ns >= paged):
+            return buf
+        with self._lock:
+            buf = self.buffers.get(symbol)
+            last = buf.last() if buf is not None else None
+            newest = last[0] if last is not None else self.archive.last_ts(symbol)
+            if newest is None:
+                return buf
+            lo = newest - DEFAULT_RETENTION_NS
+            if start_ns is not None:
+                lo = max(lo, start_ns)
+            paged = self._paged.get(symbol)
+            if (paged is not None and lo >= paged) or (end_ns is not None and end_ns <= lo):
+                return buf  # already held, or the read is older than the retention window (served from the archive)
+            first = buf.first_ts() if buf is not None else None
+            ts, price, size = self.archive.read(symbol, lo, first)
+            if buf is None:
+                buf = TickBuffer(capacity=ts.size * 2)
+                self.buffers = {**self.buffers, symbol: buf}
+            buf.extend(ts, price, size)
+            self._paged = {**self._paged, symbol: lo}
+        return buf
+
+    def _snapshot(self, symbol: str, start_ns=None, end_ns=None):
+        """Point-in-time TickSnapshot of the symbol's buffer, after paging in what a read of [start_ns, end_ns) needs; or None."""
+        buf = self._page_in(symbol, start_ns, end_ns)
+        return buf.snapshot() if buf is not None else None
+
+    def _peek(self, symbol: str):
+        # the buffer's current snapshot without paging anything in (versions, latest tick)
+        buf = self.buffers.get(symbol)
+        return buf.snapshot() if buf is not None else None
+
+    def append_tick(self, symbol: str, ts_iso: str, price: float, size: float):
+        with metrics.timer("storage_append_seconds", op="append_tick"):
+            ts_ns = to_ns(ts_iso)
+            # queue for sqlite; the writer thread batches the actual INSERTs
+            self.writer.put(symbol, str(ts_iso), float(price), float(size))
+            # update in-memory (amortized O(1); buffer trims itself to the retention window)
+            buf = self._buffer(symbol, create=True)
+            buf.append(ts_ns, float(price), float(size))
+        metrics.inc("ticks_appended_total", symbol=symbol)
+
+    def append_ticks(self, symbol: str, ts_ns, price, size):
+        """
+        Bulk append one symbol's block of ticks (ts_ns: int64 ns array; price/size: float arrays).
+        The buffer takes the block in a single extend and sqlite gets it as one queued batch.
+        """
+        ts_ns = np.asarray(ts_ns, dtype=np.int64)
+        price = np.asarray(price, dtype=np.float64)
+        size = np.asarray(size, dtype=np.float64)
+        if ts_ns.size == 0:
+            return
+        with metrics.timer("storage_append_seconds", op="append_ticks"):
+            if (ts_ns % NS_PER_MS).any():
+                ts_col = np.datetime_as_string(ts_ns.view("datetime64[ns]"), unit="us").tolist()
+            else:
+                ts_col = (ts_ns // NS_PER_MS).tolist()  # whole-ms ticks (live trades) stay int64 epoch ms
+            self.writer.put_many(zip([symbol] * ts_ns.size, ts_col, price.tolist(), size.tolist()))
+            buf = self._buffer(symbol, create=True, capacity=ts_ns.size * 2)
+            buf.extend(ts_ns, price, size)
+        metrics.inc("ticks_appended_total", ts_ns.size, symbol=symbol)
+
+    def close(self):
+        self.writer.close()
+
+    def symbols(self):
+        buffers = self.buffers
+        return list(buffers) + sorted(self._archive_symbols.difference(buffers))
+
+    def latest(self, symbol: str):
+        """(ts_ns, price, size) of the newest tick for symbol, or None."""
+        buf = self.buffers.get(symbol)
+        if buf is not None:
+            return buf.last()
+        # not paged in yet: peek at the archive's last part instead of hydrating the buffer
+        return self.archive.last(symbol) if symbol in self._archive_symbols else None
+
+    def data_version(self, symbol: str, timeframe: str):
+        """
+        Hashable version of what a bar read for symbol/timeframe sees, for memoizing analytics. It changes with
+        every appended tick (results include the open bar, which any tick may move), when history is rewritten
+        (late ticks, archived ticks paged in), on compaction and on bar uploads.
+        """
+        sym = symbol.lower()
+        if timeframe in self.bars.get(sym, {}):
+            return ("bars", self.bars_version)
+        snap = self._peek(sym)
+        if snap is None:
+            return (self.archive_version, None, None)
+        return (self.archive_version, snap.generation, snap.appended)
+
+    def history_version(self, symbol: str, timeframe: str):
+        """
+        The part of data_version that ticks appended in time order leave alone: it changes only when history
+        already read may have been rewritten (late ticks, archived ticks paged in, compaction, bar uploads). Incremental state fed with
+        closed bars (PairState, CorrelationEngine) is rebuilt when it changes.
+        """
+        sym = symbol.lower()
+        if timeframe in self.bars.get(sym, {}):
+            return ("bars", self.bars_version)
+        snap = self._peek(sym)
+        return (self.archive_version, snap.generation if snap is not None else None)
+
+    def open_bar_ts(self, symbol: str, timeframe: str):
+        """
+        Start (ns) of the bar the newest tick falls in - the only bar of symbol/timeframe that in-order ticks
+        still change; None when there is none (uploaded bars, no in-memory ticks).
+        """
+        sym = symbol.lower()
+        if timeframe in self.bars.get(sym, {}):
+            return None
+        snap = self._peek(sym)
+        last = snap.last() if snap is not None else None
+        if last is None:
+            return None
+        tf_ns = timeframe_ns(timeframe)
+        if tf_ns is not None:
+            return last[0] - last[0] % tf_ns
+        # calendar timeframes (week, month...): let resample place the tick
+        one = pd.Series([0.0], index=pd.DatetimeIndex(np.array([last[0]], dtype="datetime64[ns]")))
+        return int(one.resample(timeframe, origin="epoch").sum().index.as_unit("ns").asi8[0])
+
+    def closed_version(self, symbol: str, timeframe: str):
+        """
+        The part of data_version that ticks inside the open bar leave alone: history_version plus the open bar's
+        start, so it changes when a bar closes or history is rewritten. Results over closed bars key on it.
+        """
+        return self.history_version(symbol, timeframe) + (self.open_bar_ts(symbol, timeframe),)
+
+    def get_raw(self, symbol: str, start_ns: int = None, end_ns: int = None):
+        """
+        Ticks for symbol in [start_ns, end_ns) as a DataFrame (ts index). The in-memory buffer serves the
+        recent part; anything older than the buffer is read from the archive for just the requested window.
+        """
+        return self._raw(symbol, self._snapshot(symbol, start_ns, end_ns), start_ns, end_ns)
+
+    def _raw(self, symbol: str, buf, start_ns=None, end_ns=None):
+        # get_raw over a given buffer snapshot (buf may be None)
+        first = buf.first_ts() if buf is not None and len(buf) else None
+        if first is not None and (start_ns is None or start_ns >= first):
+            return buf.to_frame(start_ns, end_ns)
+        if symbol not in self._archive_symbols:
+            return empty_tick_frame() if buf is None else buf.to_frame(start_ns, end_ns)
+        hist_end = first if end_ns is None or (first is not None and first < end_ns) else end_ns
+        ts, price, size = self.archive.read(symbol, start_ns, hist_end)
+        hist = pd.DataFrame({"price": price, "size": size}, index=pd.DatetimeIndex(ts.view("datetime64[ns]"), name="ts"))
+        if first is None or hist_end != first:
+            return hist
+        return pd.concat([hist, buf.to_frame(None, end_ns)])
+
+    def iter_ticks(self, symbol: str, start_ns: int = None, end_ns: int = None, block_rows: int = EXPORT_BLOCK_ROWS):
+        """
+        Yield (ts_ns, price, size) array blocks for start_ns <= ts < end_ns in time order: archived history
+        first (one part at a time), then the in-memory buffer. Memory use is bounded by block_rows/part size.
+        """
+        sym = symbol.lower()
+        buf = self._peek(sym)
+        first = buf.first_ts() if buf is not None and len(buf) else None
+        if sym in self._archive_symbols:
+            hist_end = end_ns if first is None else (first if end_ns is None else min(first, end_ns))
+            if start_ns is None or hist_end is None or start_ns < hist_end:
+                yield from self.archive.iter_blocks(sym, start_ns, hist_end, block_rows)
+        if first is not None and (end_ns is None or end_ns > first):
+            ts, price, size = buf.view(start_ns, end_ns)
+            for i in range(0, ts.size, block_rows):
+                yield ts[i:i + block_rows], price[i:i + block_rows], size[i:i + block_rows]
+
+    def iter_bars(self, symbol: str, timeframe: str, start_ns: int = None, end_ns: int = None,
+                  block_rows: int = EXPORT_BLOCK_ROWS):
+        """
+        Yield OHLCV bar frames (bars starting in [start_ns, end_ns)) in time order, aggregated block by block
+        from iter_ticks so long histories never materialize at once. Uploaded bars and timeframes without a
+        fixed width come from export_resampled, sliced into blocks.
+        """
+        sym = symbol.lower()
+        tf_ns = timeframe_ns(timeframe)
+        if (sym in self.bars and timeframe in self.bars[sym]) or tf_ns is None:
+            df = self.export_resampled(sym, timeframe, start_ns, end_ns)
+            if df is not None:
+                for i in range(0, len(df), block_rows):
+                    yield df.iloc[i:i + block_rows]
+            return
+        lo = start_ns - start_ns % tf_ns if start_ns is not None else None
+        hi = (end_ns - 1) - (end_ns - 1) % tf_ns + tf_ns if end_ns is not None else None
+        series = BarSeries(tf_ns)
+
+        def in_range(df):
+            idx = df.index.as_unit("ns").asi8
+            i = int(np.searchsorted(idx, start_ns, side="left")) if start_ns is not None else 0
+            j = int(np.searchsorted(idx, end_ns, side="left")) if end_ns is not None else len(idx)
+            return df.iloc[i:max(i, j)]
+
+        for ts, price, size in self.iter_ticks(sym, lo, hi, block_rows):
+            series.add_ticks(ts, price, size)
+            if len(series) > block_rows:
+                closed = in_range(series.pop_closed())
+                if len(closed):
+                    yield closed
+        rest = in_range(series.pop_closed())
+        if len(rest):
+            yield rest
+        last = in_range(series.to_frame())
+        if len(last):
+            yield last
+
+    def compact(self, batch_rows: int = COMPACT_BATCH_ROWS) -> dict:
+        """
+        Move ticks from the sqlite hot table into the columnar archive. Per batch: write the parts as
+        .pending files, delete the source rows and log the part names in one transaction, then promote.
+        A crash at any point leaves every tick in exactly one place (see _recover_archive). Afterwards the
+        small parts of every symbol compacted into are merged (TickArchive.merge_small_parts).
+        """
+        t0 = time.perf_counter()
+        self.writer.flush()
+        moved = 0
+        parts = 0
+        touched = set()
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            while True:
+                rows = conn.execute(
+                    "SELECT rowid, symbol, ts, price, size FROM ticks ORDER BY rowid LIMIT ?", (batch_rows,)
+                ).fetchall()
+                if not rows:
+                    break
+                df = pd.DataFrame(rows, columns=["rowid", "symbol", "ts", "price", "size"])
+                ts = df["ts"].astype(str)
+                is_ms = ts.str.fullmatch(r"\d+")
+                ts_ns = np.empty(len(df), dtype=np.int64)
+                ts_ns[is_ms.to_numpy()] = ts[is_ms].astype(np.int64).to_numpy() * NS_PER_MS
+                if not is_ms.all():
+                    parsed = pd.to_datetime(ts[~is_ms], utc=True, format="ISO8601").dt.tz_localize(None)
+                    ts_ns[~is_ms.to_numpy()] = parsed.to_numpy(dtype="datetime64[ns]").view(np.int64)
+                price = df["price"].to_numpy(dtype=np.float64)
+                size = df["size"].fillna(0.0).to_numpy(dtype=np.float64)
+                pending = []
+                symbols = df["symbol"].astype(str).str.lower()
+                for sym, idx in symbols.groupby(symbols).indices.items():
+                    pending += self.archive.write_pending(sym, ts_ns[idx], price[idx], size[idx])
+                names = [(os.path.basename(p)[:-len(".pending")],) for p in pending]
+                with self._lock:
+                    with conn:
+                        conn.execute("DELETE FROM ticks WHERE rowid <= ?", (int(df["rowid"].iloc[-1]),))
+                        conn.executemany("INSERT OR IGNORE INTO archive_log (name) VALUES (?)", names)
+                    self.archive.promote(pending)
+                    self._archive_symbols = self._archive_symbols.union(symbols.unique())
+                    self.archive_version += 1
+                    with conn:
+                        conn.execute("DELETE FROM archive_log")
+                moved += len(df)
+                parts += len(pending)
+                touched.update(symbols.unique())
+        finally:
+            conn.close()
+        merged = sum(self.archive.merge_small_parts(sym) for sym in sorted(touched))
+        self.last_compaction = {"rows": moved, "parts": parts, "merged": merged, "seconds": round(time.perf_counter() - t0, 3),
+                                "at": datetime.utcnow().isoformat()}
+        return self.last_compaction
+
+    def stats(self) -> dict:
+        return {"writer": self.writer.stats(), "archive": self.archive.stats(),
+                "buffers": {s: len(b) for s, b in self.buffers.items()}, "last_compaction": self.last_compaction}
 
     def load_from_ndjson_text(self, ndjson_text: str):
-        # expect lines of {"symbol":..., "ts":..., "price":..., "size":...}
-        import json
-        for line in ndjson_text.strip().splitlines():
-            if not line.strip(): continue
-            j = json.loads(line)
-            self.append_tick(j["symbol"], j["ts"], j["price"], j.get("size", 0.0))
+        return self.load_ndjson_stream(io.StringIO(ndjson_text))
+
+    def load_ndjson_stream(self, fileobj, chunksize: int = NDJSON_CHUNK_ROWS, progress=None):
+        """
+        Bulk-load NDJSON ticks ({"symbol":..., "ts":..., "price":..., "size":...} per line) from a file object.
+        Lines are parsed chunksize at a time into columns, then each symbol's block is appended in one call.
+        ts may be an ISO string or epoch milliseconds (mixed freely). Binary files are read as UTF-8, falling
+        back to latin-1 for bytes that are not valid UTF-8. progress(stats) is called after every chunk.
+        Returns {"loaded", "symbols", "seconds", "rows_per_sec"}; on bad input raises ValueError saying how
+        many rows were loaded before it (those stay loaded).
+        """
+        t0 = time.perf_counter()
+        loaded = 0
+        symbols = set()
+        stats = {"loaded": 0, "symbols": [], "seconds": 0.0, "rows_per_sec": 0.0}
+        text = fileobj if isinstance(fileobj, io.TextIOBase) else \
+            io.TextIOWrapper(fileobj, encoding="utf-8", errors="latin1_fallback", newline="")
+        try:
+            reader = pd.read_json(text, lines=True, chunksize=chunksize, convert_dates=False, dtype=False)
+            for chunk in reader:
+                if chunk.empty:
+                    continue
+                if "size" not in chunk.columns:
+                    chunk["size"] = 0.0
+                ts_ns = ndjson_ts_ns(chunk["ts"])
+                price = chunk["price"].to_numpy(dtype=np.float64)
+                size = chunk["size"].fillna(0.0).to_numpy(dtype=np.float64)
+                # group rows by symbol with one stable sort (keeps per-symbol time order)
+                codes, names = pd.factorize(chunk["symbol"].astype(str).str.lower())
+                order = np.argsort(codes, kind="stable")
+                splits = np.searchsorted(codes[order], np.arange(1, len(names)))
+                for s, idx in zip(names, np.split(order, splits)):
+                    self.append_ticks(s, ts_ns[idx], price[idx], size[idx])
+                    symbols.add(s)
+                loaded += len(chunk)
+                elapsed = time.perf_counter() - t0
+                stats = {"loaded": loaded, "symbols": sorted(symbols), "seconds": round(elapsed, 3),
+                         "rows_per_sec": round(loaded / elapsed, 1) if elapsed > 0 else 0.0}
+                if progress is not None:
+                    progress(stats)
+        except (ValueError, TypeError, KeyError) as e:
+            # chunks are all-or-nothing, so the rows before this chunk are exactly what was loaded
+            what = f"missing field {e}" if isinstance(e, KeyError) else str(e)
+            raise ValueError(f"{what} ({loaded} rows loaded before the error)") from e
+        finally:
+            if text is not fileobj:
+                text.detach()  # leave the caller's file open
+        return stats
 
     def load_ohlcv_csv_text(self, symbol: str, timeframe: str, csv_text: str):
         """
@@ -73,24 +624,59 @@ class TickStorage:
         df.columns = ["ts", "open", "high", "low", "close", "volume"]
         df["ts"] = pd.to_datetime(df["ts"])  # parse timestamps
         df = df.sort_values("ts").set_index("ts")
+        # ns like every other bar index: callers compare asi8 with ns bounds (pandas may parse to us)
+        df.index = df.index.as_unit("ns")
         # store in bars dict
         sym = symbol.lower()
         tf = timeframe
         if sym not in self.bars:
             self.bars[sym] = {}
         self.bars[sym][tf] = df
+        self.bars_version += 1
+
+    def export_resampled(self, symbol: str, timeframe: str, start_ns: int = None, end_ns: int = None):
+        """
+        OHLCV bars for symbol/timeframe, optionally only bars starting in [start_ns, end_ns).
+        The range is pushed down: recent ranges are sliced from the incremental bar cache, older ones are
+        built from just that window of archived ticks.
+        """
+        # label only real timeframes: anything a client can type would otherwise become its own series
+        label = timeframe if timeframe_ns(timeframe) is not None else metrics.OTHER
+        with metrics.timer("storage_bars_seconds", timeframe=label):
+            return self._export_resampled(symbol, timeframe, start_ns, end_ns)
 
-    def export_resampled(self, symbol: str, timeframe: str):
+    def _export_resampled(self, symbol: str, timeframe: str, start_ns: int = None, end_ns: int = None):
         # If pre-loaded OHLCV bars exist for the symbol/timeframe, return them
         sym = symbol.lower()
         if sym in self.bars and timeframe in self.bars[sym]:
             df_bars = self.bars[sym][timeframe]
-            return df_bars
-        # Otherwise compute from raw ticks if available
-        df = self.get_raw(sym)
-        if df.empty:
+            if start_ns is None and end_ns is None:
+                return df_bars
+            idx = df_bars.index.as_unit("ns").asi8
+            i = int(np.searchsorted(idx, start_ns, side="left")) if start_ns is not None else 0
+            j = int(np.searchsorted(idx, end_ns, side="left")) if end_ns is not None else len(idx)
+            return df_bars.iloc[i:max(i, j)]
+        # Otherwise compute from raw ticks if available (one buffer snapshot for the whole read)
+        buf = self._snapshot(sym, start_ns, end_ns)
+        first = buf.first_ts() if buf is not None and len(buf) else None
+        if first is None and sym not in self._archive_symbols:
             return None
-        ohlc = df["price"].resample(timeframe).ohlc()
-        vol = df["size"].resample(timeframe).sum().rename("volume")
+        tf_ns = timeframe_ns(timeframe)
+        if first is not None and (start_ns is None or sym not in self._archive_symbols
+                                  or start_ns >= first - first % (tf_ns or 1)):
+            res = self.bar_cache.get(sym, timeframe, buf, start_ns, end_ns)
+            if res is not None:
+                return res
+        # window reaches past the buffer (archive) or timeframe without a fixed width: build from ticks
+        if tf_ns is not None:
+            # read whole bars: from the bucket containing start_ns to the end of the last bar starting before end_ns
+            lo = start_ns - start_ns % tf_ns if start_ns is not None else None
+            hi = (end_ns - 1) - (end_ns - 1) % tf_ns + tf_ns if end_ns is not None else None
+            df = self._raw(sym, buf, lo, hi)
+            series = BarSeries.from_ticks(tf_ns, df.index.asi8, df["price"].to_numpy(), df["size"].to_numpy())
+            return series.to_frame(start_ns, end_ns)
+        df = self._raw(sym, buf, start_ns, end_ns)
+        ohlc = df["price"].resample(timeframe, origin="epoch").ohlc()
+        vol = df["size"].resample(timeframe, origin="epoch").sum().rename("volume")
         res = pd.concat([ohlc, vol], axis=1).dropna()
         return res
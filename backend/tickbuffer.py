@@ -0,0 +1,241 @@
+# tickbuffer.py - per-symbol columnar tick buffer (numpy-backed, amortized O(1) appends)
+import threading
+import numpy as np
+import pandas as pd
+
+NS_PER_MS = 1_000_000
+DEFAULT_RETENTION_NS = 7 * 24 * 3600 * 1_000_000_000  # 7 days
+_MIN_CAPACITY = 1024
+
+
+def to_ns(ts) -> int:
+    """
+    Convert a tick timestamp into int64 nanoseconds since epoch (UTC, tz-naive).
+    Accepts ISO strings, datetime/Timestamp objects or integer epoch milliseconds (Binance convention).
+    """
+    if isinstance(ts, (int, np.integer)):
+        return int(ts) * NS_PER_MS
+    t = pd.Timestamp(ts)
+    if t.tzinfo is not None:
+        t = t.tz_convert("UTC").tz_localize(None)
+    return int(t.value)
+
+
+class TickSnapshot:
+    """
+    Immutable point-in-time view of a TickBuffer: the arrays plus the [lo, hi) rows that were live when it
+    was taken. Rows inside that range are never written again, so a snapshot stays consistent however much
+    is appended (or trimmed) afterwards and can be read from any thread without locking.
+    """
+
+    __slots__ = ("ts", "price", "size", "lo", "hi", "retention_ns", "appended", "generation")
+
+    def __init__(self, ts, price, size, lo, hi, retention_ns, appended, generation):
+        self.ts, self.price, self.size = ts, price, size
+        self.lo, self.hi = lo, hi
+        self.retention_ns = retention_ns
+        self.appended = appended
+        self.generation = generation
+
+    def __len__(self):
+        return self.hi - self.lo
+
+    def _cutoff(self):
+        if self.retention_ns is None or self.hi == self.lo:
+            return None
+        return int(self.ts[self.hi - 1]) - self.retention_ns
+
+    def _bounds(self, start_ns=None, end_ns=None):
+        lo, hi = self.lo, self.hi
+        cutoff = self._cutoff()
+        if cutoff is not None and (start_ns is None or start_ns < cutoff):
+            start_ns = cutoff
+        ts = self.ts[lo:hi]
+        i = int(np.searchsorted(ts, start_ns, side="left")) if start_ns is not None else 0
+        j = int(np.searchsorted(ts, end_ns, side="left")) if end_ns is not None else hi - lo
+        return lo + i, lo + max(i, j)
+
+    def view(self, start_ns=None, end_ns=None):
+        """Zero-copy (ts, price, size) array views for ticks with start_ns <= ts < end_ns."""
+        i, j = self._bounds(start_ns, end_ns)
+        return self.ts[i:j], self.price[i:j], self.size[i:j]
+
+    def tail(self, n: int):
+        """Zero-copy views of the newest n rows (n is clipped to the rows held)."""
+        i = max(self.hi - int(n), self.lo)
+        return self.ts[i:self.hi], self.price[i:self.hi], self.size[i:self.hi]
+
+    def first_ts(self):
+        """Timestamp (ns) of the oldest tick inside the retention window, or None if empty."""
+        i, j = self._bounds()
+        return int(self.ts[i]) if j > i else None
+
+    def last(self):
+        """Return (ts_ns, price, size) of the newest tick, or None if empty."""
+        if self.hi == self.lo:
+            return None
+        i = self.hi - 1
+        return int(self.ts[i]), float(self.price[i]), float(self.size[i])
+
+    def to_frame(self, start_ns=None, end_ns=None) -> pd.DataFrame:
+        """Wrap a time slice as a ts-indexed DataFrame (columns: price, size)."""
+        ts, price, size = self.view(start_ns, end_ns)
+        index = pd.DatetimeIndex(ts.view("datetime64[ns]"), name="ts")
+        return pd.DataFrame({"price": price, "size": size}, index=index, copy=False)
+
+
+class TickBuffer:
+    """
+    Columnar tick store for a single symbol: int64 ns timestamps, float64 price and size.
+    Rows live in [lo, hi) of preallocated arrays kept sorted by timestamp. In-order appends write in place
+    past hi; anything that would move existing rows (compaction, growth, late ticks) allocates fresh arrays.
+    After every write a new TickSnapshot is published with a single attribute store, so readers on other
+    threads never lock and never see a half-applied write. Writers are serialized by a per-buffer lock.
+    """
+
+    def __init__(self, capacity: int = _MIN_CAPACITY, retention_ns: int = DEFAULT_RETENTION_NS):
+        capacity = max(int(capacity), _MIN_CAPACITY)
+        self.retention_ns = retention_ns
+        self._ts = np.empty(capacity, dtype=np.int64)
+        self._price = np.empty(capacity, dtype=np.float64)
+        self._size = np.empty(capacity, dtype=np.float64)
+        self._lo = 0
+        self._hi = 0
+        # total rows ever appended, and a counter bumped whenever existing rows are rewritten
+        # (late ticks); derived caches use the pair to consume only new rows
+        self.appended = 0
+        self.generation = 0
+        self._write_lock = threading.Lock()
+        self._publish()
+
+    def __len__(self):
+        return len(self._snap)
+
+    @property
+    def capacity(self) -> int:
+        return self._ts.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self._ts.nbytes + self._price.nbytes + self._size.nbytes
+
+    def snapshot(self) -> TickSnapshot:
+        """The latest published state; take it once per read so related queries agree with each other."""
+        return self._snap
+
+    def _publish(self):
+        self._snap = TickSnapshot(self._ts, self._price, self._size, self._lo, self._hi, self.retention_ns,
+                                  self.appended, self.generation)
+
+    def _reallocate(self, needed: int):
+        # move live rows into fresh arrays sized for at least `needed` rows
+        n = self._hi - self._lo
+        cap = self.capacity
+        while cap < needed * 2:
+            cap *= 2
+        ts = np.empty(cap, dtype=np.int64)
+        price = np.empty(cap, dtype=np.float64)
+        size = np.empty(cap, dtype=np.float64)
+        ts[:n] = self._ts[self._lo:self._hi]
+        price[:n] = self._price[self._lo:self._hi]
+        size[:n] = self._size[self._lo:self._hi]
+        self._ts, self._price, self._size = ts, price, size
+        self._lo, self._hi = 0, n
+
+    def _reserve(self, extra: int):
+        if self._hi + extra > self.capacity:
+            self._reallocate(self._hi - self._lo + extra)
+
+    def _trim(self):
+        # advance lo past rows older than the retention window (relative to the newest tick);
+        # rows are dropped in batches of ~1/64 of the window so steady-state appends stay O(1)
+        if self.retention_ns is None or self._hi == self._lo:
+            return
+        cutoff = int(self._ts[self._hi - 1]) - self.retention_ns
+        if self._ts[self._lo] >= cutoff - (self.retention_ns >> 6):
+            return
+        self._lo += int(np.searchsorted(self._ts[self._lo:self._hi], cutoff, side="left"))
+
+    def append(self, ts_ns: int, price: float, size: float):
+        with self._write_lock:
+            if self._hi > self._lo and ts_ns < self._ts[self._hi - 1]:
+                self._extend(np.array([ts_ns], dtype=np.int64), np.array([price]), np.array([size]))
+                return
+            if self._hi == self.capacity:
+                self._reallocate(self._hi - self._lo + 1)
+            i = self._hi
+            self._ts[i] = ts_ns
+            self._price[i] = price
+            self._size[i] = size
+            self._hi = i + 1
+            self.appended += 1
+            self._trim()
+            self._publish()
+
+    def extend(self, ts_ns, price, size):
+        """Append a block of ticks; the block need not be sorted nor newer than existing rows."""
+        ts_ns = np.asarray(ts_ns, dtype=np.int64)
+        price = np.asarray(price, dtype=np.float64)
+        size = np.asarray(size, dtype=np.float64)
+        if ts_ns.size == 0:
+            return
+        if ts_ns.size > 1 and np.any(ts_ns[1:] < ts_ns[:-1]):
+            order = np.argsort(ts_ns, kind="stable")
+            ts_ns, price, size = ts_ns[order], price[order], size[order]
+        with self._write_lock:
+            self._extend(ts_ns, price, size)
+
+    def _extend(self, ts_ns, price, size):
+        # sorted block; caller holds the write lock
+        if self._hi == self._lo or ts_ns[0] >= self._ts[self._hi - 1]:
+            self._reserve(ts_ns.size)
+            sl = slice(self._hi, self._hi + ts_ns.size)
+            self._ts[sl] = ts_ns
+            self._price[sl] = price
+            self._size[sl] = size
+            self._hi += ts_ns.size
+            self.appended += ts_ns.size
+        else:
+            # late block: merge into fresh arrays (copy-on-write keeps existing views intact)
+            all_ts = np.concatenate([self._ts[self._lo:self._hi], ts_ns])
+            order = np.argsort(all_ts, kind="stable")
+            n = all_ts.size
+            cap = self.capacity
+            while cap < n * 2:
+                cap *= 2
+            new_ts = np.empty(cap, dtype=np.int64)
+            new_price = np.empty(cap, dtype=np.float64)
+            new_size = np.empty(cap, dtype=np.float64)
+            new_ts[:n] = all_ts[order]
+            new_price[:n] = np.concatenate([self._price[self._lo:self._hi], price])[order]
+            new_size[:n] = np.concatenate([self._size[self._lo:self._hi], size])[order]
+            self._ts, self._price, self._size = new_ts, new_price, new_size
+            self._lo, self._hi = 0, n
+            self.appended += ts_ns.size
+            self.generation += 1
+        self._trim()
+        self._publish()
+
+    # read helpers over the latest snapshot
+
+    def view(self, start_ns=None, end_ns=None):
+        return self._snap.view(start_ns, end_ns)
+
+    def tail(self, n: int):
+        return self._snap.tail(n)
+
+    def first_ts(self):
+        return self._snap.first_ts()
+
+    def last(self):
+        return self._snap.last()
+
+    def to_frame(self, start_ns=None, end_ns=None) -> pd.DataFrame:
+        return self._snap.to_frame(start_ns, end_ns)
+
+
+def empty_tick_frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        {"price": np.empty(0, dtype=np.float64), "size": np.empty(0, dtype=np.float64)},
+        index=pd.DatetimeIndex(np.empty(0, dtype="datetime64[ns]"), name="ts"),
+    )
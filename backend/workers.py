@@ -0,0 +1,129 @@
+# workers.py - bounded worker pool that keeps CPU-heavy analytics off the API event loop
+import asyncio
+import functools
+import os
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+ANALYTICS_WORKERS = max(2, min(4, os.cpu_count() or 1))
+PROCESS_WORKERS = max(1, os.cpu_count() or 1)
+
+
+class WorkerPool:
+    """
+    Runs blocking work (pandas/statsmodels analytics, bar catch-up, serialization) on a fixed set of threads
+    so async handlers only await it. Threads rather than processes: jobs read the zero-copy storage snapshots
+    directly, and the numpy/BLAS/statsmodels kernels doing the heavy lifting release the GIL.
+    At most `workers` jobs run at once; the rest wait in the executor queue (see stats()).
+    """
+
+    def __init__(self, workers: int = ANALYTICS_WORKERS, name: str = "analytics"):
+        self.workers = workers
+        self.name = name
+        self._executor = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.max_wait_ms = 0.0
+        self.busy_s = 0.0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # created on first use (and again after shutdown, e.g. when the app is restarted in-process)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+            return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) executed on a pool thread."""
+        queued = time.perf_counter()
+        with self._lock:
+            self.submitted += 1
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(self._job, queued, fn, args, kwargs))
+
+    def _job(self, queued, fn, args, kwargs):
+        t0 = time.perf_counter()
+        with self._lock:
+            self.running += 1
+            self.max_wait_ms = max(self.max_wait_ms, (t0 - queued) * 1000.0)
+        ok = False
+        try:
+            out = fn(*args, **kwargs)
+            ok = True
+            return out
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.busy_s += time.perf_counter() - t0
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "submitted": self.submitted,
+                "running": self.running,
+                "queued": self.submitted - self.completed - self.failed - self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "max_wait_ms": round(self.max_wait_ms, 3),
+                "busy_s": round(self.busy_s, 3),
+            }
+
+    def shutdown(self):
+        """Wait for running jobs, drop queued ones."""
+        with self._lock:
+            ex, self._executor = self._executor, None
+        if ex is not None:
+            ex.shutdown(wait=True, cancel_futures=True)
+
+
+class ProcessPool:
+    """
+    Process pool for batch jobs that hold the GIL (backtest sweeps across many pairs, pair scans).
+    Arguments and results are pickled, so submit plain arrays/Series and module-level functions, never
+    storage objects. Workers are spawned (not forked: the parent runs threads) on first use.
+    """
+
+    def __init__(self, workers: int = PROCESS_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) executed in a worker process."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def submit(self, fn, *args, **kwargs):
+        """concurrent.futures.Future of fn(*args, **kwargs) in a worker process (cancel() drops it while queued)."""
+        with self._lock:
+            self.submitted += 1
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "started": self._executor is not None, "submitted": self.submitted}
+
+    def shutdown(self):
+        with self._lock:
+            ex, self._executor = self._executor, None
+        if ex is not None:
+            ex.shutdown(wait=True, cancel_futures=True)